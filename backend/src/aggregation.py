@@ -0,0 +1,85 @@
+"""
+Sliding-window emotion aggregation.
+
+`most_frequent_emotion` in the stream results covers the whole run. The rolling
+window keeps per-emotion totals for the last N seconds (or N detection frames)
+instead: each frame is added once and subtracted once when it leaves the
+window, so the dominant emotion is available at any time without rescanning
+stored frames. Counts can be weighted by classifier confidence.
+"""
+
+import time
+import threading
+from collections import deque
+
+
+class RollingEmotionWindow:
+    """Per-emotion totals over the most recent frames, by time or by frame count."""
+
+    def __init__(self, window_seconds=10.0, window_frames=None, weighted=False):
+        """
+        Args:
+            window_seconds: Keep frames added within this many seconds (ignored if window_frames is set)
+            window_frames: Keep the last N frames instead of a time span
+            weighted: Count each face with its confidence instead of 1
+        """
+        if window_frames is None and not window_seconds:
+            raise ValueError("Either window_seconds or window_frames must be set")
+        self.window_seconds = None if window_frames else window_seconds
+        self.window_frames = window_frames
+        self.weighted = weighted
+        self._entries = deque()  # (time, {emotion: weight}) per frame
+        self.totals = {}
+        self.faces = 0
+        self._lock = threading.Lock()
+
+    def add(self, faces, now=None):
+        """Add the face records of one detection frame (an empty list counts as a frame without faces)."""
+        now = time.monotonic() if now is None else now
+        contribution = {}
+        for face in faces:
+            weight = float(face.get('confidence', 0.0)) if self.weighted else 1.0
+            contribution[face['emotion']] = contribution.get(face['emotion'], 0.0) + weight
+        with self._lock:
+            self._entries.append((now, contribution, len(faces)))
+            for emotion, weight in contribution.items():
+                self.totals[emotion] = self.totals.get(emotion, 0.0) + weight
+            self.faces += len(faces)
+            self._evict(now)
+
+    def _evict(self, now):
+        """Drop frames that left the window. Caller holds the lock."""
+        while self._entries and (
+                (self.window_frames is not None and len(self._entries) > self.window_frames) or
+                (self.window_seconds is not None and now - self._entries[0][0] > self.window_seconds)):
+            _, contribution, faces = self._entries.popleft()
+            for emotion, weight in contribution.items():
+                self.totals[emotion] -= weight
+            self.faces -= faces
+        if not self._entries:
+            self.totals.clear()  # no float residue once the window is empty
+
+    def dominant(self, now=None):
+        """Most frequent (or highest weighted) emotion in the window, or None."""
+        return self.snapshot(now)['dominant_emotion']
+
+    def snapshot(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.window_seconds is not None:
+                self._evict(now)
+            totals = {emotion: round(total, 4) for emotion, total in self.totals.items() if total > 1e-9}
+            frames = len(self._entries)
+            faces = self.faces
+        total = sum(totals.values())
+        dominant = max(totals, key=totals.get) if totals else None
+        return {
+            'window_seconds': self.window_seconds,
+            'window_frames': self.window_frames,
+            'weighted': self.weighted,
+            'frames': frames,
+            'faces': faces,
+            'counts': totals,
+            'dominant_emotion': dominant,
+            'dominant_share': totals[dominant] / total if dominant else 0.0,
+        }
@@ -0,0 +1,510 @@
+"""
+Benchmarks and parity checks for the emotion pipeline.
+
+Each subcommand prints a small report, e.g.:
+    python ./backend/src/benchmark.py preprocess --num-crops 500
+
+`parity` is a check rather than a benchmark: it exits non-zero on failure, so it
+can run in CI.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from preprocess import CropPreprocessor, IMAGENET_MEAN, IMAGENET_STD, GRAY_MEAN, GRAY_STD
+
+
+current_path = os.path.abspath(__file__)
+current_dir = os.path.dirname(current_path)
+parent_dir = os.path.dirname(current_dir)
+
+DEFAULT_DATA_DIR = os.path.join(parent_dir, 'dataset', 'FER2013', 'archive')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_image_folder(split_dir, limit_per_class=None):
+    """
+    List (path, class_index) pairs of an ImageFolder-style directory.
+
+    Classes are sorted by name, matching `torchvision.datasets.ImageFolder`.
+
+    Returns:
+        (samples, class_names)
+    """
+    classes = sorted(d for d in os.listdir(split_dir) if os.path.isdir(os.path.join(split_dir, d)))
+    samples = []
+    for label, name in enumerate(classes):
+        class_dir = os.path.join(split_dir, name)
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        if limit_per_class is not None:
+            files = files[:limit_per_class]
+        samples.extend((os.path.join(class_dir, f), label) for f in files)
+    return samples, classes
+
+
+def make_synthetic_crops(data_dir, num_crops, min_size=48, max_size=480, seed=0):
+    """Upscale FER2013 test faces to random sizes to mimic detector crops of real frames."""
+    samples, _ = list_image_folder(os.path.join(data_dir, 'test'))
+    if not samples:
+        raise RuntimeError(f"No images found under {data_dir}/test")
+    rng = np.random.default_rng(seed)
+    crops = []
+    for i in rng.choice(len(samples), size=num_crops):
+        face = cv2.imread(samples[i][0])
+        side = int(rng.integers(min_size, max_size + 1))
+        crops.append(cv2.resize(face, (side, side)))
+    return crops
+
+
+def time_call(fn, repeats=3):
+    """Return the best wall time in seconds of `fn()` over `repeats` runs."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def evaluate_predictor(predictor, samples, batch_size=64):
+    """
+    Top-1 accuracy of a predictor on (path, class_index) samples.
+
+    Returns:
+        (accuracy, predicted class indices in sample order)
+    """
+    predicted = []
+    for start in range(0, len(samples), batch_size):
+        chunk = samples[start:start + batch_size]
+        crops = [cv2.imread(path) for path, _ in chunk]
+        for pred in predictor.predict_batch(crops, max_batch_size=batch_size):
+            emotion = pred['emotion']
+            predicted.append(predictor.classes.index(emotion) if emotion in predictor.classes else -1)
+    correct = sum(int(p == label) for p, (_, label) in zip(predicted, samples))
+    return correct / max(len(samples), 1), predicted
+
+
+def measure_latency(predictor, crops, batch_size=1, warmup=5):
+    """Average milliseconds per face of `predictor.predict_batch` at the given batch size."""
+    for crop in crops[:warmup]:
+        predictor.predict_batch([crop])
+    start = time.perf_counter()
+    for i in range(0, len(crops), batch_size):
+        predictor.predict_batch(crops[i:i + batch_size], max_batch_size=batch_size)
+    return (time.perf_counter() - start) * 1000 / max(len(crops), 1)
+
+
+def bench_preprocess(args):
+    """Parity and per-face timing of CropPreprocessor against the torchvision transform."""
+    import torch
+    from torchvision import transforms
+
+    legacy = transforms.Compose([
+        transforms.ToPILImage(),
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+    preprocess = CropPreprocessor(size=(224, 224), max_batch_size=args.batch_size)
+    crops = make_synthetic_crops(args.data_dir, args.num_crops)
+
+    # Parity: per-pixel difference in normalized units
+    max_diff = 0.0
+    mean_diffs = []
+    for crop in crops:
+        expected = legacy(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)).numpy()
+        actual = preprocess([crop])[0]
+        diff = np.abs(expected - actual)
+        max_diff = max(max_diff, float(diff.max()))
+        mean_diffs.append(float(diff.mean()))
+    mean_diff = float(np.mean(mean_diffs))
+
+    def run_legacy():
+        torch.stack([legacy(cv2.cvtColor(c, cv2.COLOR_BGR2RGB)) for c in crops])
+
+    def run_single():
+        for c in crops:
+            preprocess([c])
+
+    def run_batched():
+        for start in range(0, len(crops), args.batch_size):
+            preprocess(crops[start:start + args.batch_size])
+
+    n = len(crops)
+    print(f"[INFO] Preprocessing {n} crops ({args.batch_size} per batch)")
+    print(f"{'path':<24}{'ms/face':>10}")
+    for name, fn in (('torchvision (PIL)', run_legacy),
+                     ('numpy, batch 1', run_single),
+                     (f'numpy, batch {args.batch_size}', run_batched)):
+        print(f"{name:<24}{time_call(fn, args.repeats) * 1000 / n:>10.3f}")
+    print(f"[INFO] Parity vs torchvision: mean abs diff {mean_diff:.4f}, max abs diff {max_diff:.4f}")
+
+    if mean_diff > args.tolerance:
+        print(f"[ERROR] Mean difference exceeds tolerance {args.tolerance}")
+        return 1
+    return 0
+
+
+def reference_preprocess(crop, size=(224, 224), mean=IMAGENET_MEAN, std=IMAGENET_STD, channels=3):
+    """The legacy ToPILImage -> Resize -> ToTensor -> Normalize chain on one BGR crop, without torch.
+
+    torchvision's Resize on a PIL image is PIL's antialiased bilinear resize, so this
+    is the same computation and lets the parity check run where torch is not installed.
+    """
+    from PIL import Image
+
+    image = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)).resize(tuple(size), Image.BILINEAR)
+    if channels == 1:
+        image = image.convert('L')
+    pixels = np.asarray(image, dtype=np.float32).reshape(size[1], size[0], channels).transpose(2, 0, 1) / 255.0
+    mean = np.asarray(mean, dtype=np.float32).reshape(-1, 1, 1)
+    std = np.asarray(std, dtype=np.float32).reshape(-1, 1, 1)
+    return (pixels - mean) / std
+
+
+def check_parity(args):
+    """Fail if any crop differs from the reference transform by more than the tolerances."""
+    mean, std = (IMAGENET_MEAN, IMAGENET_STD) if args.channels == 3 else (GRAY_MEAN, GRAY_STD)
+    size = (args.img_size, args.img_size)
+    preprocess = CropPreprocessor(size=size, mean=mean, std=std, channels=args.channels)
+    crops = make_synthetic_crops(args.data_dir, args.num_crops, min_size=args.min_crop, max_size=args.max_crop)
+
+    failures = 0
+    worst = 0.0
+    for i, crop in enumerate(crops):
+        expected = reference_preprocess(crop, size, mean, std, channels=args.channels)
+        diff = np.abs(expected - preprocess([crop])[0])
+        max_diff, mean_diff = float(diff.max()), float(diff.mean())
+        worst = max(worst, max_diff)
+        if max_diff > args.max_abs_tol or mean_diff > args.mean_abs_tol:
+            failures += 1
+            print(f"[ERROR] Crop {i} ({crop.shape[1]}x{crop.shape[0]}): max abs diff {max_diff:.4f}, "
+                  f"mean abs diff {mean_diff:.4f}")
+
+    print(f"[INFO] {len(crops)} crops -> {args.img_size}x{args.img_size}x{args.channels}, worst max abs diff "
+          f"{worst:.4f} (tolerance {args.max_abs_tol}), {failures} failed")
+    return 1 if failures else 0
+
+
+def iter_frames(source, max_frames=None):
+    """Yield frames from a video file, webcam id or directory of images."""
+    count = 0
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if max_frames is not None and count >= max_frames:
+                return
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(source, name))
+                if frame is not None:
+                    count += 1
+                    yield frame
+        return
+    cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if not cap.isOpened():
+        raise RuntimeError(f"Failed to open source: {source}")
+    while max_frames is None or count < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        count += 1
+        yield frame
+    cap.release()
+
+
+def match_boxes(reference, candidate, iou_threshold=0.5):
+    """Greedy one-to-one matching; returns the number of reference boxes matched."""
+    from tracking import box_iou
+
+    unmatched = [tuple(c) for c in candidate]
+    matched = 0
+    for ref in reference:
+        best, best_iou = None, iou_threshold
+        for c in unmatched:
+            iou = box_iou(ref, c)
+            if iou >= best_iou:
+                best, best_iou = c, iou
+        if best is not None:
+            unmatched.remove(best)
+            matched += 1
+    return matched
+
+
+def bench_detect(args):
+    """Per-frame detection time and recall of downscaled detection against full resolution."""
+    from face_detection import OpenCVFaceDetector
+
+    frames = list(iter_frames(args.source, args.max_frames))
+    if not frames:
+        raise RuntimeError(f"No frames read from {args.source}")
+    height, width = frames[0].shape[:2]
+
+    configs = [None] + list(args.detect_min_size)
+    detections = {}
+    timings = {}
+    for detect_min_size in configs:
+        detector = OpenCVFaceDetector(cascade_path=args.cascade, min_neighbors=args.min_neighbors,
+                                      min_size=tuple(args.min_size), detect_min_size=detect_min_size)
+        boxes = []
+        start = time.perf_counter()
+        for frame in frames:
+            boxes.append([tuple(int(v) for v in b) for b in detector.detect_faces(frame)])
+        timings[detect_min_size] = (time.perf_counter() - start) * 1000 / len(frames)
+        detections[detect_min_size] = boxes
+
+    reference = detections[None]
+    total_ref = sum(len(b) for b in reference)
+    print(f"[INFO] {len(frames)} frames at {width}x{height}, min size {args.min_size[0]}x{args.min_size[1]}, "
+          f"{total_ref} reference faces")
+    print(f"{'mode':<22}{'scale':>8}{'ms/frame':>10}{'speedup':>9}{'recall':>8}{'precision':>11}")
+    for detect_min_size in configs:
+        boxes = detections[detect_min_size]
+        matched = sum(match_boxes(ref, cand, args.iou) for ref, cand in zip(reference, boxes))
+        found = sum(len(b) for b in boxes)
+        recall = matched / total_ref if total_ref else 1.0
+        precision = matched / found if found else 1.0
+        scale = min(1.0, detect_min_size / min(args.min_size)) if detect_min_size else 1.0
+        name = 'full resolution' if detect_min_size is None else f"detect-min-size {detect_min_size}"
+        print(f"{name:<22}{scale:>8.3f}{timings[detect_min_size]:>10.2f}"
+              f"{timings[None] / timings[detect_min_size]:>9.2f}{recall:>8.3f}{precision:>11.3f}")
+    return 0
+
+
+def bench_pipeline(args):
+    """Frames/sec of the stream pipeline for each detect_workers x classify_workers combination."""
+    from capture import CapturedFrame
+    from face_detection import OpenCVFaceDetector
+    from inference import create_predictor
+    from pipeline import StreamPipeline, extract_face_crops
+
+    # Frames are decoded up front so the table shows detection/classification scaling only
+    frames = list(iter_frames(args.source, args.max_frames))
+    if not frames:
+        raise RuntimeError(f"No frames read from {args.source}")
+    predictor = create_predictor(args.model, backend=args.backend)
+
+    def make_detector():
+        return OpenCVFaceDetector(cascade_path=args.cascade, min_neighbors=args.min_neighbors,
+                                  min_size=tuple(args.min_size), detect_min_size=args.detect_min_size)
+
+    def make_reader():
+        it = iter(enumerate(frames))
+
+        def read_frame():
+            item = next(it, None)
+            return None if item is None else CapturedFrame(item[0], time.monotonic(), item[1].copy())
+        return read_frame
+
+    def run_serial():
+        detector = make_detector()
+        for i, frame in enumerate(frames):
+            if i % args.interval == 0:
+                crops = extract_face_crops(frame, detector.detect_faces(frame))
+                predictor.predict_batch([cv2.resize(crop, (48, 48)) for _, _, crop in crops])
+        return None
+
+    def run_pipeline(detect_workers, classify_workers):
+        pipeline = StreamPipeline(make_reader(), make_detector, predictor, interval=args.interval,
+                                  detect_workers=detect_workers, classify_workers=classify_workers).start()
+        for _ in pipeline:
+            pass
+        pipeline.stop()
+        return pipeline.stats()['latency_ms_mean']
+
+    configs = [(0, 0)] + [(d, c) for d in args.detect_workers for c in args.classify_workers]
+    rows = []
+    for detect_workers, classify_workers in configs:
+        start = time.perf_counter()
+        latency = run_serial() if detect_workers == 0 else run_pipeline(detect_workers, classify_workers)
+        rows.append((detect_workers, classify_workers, len(frames) / (time.perf_counter() - start), latency))
+
+    height, width = frames[0].shape[:2]
+    print(f"[INFO] {len(frames)} frames at {width}x{height}, interval {args.interval}, {os.cpu_count()} CPU cores")
+    print(f"{'detect':>8}{'classify':>10}{'fps':>10}{'speedup':>9}{'latency ms':>12}")
+    baseline = rows[0][2]
+    for detect_workers, classify_workers, fps, latency in rows:
+        name = ('serial', '-') if detect_workers == 0 else (detect_workers, classify_workers)
+        latency = '-' if latency is None else f"{latency:.1f}"
+        print(f"{name[0]:>8}{name[1]:>10}{fps:>10.1f}{fps / baseline:>9.2f}{latency:>12}")
+    return 0
+
+
+def bench_zoo(args):
+    """Top-1 accuracy vs CPU latency per architecture, with latency-aware model selection."""
+    import tempfile
+    import torch
+    from model.model import get_model, get_input_spec, make_input_spec, default_stem, DEFAULT_IMG_SIZE
+    from inference import EmotionPredictor
+
+    samples, _ = list_image_folder(os.path.join(args.data_dir, 'test'), limit_per_class=args.limit_per_class)
+    crops = make_synthetic_crops(args.data_dir, args.num_crops)
+
+    # Trained checkpoints get accuracy; bare architectures only latency (random weights)
+    entries = [(path, True) for path in args.checkpoints]
+    tmp_dir = tempfile.mkdtemp()
+    for arch in args.archs:
+        path = os.path.join(tmp_dir, f"{arch}.pth")
+        img_size = args.img_size or DEFAULT_IMG_SIZE[arch]
+        stem = default_stem(img_size, args.channels)
+        torch.save({
+            'model_state_dict': get_model(pretrained=False, arch=arch, in_channels=args.channels,
+                                          stem=stem).state_dict(),
+            'num_classes': 7,
+            'arch': arch,
+            'stem': stem,
+            'input_spec': make_input_spec(arch, img_size, channels=args.channels),
+        }, path)
+        entries.append((path, False))
+
+    rows = []
+    for path, evaluate in entries:
+        predictor = EmotionPredictor(path, device='cpu')
+        spec = get_input_spec(predictor.checkpoint)
+        rows.append({
+            'model': os.path.basename(path) if evaluate else '(untrained)',
+            'arch': predictor.checkpoint.get('arch', 'resnet18'),
+            'input': f"{spec['size']}x{spec['size']}x{spec['channels']}",
+            'params_m': sum(p.numel() for p in predictor.model.parameters()) / 1e6,
+            'top1': evaluate_predictor(predictor, samples)[0] if evaluate else None,
+            'ms_per_face': measure_latency(predictor, crops, batch_size=1),
+            'epoch_s': predictor.checkpoint.get('epoch_time'),
+        })
+
+    print(f"[INFO] CPU threads: {torch.get_num_threads()}, test images: {len(samples)}")
+    print(f"{'model':<24}{'arch':<20}{'input':<12}{'params M':>10}{'top-1':>8}{'ms/face':>10}{'s/epoch':>10}")
+    for row in rows:
+        top1 = f"{row['top1']:.4f}" if row['top1'] is not None else '-'
+        epoch_s = f"{row['epoch_s']:.1f}" if row['epoch_s'] is not None else '-'
+        print(f"{row['model']:<24}{row['arch']:<20}{row['input']:<12}{row['params_m']:>10.2f}{top1:>8}"
+              f"{row['ms_per_face']:>10.3f}{epoch_s:>10}")
+
+    if args.max_latency_ms is not None:
+        candidates = [r for r in rows if r['top1'] is not None and r['ms_per_face'] <= args.max_latency_ms]
+        if not candidates:
+            print(f"[WARN] No trained checkpoint meets {args.max_latency_ms} ms/face")
+            return 1
+        best = max(candidates, key=lambda r: r['top1'])
+        print(f"[INFO] Selected {best['model']} ({best['arch']}): top-1 {best['top1']:.4f} "
+              f"at {best['ms_per_face']:.3f} ms/face (budget {args.max_latency_ms} ms)")
+    return 0
+
+
+def bench_augment(args):
+    """Training-loader throughput of per-sample PIL transforms vs batch-level augmentation."""
+    import torch
+    from model.data import get_dataloaders
+
+    print(f"[INFO] {args.data_format} data, {args.img_size}x{args.img_size}, batch {args.batch_size}, "
+          f"{args.batches} batches, augmentation on {args.device}")
+    print(f"{'augment':<10}{'workers':>8}{'samples/s':>12}")
+    for workers in args.num_workers:
+        for mode in ('sample', 'batch'):
+            train_loader, _, _ = get_dataloaders(args.data_dir, batch_size=args.batch_size, img_size=args.img_size,
+                                                 num_workers=workers, data_format=args.data_format,
+                                                 augment=mode, device=args.device)
+            iterator = iter(train_loader)
+            next(iterator)  # worker startup is not part of the steady-state rate
+            samples = 0
+            start = time.perf_counter()
+            for _ in range(args.batches):
+                try:
+                    images, _ = next(iterator)
+                except StopIteration:
+                    break
+                images = images.to(args.device)
+                samples += images.size(0)
+            if args.device.startswith('cuda'):
+                torch.cuda.synchronize()
+            elapsed = time.perf_counter() - start
+            print(f"{mode:<10}{workers:>8}{samples / elapsed:>12.0f}")
+            del iterator
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks and parity checks for the emotion pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('preprocess', help='Crop preprocessing parity and per-face time')
+    p.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='FER2013 archive directory (with test/)')
+    p.add_argument('--num-crops', type=int, default=256)
+    p.add_argument('--batch-size', type=int, default=16)
+    p.add_argument('--repeats', type=int, default=3)
+    p.add_argument('--tolerance', type=float, default=0.02,
+                   help='Max allowed mean abs difference (normalized units) against torchvision')
+    p.set_defaults(func=bench_preprocess)
+
+    p = subparsers.add_parser('parity', help='Check CropPreprocessor against the torchvision transform (exit code 1 on failure)')
+    p.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='FER2013 archive directory (with test/)')
+    p.add_argument('--num-crops', type=int, default=256)
+    p.add_argument('--img-size', type=int, default=224)
+    p.add_argument('--channels', type=int, default=3, choices=(1, 3))
+    p.add_argument('--min-crop', type=int, default=48, help='Smallest synthetic crop side')
+    p.add_argument('--max-crop', type=int, default=480, help='Largest synthetic crop side')
+    # OpenCV INTER_AREA vs PIL's antialiased filter: ~0.07 max / 0.003 mean at 224x224,
+    # growing with the downscale factor (~0.3 / 0.02 at 48x48)
+    p.add_argument('--max-abs-tol', type=float, default=0.15,
+                   help='Max allowed per-pixel abs difference of a crop (normalized units)')
+    p.add_argument('--mean-abs-tol', type=float, default=0.01,
+                   help='Max allowed mean abs difference of a crop (normalized units)')
+    p.set_defaults(func=check_parity)
+
+    p = subparsers.add_parser('detect', help='Downscaled vs full-resolution face detection time and recall')
+    p.add_argument('--source', required=True, help='Video file, webcam id or directory of images')
+    p.add_argument('--max-frames', type=int, default=200)
+    p.add_argument('--cascade', default=None, help='Path to Haar Cascade XML file')
+    p.add_argument('--min-neighbors', type=int, default=10)
+    p.add_argument('--min-size', type=int, nargs=2, default=[300, 300], help='Minimum face size (width height)')
+    p.add_argument('--detect-min-size', type=int, nargs='+', default=[40, 60, 80],
+                   help='Working face sizes to compare against full resolution')
+    p.add_argument('--iou', type=float, default=0.5, help='IoU threshold for a matched face')
+    p.set_defaults(func=bench_detect)
+
+    p = subparsers.add_parser('pipeline', help='Stream pipeline fps vs detect/classify worker counts')
+    p.add_argument('--source', required=True, help='Video file, webcam id or directory of images')
+    p.add_argument('--model', default=os.path.join(parent_dir, 'checkpoints', 'best.pth'), help='Emotion model')
+    p.add_argument('--backend', default='torch', choices=('torch', 'onnxruntime', 'opencv'))
+    p.add_argument('--max-frames', type=int, default=200)
+    p.add_argument('--interval', type=int, default=1, help='Detect every Nth frame')
+    p.add_argument('--detect-workers', type=int, nargs='+', default=[1, 2, 4])
+    p.add_argument('--classify-workers', type=int, nargs='+', default=[1, 2])
+    p.add_argument('--cascade', default=None, help='Path to Haar Cascade XML file')
+    p.add_argument('--min-neighbors', type=int, default=10)
+    p.add_argument('--min-size', type=int, nargs=2, default=[300, 300], help='Minimum face size (width height)')
+    p.add_argument('--detect-min-size', type=int, default=None, help='Downscaled detection (see face_detection.py)')
+    p.set_defaults(func=bench_pipeline)
+
+    p = subparsers.add_parser('zoo', help='Accuracy vs CPU latency per model architecture')
+    p.add_argument('--checkpoints', nargs='*', default=[], help='Trained checkpoints to evaluate')
+    p.add_argument('--archs', nargs='*', default=[],
+                   help='Architectures to time with random weights (no accuracy)')
+    p.add_argument('--max-latency-ms', type=float, default=None,
+                   help='Pick the most accurate checkpoint within this per-face latency budget')
+    p.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='FER2013 archive directory (with test/)')
+    p.add_argument('--limit-per-class', type=int, default=None,
+                   help='Only evaluate the first N test images of each class')
+    p.add_argument('--num-crops', type=int, default=200, help='Crops used for latency measurement')
+    p.add_argument('--channels', type=int, default=3, choices=(1, 3), help='Input channels of the --archs models')
+    p.add_argument('--img-size', type=int, default=None, help='Input size of the --archs models (default: per architecture)')
+    p.set_defaults(func=bench_zoo)
+
+    p = subparsers.add_parser('augment', help='Training loader samples/sec: per-sample vs batch augmentation')
+    p.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='FER2013 archive directory (with train/)')
+    p.add_argument('--data-format', default='folder', choices=('folder', 'memmap'))
+    p.add_argument('--img-size', type=int, default=224)
+    p.add_argument('--batch-size', type=int, default=64)
+    p.add_argument('--batches', type=int, default=50, help='Batches timed per configuration')
+    p.add_argument('--num-workers', type=int, nargs='+', default=[0, 2, 4])
+    p.add_argument('--device', default='cpu', help='Device the batch augmentation runs on')
+    p.set_defaults(func=bench_augment)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Frame capture on a background thread.
+
+`cap.read()` in the processing loop lets frames queue up in the decoder whenever
+inference is slower than the camera, so latency grows without bound. FrameCapture
+reads continuously into a small buffer instead: for live sources (webcam, RTSP,
+HTTP) the oldest frame is dropped when the buffer is full, so the consumer always
+gets a recent frame; for video files the reader waits, so no frame is lost.
+"""
+
+import time
+import threading
+from collections import deque
+
+import cv2
+
+
+def parse_source(source):
+    """Webcam ids are passed to OpenCV as integers, everything else as-is."""
+    return int(source) if str(source).isdigit() else source
+
+
+def is_live_source(source):
+    """True for webcams and network streams, False for video files."""
+    source = str(source)
+    return source.isdigit() or source.lower().startswith(('rtsp://', 'rtmp://', 'http://', 'https://'))
+
+
+def open_capture(source, width=640, height=480):
+    """Open a cv2.VideoCapture with a minimal decoder buffer. Raises RuntimeError on failure."""
+    cap = cv2.VideoCapture(parse_source(source))
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 最小缓冲
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if not cap.isOpened():
+        raise RuntimeError(f"Failed to open source: {source}")
+    return cap
+
+
+class CapturedFrame:
+    """A frame with its capture sequence number and capture time (time.monotonic)."""
+
+    __slots__ = ('index', 'captured_at', 'frame')
+
+    def __init__(self, index, captured_at, frame):
+        self.index = index
+        self.captured_at = captured_at
+        self.frame = frame
+
+
+class FrameCapture:
+    """Read a source on its own thread into a bounded buffer."""
+
+    def __init__(self, source, buffer_size=1, drop_oldest=None, reconnect_delay=1.0, max_failures=10):
+        """
+        Args:
+            source: Webcam id, video file or stream URL
+            buffer_size: Frames kept for the consumer (1 = latest frame only)
+            drop_oldest: Drop the oldest frame when full (default: True for live sources)
+            reconnect_delay: Seconds to wait before reopening a failed live source
+            max_failures: Consecutive failed reads/reconnects before giving up
+        """
+        self.source = source
+        self.live = is_live_source(source)
+        self.drop_oldest = self.live if drop_oldest is None else drop_oldest
+        self.reconnect_delay = reconnect_delay
+        self.max_failures = max_failures
+
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._finished = False
+        self._thread = None
+        self._cap = open_capture(source)
+
+        self.captured = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self._latency_count = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='frame-capture', daemon=True)
+        self._thread.start()
+        return self
+
+    def _reconnect(self):
+        """Reopen a live source (same policy as face_detection.detect_from_rtsp)."""
+        print('[WARN] Failed to read frame, reconnecting...')
+        self._cap.release()
+        time.sleep(self.reconnect_delay)
+        self._cap = cv2.VideoCapture(parse_source(self.source))
+        self.reconnects += 1
+
+    def _run(self):
+        failures = 0
+        while not self._stopped:
+            ret, frame = self._cap.read()
+            if not ret:
+                failures += 1
+                if not self.live or failures >= self.max_failures:
+                    if self.live:
+                        print('[ERROR] Maximum consecutive frame read failures reached, stopping')
+                    break
+                self._reconnect()
+                continue
+            failures = 0
+
+            item = CapturedFrame(self.captured, time.monotonic(), frame)
+            self.captured += 1
+            with self._cond:
+                if len(self._buffer) == self._buffer.maxlen:
+                    if self.drop_oldest:
+                        self.dropped += 1  # deque(maxlen) discards the oldest on append
+                    else:
+                        self._cond.wait_for(lambda: len(self._buffer) < self._buffer.maxlen or self._stopped)
+                        if self._stopped:
+                            break
+                self._buffer.append(item)
+                self._cond.notify_all()
+
+        self._cap.release()
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def read(self, timeout=None):
+        """
+        Return the next buffered CapturedFrame, waiting for one if necessary.
+
+        Returns:
+            CapturedFrame, or None once the source has ended (or on timeout)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._buffer or self._finished, timeout=timeout)
+            if not self._buffer:
+                return None
+            item = self._buffer.popleft()
+            self._cond.notify_all()
+            return item
+
+    @property
+    def finished(self):
+        """True once the source ended or capture was stopped and the buffer is empty."""
+        with self._cond:
+            return self._finished and not self._buffer
+
+    def record_result(self, item):
+        """Record the capture-to-result latency of a frame whose processing finished."""
+        latency = time.monotonic() - item.captured_at
+        self._latency_count += 1
+        self._latency_total += latency
+        self._latency_max = max(self._latency_max, latency)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        count = self._latency_count
+        return {
+            'captured': self.captured,
+            'dropped': self.dropped,
+            'reconnects': self.reconnects,
+            'latency_ms_mean': 1000.0 * self._latency_total / count if count else 0.0,
+            'latency_ms_max': 1000.0 * self._latency_max,
+        }
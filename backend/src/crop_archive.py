@@ -0,0 +1,268 @@
+"""
+Packed, append-only archive for face crops.
+
+Saving every crop as its own JPEG produces millions of tiny files on long
+multi-camera runs. An archive directory holds instead:
+
+    meta.json        crop shape and shard size
+    shard_00000.u8   raw uint8 crops (crop_size x crop_size x 3, BGR) back to back
+    shard_00001.u8   ...
+    index.jsonl      one line per crop: shard, offset, source, frame, bbox,
+                     emotion, confidence, timestamp
+
+Crops are resized to a fixed `crop_size`, so record i of a shard starts at
+byte i * crop_bytes and shards can be memory-mapped for reading. Near-duplicate
+crops (a static face over consecutive frames) are skipped by comparing a 64-bit
+difference hash against the recent crops of the same source.
+"""
+
+import os
+import json
+import threading
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+
+CROP_FORMATS = ('jpg', 'archive')
+
+META_FILE = 'meta.json'
+INDEX_FILE = 'index.jsonl'
+
+
+def shard_path(archive_dir, shard):
+    return os.path.join(archive_dir, f"shard_{shard:05d}.u8")
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 grayscale thumbnail."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _read_index(archive_dir):
+    """Index records of an archive; a truncated last line (crash) is skipped."""
+    path = os.path.join(archive_dir, INDEX_FILE)
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"[WARN] Skipping incomplete record in {path}")
+    return records
+
+
+def _trim_partial_line(path):
+    """Cut a trailing line without newline (interrupted write) so appends start on a fresh line."""
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            chunk = f.read(end - start)
+            pos = chunk.rfind(b'\n')
+            if pos >= 0:
+                end = start + pos + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+
+
+class CropArchiveWriter:
+    """Append crops and their metadata to a crop archive directory."""
+
+    def __init__(self, archive_dir, crop_size=48, shard_records=50000, dedup_distance=4, dedup_history=32,
+                 flush_every=64):
+        """
+        Args:
+            archive_dir: Archive directory; an existing archive is appended to
+            crop_size: Side length crops are resized to (fixed for the whole archive)
+            shard_records: Crops per shard file
+            dedup_distance: Skip crops whose dHash is within this Hamming distance of a
+                recent crop of the same source (negative = keep everything)
+            dedup_history: Recent hashes kept per source
+            flush_every: Crops buffered before the shard and index files are flushed
+        """
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+        meta_path = os.path.join(archive_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            crop_size, shard_records = meta['crop_size'], meta['shard_records']
+        else:
+            meta = {'crop_size': crop_size, 'channels': 3, 'dtype': 'uint8', 'color': 'bgr',
+                    'shard_records': shard_records}
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f, indent=2)
+        self.crop_size = crop_size
+        self.shard_records = shard_records
+        self.crop_bytes = crop_size * crop_size * 3
+        self.dedup_distance = dedup_distance
+        self.dedup_history = dedup_history
+        self.flush_every = flush_every
+        self._hashes = {}  # source -> deque of recent hashes
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Continue after the last indexed crop; pixels written without an index line
+        # (interrupted run) are cut off so offsets stay aligned with the index
+        index_path = os.path.join(archive_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            _trim_partial_line(index_path)
+        records = _read_index(archive_dir)
+        self.records = len(records)
+        if records:
+            self.shard, self.offset = records[-1]['shard'], records[-1]['offset'] + 1
+        else:
+            self.shard, self.offset = 0, 0
+        if self.offset >= self.shard_records:
+            self.shard, self.offset = self.shard + 1, 0
+        path = shard_path(archive_dir, self.shard)
+        if os.path.exists(path) and os.path.getsize(path) > self.offset * self.crop_bytes:
+            os.truncate(path, self.offset * self.crop_bytes)
+
+        self._shard_file = open(path, 'ab')
+        self._index_file = open(index_path, 'a', encoding='utf-8')
+        self.written = 0
+        self.duplicates = 0
+
+    def _is_duplicate(self, source, image_hash):
+        recent = self._hashes.setdefault(source, deque(maxlen=self.dedup_history))
+        duplicate = any(hamming(image_hash, h) <= self.dedup_distance for h in recent)
+        if not duplicate:
+            recent.append(image_hash)
+        return duplicate
+
+    def append(self, crop, source=None, frame=None, bbox=None, emotion=None, confidence=None, timestamp=None):
+        """
+        Add one crop (BGR, any size).
+
+        Returns:
+            Index of the crop in the archive, or None if it was skipped as a near-duplicate
+        """
+        if crop.size == 0:
+            return None
+        if crop.shape[:2] != (self.crop_size, self.crop_size):
+            crop = cv2.resize(crop, (self.crop_size, self.crop_size), interpolation=cv2.INTER_AREA)
+        if crop.ndim == 2:
+            crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+        image_hash = dhash(crop)
+        record = {
+            'source': source,
+            'frame': frame,
+            'bbox': [int(v) for v in bbox] if bbox is not None else None,
+            'emotion': emotion,
+            'confidence': confidence,
+            'timestamp': timestamp or datetime.now().isoformat(),
+            'dhash': f"{image_hash:016x}",
+        }
+        with self._lock:
+            if self.dedup_distance >= 0 and self._is_duplicate(source, image_hash):
+                self.duplicates += 1
+                return None
+            if self.offset >= self.shard_records:
+                self._shard_file.close()
+                self.shard, self.offset = self.shard + 1, 0
+                self._shard_file = open(shard_path(self.archive_dir, self.shard), 'ab')
+            # The shard is flushed before the index; readers also skip index lines past a shard's end
+            self._shard_file.write(np.ascontiguousarray(crop, dtype=np.uint8).tobytes())
+            self._index_file.write(json.dumps({'shard': self.shard, 'offset': self.offset, **record},
+                                              separators=(',', ':'), ensure_ascii=False) + '\n')
+            self.offset += 1
+            self.records += 1
+            self.written += 1
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._flush()
+            return self.records - 1
+
+    def _flush(self):
+        self._shard_file.flush()
+        self._index_file.flush()
+        self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._shard_file.closed:
+                return
+            self._flush()
+            self._shard_file.close()
+            self._index_file.close()
+
+    def stats(self):
+        return {
+            'archive_dir': self.archive_dir,
+            'records': self.records,
+            'written': self.written,
+            'duplicates': self.duplicates,
+            'shards': self.shard + 1,
+        }
+
+
+class CropArchive:
+    """Read-only view of a crop archive; shards are memory-mapped on first access."""
+
+    def __init__(self, archive_dir):
+        meta_path = os.path.join(archive_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            raise RuntimeError(f"Not a crop archive: {archive_dir}")
+        with open(meta_path, 'r') as f:
+            self.meta = json.load(f)
+        self.archive_dir = archive_dir
+        self.crop_size = self.meta['crop_size']
+        self.crop_bytes = self.crop_size * self.crop_size * 3
+        self._shards = {}
+        # Index lines whose pixels never reached the shard (crash) are ignored
+        sizes = {}
+        self.records = []
+        for record in _read_index(archive_dir):
+            shard = record['shard']
+            if shard not in sizes:
+                path = shard_path(archive_dir, shard)
+                sizes[shard] = os.path.getsize(path) // self.crop_bytes if os.path.exists(path) else 0
+            if record['offset'] < sizes[shard]:
+                self.records.append(record)
+        self._sizes = sizes
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getstate__(self):
+        # DataLoader workers map the shards themselves instead of receiving copies
+        state = dict(self.__dict__)
+        state['_shards'] = {}
+        return state
+
+    def _shard(self, shard):
+        array = self._shards.get(shard)
+        if array is None:
+            array = np.memmap(shard_path(self.archive_dir, shard), dtype=np.uint8, mode='r',
+                              shape=(self._sizes[shard], self.crop_size, self.crop_size, 3))
+            self._shards[shard] = array
+        return array
+
+    def image(self, i):
+        """Crop i as a (crop_size, crop_size, 3) BGR array."""
+        record = self.records[i]
+        return np.asarray(self._shard(record['shard'])[record['offset']])
+
+    def __getitem__(self, i):
+        return self.image(i), self.records[i]
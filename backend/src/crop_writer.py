@@ -0,0 +1,141 @@
+"""
+Background writer for face crop images.
+
+JPEG encoding and file writes happen on worker threads (cv2.imencode releases
+the GIL), so `--save-crops` no longer stalls detection and inference. Crops are
+handed over through a bounded queue; when it is full the overflow policy
+decides whether the producer waits ('block'), the new crop is discarded
+('drop_newest') or the oldest queued crop is discarded ('drop_oldest').
+"""
+
+import os
+import threading
+from collections import deque
+
+import cv2
+
+
+OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+
+class AsyncCropWriter:
+    """Encode and write crop images off the calling thread."""
+
+    def __init__(self, workers=2, max_queue=256, policy='drop_oldest', jpeg_quality=95):
+        """
+        Args:
+            workers: Writer threads
+            max_queue: Crops waiting to be written before the overflow policy applies
+            policy: 'block', 'drop_newest' or 'drop_oldest'
+            jpeg_quality: cv2.IMWRITE_JPEG_QUALITY for .jpg paths
+        """
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.policy = policy
+        self.max_queue = max_queue
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._active = 0
+        self._dirs = set()  # directories already created
+        self._dirs_lock = threading.Lock()
+
+        self.submitted = 0
+        self.written = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+
+        self._threads = [threading.Thread(target=self._run, name=f"crop-writer-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, path, image):
+        """
+        Queue `image` to be written to `path`. The image is copied, so the caller may
+        keep drawing on the frame it came from.
+
+        Returns:
+            False if the crop was dropped by the overflow policy
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Crop writer is closed")
+            self.submitted += 1
+            if len(self._queue) >= self.max_queue:
+                if self.policy == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                if self.policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    self._cond.wait_for(lambda: len(self._queue) < self.max_queue)
+            self._queue.append((path, image.copy()))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify_all()
+        return True
+
+    def _ensure_dir(self, directory):
+        if directory in self._dirs:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with self._dirs_lock:
+            self._dirs.add(directory)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                path, image = self._queue.popleft()
+                self._active += 1
+                self._cond.notify_all()
+            try:
+                ok, encoded = cv2.imencode(os.path.splitext(path)[1] or '.jpg', image, self.params)
+                if not ok:
+                    raise RuntimeError(f"Failed to encode {path}")
+                self._ensure_dir(os.path.dirname(path))
+                with open(path, 'wb') as f:
+                    f.write(encoded.tobytes())
+                with self._cond:
+                    self.written += 1
+                    self.bytes_written += encoded.nbytes
+            except Exception as e:
+                with self._cond:
+                    self.errors += 1
+                print(f"[WARN] Failed to write crop {path}: {e}")
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self._cond.notify_all()
+
+    def flush(self):
+        """Wait until every queued crop has been written."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._queue and self._active == 0)
+
+    def close(self):
+        """Write the remaining crops and stop the workers."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'policy': self.policy,
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self.max_depth,
+                'submitted': self.submitted,
+                'written': self.written,
+                'bytes_written': self.bytes_written,
+                'dropped': self.dropped,
+                'errors': self.errors,
+            }
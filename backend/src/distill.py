@@ -0,0 +1,244 @@
+"""
+Knowledge distillation from a trained emotion checkpoint (e.g. ResNet18 best.pth)
+into a small student network.
+
+The student is trained on FER2013 with a mix of the teacher's softened outputs
+(KL divergence at temperature T) and the hard labels (cross entropy). Both see
+the same augmented batch: the student's input is converted to the teacher's input
+spec (channels, resolution, normalization) on the fly. The student checkpoint has
+the format of train.py, so `EmotionPredictor` loads it like any other model. At the
+end, top-1 accuracy and CPU latency of teacher and student are reported.
+"""
+
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+from tqdm import tqdm
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.optim import lr_scheduler
+
+from model.model import (get_model, load_checkpoint, get_input_spec, make_input_spec, default_stem,
+                         ARCHITECTURES, DEFAULT_IMG_SIZE, STEMS)
+from model.data import get_dataloaders, DATA_FORMATS, AUGMENT_MODES
+from train import accuracy, validate, save_checkpoint
+from inference import EmotionPredictor
+from benchmark import DEFAULT_DATA_DIR, list_image_folder, evaluate_predictor, measure_latency, make_synthetic_crops
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature=4.0, alpha=0.7):
+    """alpha * T^2 * KL(teacher_T || student_T) + (1 - alpha) * CE(student, labels)."""
+    soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=1),
+                    F.softmax(teacher_logits / temperature, dim=1),
+                    reduction='batchmean') * temperature ** 2
+    hard = F.cross_entropy(student_logits, labels)
+    return alpha * soft + (1 - alpha) * hard
+
+
+class TeacherInput(nn.Module):
+    """Convert a normalized student batch to the teacher's input spec (channels, size, normalization)."""
+
+    def __init__(self, student_spec, teacher_spec):
+        super().__init__()
+        self.size = teacher_spec['size']
+        self.channels = teacher_spec['channels']
+        self.register_buffer('s_mean', torch.tensor(student_spec['mean']).view(1, -1, 1, 1))
+        self.register_buffer('s_std', torch.tensor(student_spec['std']).view(1, -1, 1, 1))
+        self.register_buffer('t_mean', torch.tensor(teacher_spec['mean']).view(1, -1, 1, 1))
+        self.register_buffer('t_std', torch.tensor(teacher_spec['std']).view(1, -1, 1, 1))
+
+    def forward(self, images):
+        x = images * self.s_std + self.s_mean  # back to [0, 1]
+        if x.size(1) == 1 and self.channels == 3:
+            x = x.expand(-1, 3, -1, -1)
+        elif x.size(1) == 3 and self.channels == 1:
+            x = (x * torch.tensor([0.299, 0.587, 0.114], device=x.device).view(1, 3, 1, 1)).sum(dim=1, keepdim=True)
+        if x.size(-1) != self.size or x.size(-2) != self.size:
+            x = F.interpolate(x, size=(self.size, self.size), mode='bilinear', align_corners=False)
+        return (x - self.t_mean) / self.t_std
+
+
+def distill_epoch(student, teacher, teacher_input, loader, optimizer, device, temperature, alpha):
+    student.train()
+    running_loss = 0.0
+    running_acc = 0.0
+    for images, labels in tqdm(loader, desc='Distill', leave=False):
+        images = images.to(device)
+        labels = labels.to(device)
+        with torch.no_grad():
+            teacher_logits = teacher(teacher_input(images))
+        optimizer.zero_grad()
+        outputs = student(images)
+        loss = distillation_loss(outputs, teacher_logits, labels, temperature, alpha)
+        loss.backward()
+        optimizer.step()
+
+        running_loss += loss.item() * images.size(0)
+        running_acc += accuracy(outputs, labels) * images.size(0)
+
+    n = len(loader.dataset)
+    return running_loss / n, running_acc / n
+
+
+class _TeacherLoader:
+    """Validation batches converted to the teacher's input spec (the student's view of the test split)."""
+
+    def __init__(self, loader, teacher_input, device):
+        self.loader = loader
+        self.dataset = loader.dataset
+        self.teacher_input = teacher_input
+        self.device = device
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for images, labels in self.loader:
+            with torch.no_grad():
+                images = self.teacher_input(images.to(self.device))
+            yield images, labels
+
+
+def build_report(teacher_path, student_path, data_dir, limit_per_class=None, num_latency_crops=200):
+    """Top-1 accuracy on the test split and CPU ms per face of teacher and student."""
+    samples, _ = list_image_folder(os.path.join(data_dir, 'test'), limit_per_class=limit_per_class)
+    crops = make_synthetic_crops(data_dir, num_latency_crops)
+
+    rows = []
+    for name, path in (('teacher', teacher_path), ('student', student_path)):
+        predictor = EmotionPredictor(path, device='cpu')
+        spec = get_input_spec(predictor.checkpoint)
+        rows.append({
+            'model': name,
+            'path': os.path.abspath(path),
+            'arch': predictor.checkpoint.get('arch', 'resnet18'),
+            'input': f"{spec['size']}x{spec['size']}x{spec['channels']}",
+            'params_m': sum(p.numel() for p in predictor.model.parameters()) / 1e6,
+            'top1': evaluate_predictor(predictor, samples)[0],
+            'ms_per_face': measure_latency(predictor, crops, batch_size=1),
+        })
+
+    print(f"[INFO] FER2013 test split: {len(samples)} images, CPU threads: {torch.get_num_threads()}")
+    print(f"{'model':<10}{'arch':<20}{'input':<12}{'params M':>10}{'top-1':>8}{'ms/face':>10}")
+    for row in rows:
+        print(f"{row['model']:<10}{row['arch']:<20}{row['input']:<12}{row['params_m']:>10.2f}"
+              f"{row['top1']:>8.4f}{row['ms_per_face']:>10.3f}")
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'test_images': len(samples),
+        'threads': torch.get_num_threads(),
+        'models': rows,
+    }
+
+
+def main():
+    current_path = os.path.abspath(__file__)
+    current_dir = os.path.dirname(current_path)
+    parent_dir = os.path.dirname(current_dir)
+
+    parser = argparse.ArgumentParser(description='Distill a trained emotion model into a small student')
+    parser.add_argument('--teacher', default=os.path.join(parent_dir, 'checkpoints', 'best.pth'), help='Teacher checkpoint')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='Path to dataset archive directory (e.g. dataset/FER2013/archive)')
+    parser.add_argument('--arch', default='fer_cnn', choices=ARCHITECTURES, help='Student architecture')
+    parser.add_argument('--img-size', type=int, default=None, help='Student input resolution (default: per architecture)')
+    parser.add_argument('--channels', type=int, default=3, choices=(1, 3), help='Student input channels')
+    parser.add_argument('--stem', default=None, choices=STEMS, help='Student stem (default as in train.py)')
+    parser.add_argument('--temperature', type=float, default=4.0, help='Softmax temperature of the soft targets')
+    parser.add_argument('--alpha', type=float, default=0.7, help='Weight of the soft-target loss (1 - alpha for the labels)')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--output', default=os.path.join(parent_dir, 'checkpoints', 'student'), help='Directory to save student checkpoints')
+    parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--data-format', default='folder', choices=DATA_FORMATS)
+    parser.add_argument('--cache-dir', default=None, help='Directory of the memmap cache (default: <data-dir>/memmap_cache)')
+    parser.add_argument('--augment', default='sample', choices=AUGMENT_MODES)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--no-report', action='store_true', help='Skip the teacher vs student accuracy/latency report')
+    parser.add_argument('--limit-per-class', type=int, default=None, help='Only evaluate the first N test images of each class')
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    img_size = args.img_size or DEFAULT_IMG_SIZE[args.arch]
+    stem = args.stem or default_stem(img_size, args.channels)
+
+    teacher, teacher_checkpoint = load_checkpoint(args.teacher, device=device)
+    teacher = teacher.to(device).eval()
+    teacher_spec = get_input_spec(teacher_checkpoint)
+    student_spec = make_input_spec(args.arch, img_size, channels=args.channels)
+    teacher_input = TeacherInput(student_spec, teacher_spec).to(device)
+
+    train_loader, val_loader, classes = get_dataloaders(args.data_dir, batch_size=args.batch_size,
+                                                       img_size=img_size, num_workers=args.num_workers,
+                                                       data_format=args.data_format, cache_dir=args.cache_dir,
+                                                       augment=args.augment, device=device, channels=args.channels)
+    num_classes = len(classes)
+    if num_classes != teacher_checkpoint.get('num_classes', 7):
+        raise ValueError(f"Teacher has {teacher_checkpoint.get('num_classes', 7)} classes, dataset has {num_classes}")
+
+    student = get_model(num_classes=num_classes, pretrained=True, arch=args.arch, in_channels=args.channels, stem=stem)
+    student = student.to(device)
+    print(f"Teacher {teacher_checkpoint.get('arch', 'resnet18')} ({teacher_spec['size']}x{teacher_spec['size']}x{teacher_spec['channels']}) "
+          f"-> student {args.arch} ({img_size}x{img_size}x{args.channels}, {stem} stem)")
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(student.parameters(), lr=args.lr)
+    scheduler = lr_scheduler.StepLR(optimizer, step_size=10, gamma=0.1)
+
+    _, teacher_acc = validate(teacher, _TeacherLoader(val_loader, teacher_input, device), criterion, device)
+    print(f'Teacher val acc {teacher_acc:.4f}')
+
+    best_acc = 0.0
+    for epoch in range(args.epochs):
+        print(f'Epoch {epoch+1}/{args.epochs}')
+        start = time.perf_counter()
+        train_loss, train_acc = distill_epoch(student, teacher, teacher_input, train_loader, optimizer, device,
+                                              args.temperature, args.alpha)
+        epoch_time = time.perf_counter() - start
+        val_loss, val_acc = validate(student, val_loader, criterion, device)
+        scheduler.step()
+
+        is_best = val_acc > best_acc
+        if is_best:
+            best_acc = val_acc
+
+        print(f'Distill loss {train_loss:.4f} acc {train_acc:.4f} | Val loss {val_loss:.4f} acc {val_acc:.4f} '
+              f'(teacher {teacher_acc:.4f}) | epoch time {epoch_time:.1f}s')
+
+        save_checkpoint({
+            'epoch': epoch,
+            'model_state_dict': student.state_dict(),
+            'optimizer_state_dict': optimizer.state_dict(),
+            'scheduler_state_dict': scheduler.state_dict(),
+            'best_acc': best_acc,
+            'num_classes': num_classes,
+            'arch': args.arch,
+            'stem': stem,
+            'input_spec': student_spec,
+            'epoch_time': epoch_time,
+            'distillation': {
+                'teacher_checkpoint': os.path.abspath(args.teacher),
+                'teacher_acc': teacher_acc,
+                'temperature': args.temperature,
+                'alpha': args.alpha,
+            },
+        }, is_best, args.output, filename=f'checkpoint_epoch{epoch+1}.pth')
+
+    print('Distillation finished. Best student val acc: {:.4f} (teacher {:.4f})'.format(best_acc, teacher_acc))
+
+    if not args.no_report:
+        report = build_report(args.teacher, os.path.join(args.output, 'best.pth'), args.data_dir,
+                              limit_per_class=args.limit_per_class)
+        report_path = os.path.join(args.output, 'distill_report.json')
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Saved report to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
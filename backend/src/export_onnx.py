@@ -0,0 +1,114 @@
+"""
+Export a trained checkpoint (best.pth) to ONNX for torch-free inference.
+Optionally checks accuracy parity and latency of the exported model against the
+PyTorch path on the FER2013 test split.
+"""
+
+import os
+import json
+import argparse
+
+import torch
+
+from model.model import load_checkpoint, get_input_spec
+from inference import EMOTION_CLASSES, EmotionPredictor, OnnxEmotionPredictor, onnx_metadata_path
+from benchmark import DEFAULT_DATA_DIR, list_image_folder, evaluate_predictor, measure_latency, make_synthetic_crops
+
+
+def export_onnx(model_path, output_path, opset=17):
+    """
+    Export a checkpoint to ONNX with a dynamic batch dimension.
+
+    A JSON sidecar with the preprocessing spec and class names is written next to
+    the .onnx file so the ONNX predictors can configure themselves.
+
+    Returns:
+        Path to the exported model.
+    """
+    model, checkpoint = load_checkpoint(model_path, device='cpu')
+    model.eval()
+
+    spec = get_input_spec(checkpoint)
+    width = height = spec['size']
+    dummy = torch.zeros(1, spec['channels'], height, width)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    torch.onnx.export(
+        model, dummy, output_path,
+        input_names=['input'],
+        output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=opset
+    )
+
+    metadata = {
+        'input_size': [width, height],
+        'channels': spec['channels'],
+        'mean': list(spec['mean']),
+        'std': list(spec['std']),
+        'arch': checkpoint.get('arch', 'resnet18'),
+        'classes': EMOTION_CLASSES[:checkpoint.get('num_classes', len(EMOTION_CLASSES))],
+        'source_checkpoint': os.path.abspath(model_path),
+    }
+    with open(onnx_metadata_path(output_path), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+
+    print(f"[INFO] Exported ONNX model to {output_path}")
+    return output_path
+
+
+def check_parity(model_path, onnx_path, data_dir, runtime='onnxruntime', limit_per_class=None, num_latency_crops=200):
+    """Compare top-1 accuracy, prediction agreement and per-face latency of both paths."""
+    samples, _ = list_image_folder(os.path.join(data_dir, 'test'), limit_per_class=limit_per_class)
+    crops = make_synthetic_crops(data_dir, num_latency_crops)
+
+    torch_predictor = EmotionPredictor(model_path, device='cpu')
+    onnx_predictor = OnnxEmotionPredictor(onnx_path, device='cpu', runtime=runtime)
+
+    rows = []
+    predictions = []
+    for name, predictor in (('pytorch', torch_predictor), (f'onnx ({runtime})', onnx_predictor)):
+        acc, preds = evaluate_predictor(predictor, samples)
+        predictions.append(preds)
+        rows.append((name, acc, measure_latency(predictor, crops, batch_size=1),
+                     measure_latency(predictor, crops, batch_size=16)))
+
+    agreement = sum(int(a == b) for a, b in zip(*predictions)) / max(len(samples), 1)
+
+    print(f"[INFO] FER2013 test split: {len(samples)} images")
+    print(f"{'backend':<24}{'top-1':>8}{'ms/face (b=1)':>16}{'ms/face (b=16)':>16}")
+    for name, acc, lat1, lat16 in rows:
+        print(f"{name:<24}{acc:>8.4f}{lat1:>16.3f}{lat16:>16.3f}")
+    print(f"[INFO] Prediction agreement: {agreement:.4f}")
+    return agreement
+
+
+def main():
+    current_path = os.path.abspath(__file__)
+    current_dir = os.path.dirname(current_path)
+    parent_dir = os.path.dirname(current_dir)
+
+    parser = argparse.ArgumentParser(description='Export an emotion checkpoint to ONNX')
+    parser.add_argument('--model', type=str, default=os.path.join(parent_dir, 'checkpoints', 'best.pth'),
+                        help='Path to best.pth model checkpoint')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Output .onnx path (default: next to the checkpoint)')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset version')
+    parser.add_argument('--check', action='store_true',
+                        help='Check accuracy parity and latency against PyTorch on the test split')
+    parser.add_argument('--runtime', type=str, default='onnxruntime', choices=['onnxruntime', 'opencv'],
+                        help='Runtime used by --check')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='FER2013 archive directory (with test/)')
+    parser.add_argument('--limit-per-class', type=int, default=None,
+                        help='Only evaluate the first N test images of each class')
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + '.onnx'
+    export_onnx(args.model, output, opset=args.opset)
+
+    if args.check:
+        check_parity(args.model, output, args.data_dir, runtime=args.runtime,
+                     limit_per_class=args.limit_per_class)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,22 @@
 import cv2
+import numpy as np
 import os
 import sys
 import argparse
+import threading
 from datetime import datetime
 
+from tracking import FaceTracker, TRACKER_TYPES, box_iou
+from crop_archive import CropArchiveWriter, CROP_FORMATS
+
+
+DEFAULT_CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml'
+
 
 class OpenCVFaceDetector:
     """Detect and crop faces using OpenCV Haar Cascade classifier."""
     
-    def __init__(self, cascade_path=None, scale_factor=1.1, min_neighbors=10, min_size=(300, 300)):
+    def __init__(self, cascade_path=None, scale_factor=1.1, min_neighbors=10, min_size=(300, 300), detect_min_size=None):
         """
         Initialize face detector.
         
@@ -17,10 +25,12 @@ class OpenCVFaceDetector:
             scale_factor: Scale factor for detectMultiScale
             min_neighbors: Min neighbors for detectMultiScale
             min_size: Minimum face size (width, height)
+            detect_min_size: If set, downscale frames so that `min_size` faces are this many
+                pixels wide before running the cascade; boxes are mapped back to full resolution
         """
         # Try to load default cascade if not provided
         if cascade_path is None:
-            cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml'
+            cascade_path = DEFAULT_CASCADE_PATH
         
         self.face_cascade = cv2.CascadeClassifier(cascade_path)
         if self.face_cascade.empty():
@@ -29,28 +39,72 @@ class OpenCVFaceDetector:
         self.scale_factor = scale_factor
         self.min_neighbors = min_neighbors
         self.min_size = min_size
+        self.detect_min_size = detect_min_size
+        # Working-resolution scale; never upscale frames
+        self.detect_scale = min(1.0, detect_min_size / min(min_size)) if detect_min_size else 1.0
+        self.cascade_path = cascade_path
+        # Detectors may be shared between API requests (see model_cache.py)
+        self._lock = threading.Lock()
         print(f"[INFO] Loaded cascade classifier: {cascade_path}")
     
     def detect_faces(self, frame):
         """Detect faces in frame and return list of (x, y, w, h) tuples."""
+        scale = self.detect_scale
+        if scale < 1.0:
+            # Pyramid levels below min_size can never match, so run the cascade on a
+            # downscaled copy and map the boxes back to full-resolution coordinates
+            small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            faces = self._detect_gray(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), scale)
+            return self._rescale(faces, scale, frame.shape)
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=self.scale_factor,
-            minNeighbors=self.min_neighbors,
-            minSize=self.min_size
-        )
+        return self._detect_gray(gray, 1.0)
+
+    def _detect_gray(self, gray, scale):
+        """Run detectMultiScale on a grayscale image whose faces are `scale` times full size."""
+        min_size = tuple(max(1, int(round(s * scale))) for s in self.min_size)
+        with self._lock:
+            faces = self.face_cascade.detectMultiScale(
+                gray,
+                scaleFactor=self.scale_factor,
+                minNeighbors=self.min_neighbors,
+                minSize=min_size
+            )
         return faces
+
+    @staticmethod
+    def _rescale(faces, scale, frame_shape):
+        """Map boxes detected at `scale` back to the full frame, clipped to its bounds."""
+        if len(faces) == 0:
+            return faces
+        height, width = frame_shape[:2]
+        boxes = np.round(np.asarray(faces, dtype=np.float32) / scale).astype(np.int32)
+        boxes[:, 0] = np.clip(boxes[:, 0], 0, width - 1)
+        boxes[:, 1] = np.clip(boxes[:, 1], 0, height - 1)
+        boxes[:, 2] = np.minimum(boxes[:, 2], width - boxes[:, 0])
+        boxes[:, 3] = np.minimum(boxes[:, 3], height - boxes[:, 1])
+        return boxes
+    
+    def detect_faces_in_roi(self, frame, roi):
+        """Detect faces inside roi=(x, y, w, h) of frame; boxes are returned in frame coordinates."""
+        x, y, w, h = roi
+        faces = self.detect_faces(frame[y:y+h, x:x+w])
+        return [(fx + x, fy + y, fw, fh) for (fx, fy, fw, fh) in faces]
     
-    def crop_and_save_faces(self, frame, faces, output_dir, prefix='face'):
-        """Crop detected faces and save to output_dir."""
-        os.makedirs(output_dir, exist_ok=True)
+    def crop_and_save_faces(self, frame, faces, output_dir, prefix='face', archive=None, source=None, frame_index=None):
+        """Crop detected faces and save to output_dir, or append them to a CropArchiveWriter."""
+        if archive is None:
+            os.makedirs(output_dir, exist_ok=True)
         count = 0
         for (x, y, w, h) in faces:
             crop = frame[y:y+h, x:x+w]
             if crop.size == 0:
                 continue
             resize = cv2.resize(crop, (48, 48))
+            if archive is not None:
+                # Near-duplicates of recent crops of the same source are skipped
+                if archive.append(resize, source=source or prefix, frame=frame_index, bbox=(x, y, w, h)) is not None:
+                    count += 1
+                continue
             ts = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
             fname = f"{prefix}_{ts}_{w}x{h}.jpg"
             path = os.path.join(output_dir, fname)
@@ -66,7 +120,72 @@ class OpenCVFaceDetector:
         return frame_copy
 
 
-def detect_from_image(detector, image_path, output_dir, save_crops=False):
+class IncrementalFaceDetector:
+    """Rescan only regions around previously found faces, with periodic full-frame scans.
+
+    Keeps per-stream state, so wrap a (possibly shared) OpenCVFaceDetector once per
+    source. New faces entering the scene are picked up by the next full scan.
+    """
+
+    def __init__(self, detector, full_scan_every=10, roi_margin=0.5):
+        """
+        Args:
+            detector: OpenCVFaceDetector used for both full and ROI scans
+            full_scan_every: Run a full-frame scan at least every K calls
+            roi_margin: Fraction of the face size added on each side of a previous box
+        """
+        self.detector = detector
+        self.full_scan_every = full_scan_every
+        self.roi_margin = roi_margin
+        self.prev_faces = []
+        self.calls_since_full = 0
+        self.full_scans = 0
+        self.roi_scans = 0
+
+    def _expand(self, box, frame_shape):
+        height, width = frame_shape[:2]
+        x, y, w, h = box
+        mx, my = int(w * self.roi_margin), int(h * self.roi_margin)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(width, x + w + mx), min(height, y + h + my)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def _full_scan(self, frame):
+        self.full_scans += 1
+        self.calls_since_full = 0
+        return [tuple(int(v) for v in f) for f in self.detector.detect_faces(frame)]
+
+    def detect_faces(self, frame):
+        """Detect faces in frame and return list of (x, y, w, h) tuples."""
+        self.calls_since_full += 1
+        if not self.prev_faces or self.calls_since_full >= self.full_scan_every:
+            faces = self._full_scan(frame)
+        else:
+            faces = []
+            lost = False
+            for box in self.prev_faces:
+                self.roi_scans += 1
+                found = self.detector.detect_faces_in_roi(frame, self._expand(box, frame.shape))
+                if not found:
+                    lost = True
+                    break
+                # Expanded regions can overlap; keep one box per face
+                faces.extend(f for f in found if all(box_iou(f, kept) < 0.5 for kept in faces))
+            if lost:
+                # A known face moved out of its region or left: fall back to the whole frame
+                faces = self._full_scan(frame)
+        self.prev_faces = faces
+        return faces
+
+    def stats(self):
+        return {'full_scans': self.full_scans, 'roi_scans': self.roi_scans}
+
+    def __getattr__(self, name):
+        # draw_faces, crop_and_save_faces, ... come from the wrapped detector
+        return getattr(self.detector, name)
+
+
+def detect_from_image(detector, image_path, output_dir, save_crops=False, archive=None):
     """Detect faces in image file."""
     print(f"[INFO] Loading image: {image_path}")
     frame = cv2.imread(image_path)
@@ -78,7 +197,8 @@ def detect_from_image(detector, image_path, output_dir, save_crops=False):
     
     if save_crops and len(faces) > 0:
         basename = os.path.splitext(os.path.basename(image_path))[0]
-        saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=basename)
+        saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=basename, archive=archive,
+                                             source=image_path)
         print(f"[INFO] Saved {saved} face crops to {output_dir}")
     
     # Draw and save result image
@@ -88,8 +208,8 @@ def detect_from_image(detector, image_path, output_dir, save_crops=False):
     print(f"[INFO] Saved result image: {output_image}")
 
 
-def detect_from_video(detector, video_path, output_dir, interval=10, save_crops=False, display=False):
-    """Detect faces in video file."""
+def detect_from_video(detector, video_path, output_dir, interval=10, save_crops=False, display=False, tracker=None, archive=None):
+    """Detect faces in video file. With a `tracker` type, boxes are carried across skipped frames."""
     print(f"[INFO] Loading video: {video_path}")
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
@@ -103,6 +223,7 @@ def detect_from_video(detector, video_path, output_dir, interval=10, save_crops=
     frame_idx = 0
     detect_idx = 0
     total_faces = 0
+    face_tracker = FaceTracker(tracker) if tracker else None
     
     # Setup output video writer
     output_video = os.path.join(output_dir, f"result_{os.path.basename(video_path)}")
@@ -118,11 +239,16 @@ def detect_from_video(detector, video_path, output_dir, interval=10, save_crops=
         if frame_idx % interval == 0:
             faces = detector.detect_faces(frame)
             detect_idx += 1
+            if face_tracker is not None:
+                face_tracker.update(frame, faces)
             if len(faces) > 0:
                 total_faces += len(faces)
                 print(f"[INFO] Frame {frame_idx}: Detected {len(faces)} face(s)")
                 if save_crops:
-                    saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=f"video_{frame_idx}")
+                    saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=f"video_{frame_idx}",
+                                                         archive=archive, source=video_path, frame_index=frame_idx)
+        elif face_tracker is not None:
+            faces = [track.box for track in face_tracker.predict(frame)]
         else:
             faces = []
         
@@ -146,7 +272,7 @@ def detect_from_video(detector, video_path, output_dir, interval=10, save_crops=
     print(f"[INFO] Saved result video: {output_video}")
 
 
-def detect_from_webcam(detector, cam_id=0, output_dir=None, interval=5, duration=None, save_crops=False):
+def detect_from_webcam(detector, cam_id=0, output_dir=None, interval=5, duration=None, save_crops=False, archive=None):
     """Detect faces from webcam."""
     cap = cv2.VideoCapture(cam_id)
     if not cap.isOpened():
@@ -169,7 +295,8 @@ def detect_from_webcam(detector, cam_id=0, output_dir=None, interval=5, duration
             if len(faces) > 0:
                 total_faces += len(faces)
                 if save_crops and output_dir:
-                    saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=f"webcam_{frame_idx}")
+                    saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=f"webcam_{frame_idx}",
+                                                         archive=archive, source=str(cam_id), frame_index=frame_idx)
         else:
             faces = []
         
@@ -181,7 +308,8 @@ def detect_from_webcam(detector, cam_id=0, output_dir=None, interval=5, duration
         if key == ord('q'):
             break
         elif key == ord('s') and output_dir:
-            saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=f"webcam_manual_{frame_idx}")
+            saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=f"webcam_manual_{frame_idx}",
+                                                 archive=archive, source=str(cam_id), frame_index=frame_idx)
             print(f"[INFO] Saved {saved} face(s)")
         
         # Check duration
@@ -195,7 +323,7 @@ def detect_from_webcam(detector, cam_id=0, output_dir=None, interval=5, duration
     print(f"[INFO] Webcam capture finished. Total faces: {total_faces}")
 
 
-def detect_from_rtsp(detector, rtsp_url, output_dir, interval=10, duration=None, save_crops=False):
+def detect_from_rtsp(detector, rtsp_url, output_dir, interval=10, duration=None, save_crops=False, archive=None):
     """Detect faces from RTSP stream."""
     print(f"[INFO] Connecting to RTSP stream: {rtsp_url}")
     cap = cv2.VideoCapture(rtsp_url)
@@ -228,7 +356,8 @@ def detect_from_rtsp(detector, rtsp_url, output_dir, interval=10, duration=None,
                 total_faces += len(faces)
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] Frame {frame_idx}: Detected {len(faces)} face(s)")
                 if save_crops:
-                    saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=f"rtsp_{frame_idx}")
+                    saved = detector.crop_and_save_faces(frame, faces, output_dir, prefix=f"rtsp_{frame_idx}",
+                                                         archive=archive, source=rtsp_url, frame_index=frame_idx)
         
         # Check duration
         if duration is not None and (datetime.now() - start_time).total_seconds() > duration:
@@ -255,9 +384,17 @@ def main():
     parser.add_argument('--scale-factor', type=float, default=1.1, help='Scale factor for detectMultiScale')
     parser.add_argument('--min-neighbors', type=int, default=10, help='Min neighbors for detectMultiScale')
     parser.add_argument('--min-size', type=int, nargs=2, default=[300, 300], help='Minimum face size (width height)')
+    parser.add_argument('--detect-min-size', type=int, default=None,
+                        help='Downscale frames so min-size faces are this many pixels before detection (e.g. 60)')
+    parser.add_argument('--full-scan-every', type=int, default=0,
+                        help='Incremental detection: search only around known faces, full scan every K detections (0 = off)')
+    parser.add_argument('--roi-margin', type=float, default=0.5, help='ROI expansion around known faces (fraction of face size)')
     parser.add_argument('--interval', type=int, default=10, help='Detect every N frames (video/RTSP)')
     parser.add_argument('--duration', type=int, default=None, help='Run duration in seconds (webcam/RTSP)')
+    parser.add_argument('--tracker', default=None, choices=TRACKER_TYPES, help='Track faces between detections (video)')
     parser.add_argument('--save-crops', action='store_true', help='Save cropped faces')
+    parser.add_argument('--crop-format', default='jpg', choices=CROP_FORMATS,
+                        help='jpg: one file per crop; archive: packed shards in <output-dir>/crop_archive, near-duplicates skipped')
     parser.add_argument('--display', action='store_true', help='Display video (for video/webcam)')
     
     args = parser.parse_args()
@@ -267,28 +404,45 @@ def main():
         cascade_path=args.cascade,
         scale_factor=args.scale_factor,
         min_neighbors=args.min_neighbors,
-        min_size=tuple(args.min_size)
+        min_size=tuple(args.min_size),
+        detect_min_size=args.detect_min_size
     )
     
+    if args.full_scan_every > 0:
+        detector = IncrementalFaceDetector(detector, full_scan_every=args.full_scan_every, roi_margin=args.roi_margin)
+    
     os.makedirs(args.output_dir, exist_ok=True)
+    archive = None
+    if args.save_crops and args.crop_format == 'archive':
+        archive = CropArchiveWriter(os.path.join(args.output_dir, 'crop_archive'))
     
     # Determine source type
     if args.source.isdigit():
         # Webcam
-        detect_from_webcam(detector, int(args.source), args.output_dir, args.interval, args.duration, args.save_crops)
+        detect_from_webcam(detector, int(args.source), args.output_dir, args.interval, args.duration, args.save_crops, archive)
     elif args.source.lower().startswith('rtsp://'):
         # RTSP stream
-        detect_from_rtsp(detector, args.source, args.output_dir, args.interval, args.duration, args.save_crops)
+        detect_from_rtsp(detector, args.source, args.output_dir, args.interval, args.duration, args.save_crops, archive)
     elif os.path.isfile(args.source):
         # Image or video file
         if args.source.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.flv')):
-            detect_from_video(detector, args.source, args.output_dir, args.interval, args.save_crops, args.display)
+            detect_from_video(detector, args.source, args.output_dir, args.interval, args.save_crops, args.display, args.tracker, archive)
         else:
-            detect_from_image(detector, args.source, args.output_dir, args.save_crops)
+            detect_from_image(detector, args.source, args.output_dir, args.save_crops, archive)
     else:
         print(f"[ERROR] Source not found or invalid: {args.source}")
         sys.exit(1)
 
+    if archive is not None:
+        archive.close()
+        stats = archive.stats()
+        print(f"[INFO] Crop archive: {stats['records']} crops in {stats['archive_dir']}, "
+              f"{stats['duplicates']} near-duplicates skipped")
+
+    if isinstance(detector, IncrementalFaceDetector):
+        stats = detector.stats()
+        print(f"[INFO] Detection scans: {stats['full_scans']} full, {stats['roi_scans']} ROI")
+
 
 if __name__ == '__main__':
     main()
@@ -6,39 +6,58 @@ Generates JSON output with detected emotions for each face in images/videos.
 import os
 import json
 import argparse
+import threading
+from abc import ABC, abstractmethod
 from datetime import datetime
 import cv2
-import torch
-from torchvision import transforms
 import numpy as np
 
 from face_detection import OpenCVFaceDetector
-from model.model import load_checkpoint
+from preprocess import CropPreprocessor, IMAGENET_MEAN, IMAGENET_STD
+from tracking import FaceTracker, TRACKER_TYPES
+from result_writer import JsonlResultWriter, RESULT_FORMATS
+from crop_writer import AsyncCropWriter
+
+# torch is imported lazily by EmotionPredictor so that the ONNX backends can run
+# in workers without torch/torchvision installed.
 
 
 # Emotion class names (from FER2013 dataset)
 EMOTION_CLASSES = ['angry', 'disgust', 'fear', 'happy', 'neutral', 'sad', 'surprise']
 
+PREDICTOR_BACKENDS = ('torch', 'onnxruntime', 'opencv')
+
+
+def onnx_metadata_path(onnx_path):
+    """Return the path of the JSON sidecar written next to an exported ONNX model."""
+    return os.path.splitext(onnx_path)[0] + '.json'
+
+
+class BaseEmotionPredictor(ABC):
+    """Shared preprocessing and result formatting; backends implement `_forward`."""
+
+    def __init__(self, input_size=(224, 224), mean=IMAGENET_MEAN, std=IMAGENET_STD, classes=EMOTION_CLASSES, channels=3):
+        self.classes = list(classes)
+        # Image preprocessing (resize + normalize into a reused NCHW buffer; grayscale for 1-channel models).
+        # Every thread gets its own buffer, so threads sharing a predictor preprocess in parallel
+        self._preprocess_kwargs = dict(size=input_size, mean=mean, std=std, channels=channels)
+        self._local = threading.local()
+        # Backends whose forward pass is not thread-safe (cv2.dnn) set this to serialize it
+        self.serialize_forward = False
+        self._lock = threading.Lock()
+
+    @property
+    def preprocess(self):
+        """CropPreprocessor of the calling thread."""
+        preprocess = getattr(self._local, 'preprocess', None)
+        if preprocess is None:
+            preprocess = self._local.preprocess = CropPreprocessor(**self._preprocess_kwargs)
+        return preprocess
+
+    @abstractmethod
+    def _forward(self, batch):
+        """Run the network on a float32 NCHW batch and return logits as a NumPy array."""
 
-class EmotionPredictor:
-    """Predict emotions from face crops using trained model."""
-    
-    def __init__(self, model_path, device='cpu'):
-        """Load model from checkpoint."""
-        self.device = device
-        self.model, self.checkpoint = load_checkpoint(model_path, device=device)
-        self.model.to(device)
-        self.model.eval()
-        
-        # Image preprocessing
-        self.transform = transforms.Compose([
-            transforms.ToPILImage(),
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                std=[0.229, 0.224, 0.225])
-        ])
-        print(f"[INFO] Loaded model from {model_path}")
     def predict(self, face_crop):
         """
         Predict emotion from a face crop image.
@@ -49,43 +68,177 @@ class EmotionPredictor:
         Returns:
             dict with emotion prediction and confidence scores
         """
-        try:
-            # Convert BGR to RGB
-            face_rgb = cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB)
-            
-            # Apply transforms
-            tensor = self.transform(face_rgb).unsqueeze(0).to(self.device)
-            
-            # Get prediction
-            with torch.no_grad():
-                outputs = self.model(tensor)
-                probabilities = torch.softmax(outputs, dim=1)[0]
-                confidence, predicted = torch.max(outputs, 1)
-            
-            emotion = EMOTION_CLASSES[predicted.item()]
-            confidence_score = probabilities[predicted.item()].item()
-            
-            # Get all emotion scores
-            all_emotions = {
-                EMOTION_CLASSES[i]: probabilities[i].item() 
-                for i in range(len(EMOTION_CLASSES))
-            }
-            
-            return {
-                'emotion': emotion,
-                'confidence': confidence_score,
-                'scores': all_emotions
-            }
-        except Exception as e:
-            print(f"[ERROR] Prediction failed: {e}")
-            return {
-                'emotion': 'unknown',
-                'confidence': 0.0,
-                'scores': {}
-            }
-
-
-def save_face_crop(output_dir, face_crop, source_name, idx):
+        return self.predict_batch([face_crop])[0]
+
+    def predict_batch(self, face_crops, max_batch_size=64):
+        """
+        Predict emotions for several face crops with batched forward passes.
+
+        Args:
+            face_crops: list of BGR image arrays (from OpenCV), e.g. every face
+                of a frame, or the faces of several queued frames concatenated
+            max_batch_size: upper bound on crops per forward pass
+
+        Returns:
+            list of prediction dicts (same format as `predict`), in input order
+        """
+        results = []
+        for start in range(0, len(face_crops), max_batch_size):
+            chunk = face_crops[start:start + max_batch_size]
+            try:
+                # BGR crops -> normalized RGB NCHW batch -> logits
+                batch = self.preprocess(chunk)
+                if self.serialize_forward:
+                    with self._lock:
+                        logits = self._forward(batch)
+                else:
+                    logits = self._forward(batch)
+                logits = logits.astype(np.float64)
+
+                # Softmax over classes
+                exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+                probabilities = exp / exp.sum(axis=1, keepdims=True)
+                predicted = probabilities.argmax(axis=1)
+
+                for probs, pred in zip(probabilities.tolist(), predicted.tolist()):
+                    results.append({
+                        'emotion': self.classes[pred],
+                        'confidence': probs[pred],
+                        'scores': {self.classes[i]: probs[i] for i in range(len(self.classes))}
+                    })
+            except Exception as e:
+                print(f"[ERROR] Prediction failed: {e}")
+                results.extend({
+                    'emotion': 'unknown',
+                    'confidence': 0.0,
+                    'scores': {}
+                } for _ in chunk)
+        return results
+
+    def predict_frames(self, frames_crops, max_batch_size=64):
+        """
+        Predict emotions for the face crops of several frames in shared batches.
+
+        Args:
+            frames_crops: list (one entry per frame) of lists of BGR face crops
+            max_batch_size: upper bound on crops per forward pass
+
+        Returns:
+            list (one entry per frame) of lists of prediction dicts
+        """
+        flat = [crop for crops in frames_crops for crop in crops]
+        predictions = self.predict_batch(flat, max_batch_size=max_batch_size)
+        grouped = []
+        offset = 0
+        for crops in frames_crops:
+            grouped.append(predictions[offset:offset + len(crops)])
+            offset += len(crops)
+        return grouped
+
+
+class EmotionPredictor(BaseEmotionPredictor):
+    """Predict emotions from face crops using trained model."""
+    
+    def __init__(self, model_path, device='cpu', quantized=False):
+        """Load model from checkpoint (an INT8 checkpoint from quantize.py if `quantized`)."""
+        import torch
+        from model.model import load_checkpoint, get_input_spec
+
+        self._torch = torch
+        self.device = device
+        if quantized:
+            if device != 'cpu':
+                raise ValueError("Quantized models only run on CPU")
+            from model.quantization import load_quantized_checkpoint
+            self.model, self.checkpoint = load_quantized_checkpoint(model_path)
+        else:
+            self.model, self.checkpoint = load_checkpoint(model_path, device=device)
+
+        # Preprocess to the resolution/normalization the checkpoint was trained with
+        spec = get_input_spec(self.checkpoint)
+        super().__init__(input_size=(spec['size'], spec['size']), mean=spec['mean'], std=spec['std'],
+                         channels=spec['channels'])
+        self.model.to(device)
+        self.model.eval()
+        print(f"[INFO] Loaded model from {model_path}")
+
+    def _forward(self, batch):
+        torch = self._torch
+        with torch.no_grad():
+            outputs = self.model(torch.from_numpy(batch).to(self.device))
+        return outputs.cpu().numpy()
+
+
+class OnnxEmotionPredictor(BaseEmotionPredictor):
+    """Predict emotions with an exported ONNX model via onnxruntime or OpenCV DNN (no torch)."""
+
+    def __init__(self, model_path, device='cpu', runtime='onnxruntime'):
+        """
+        Args:
+            model_path: Path to the .onnx file written by export_onnx.py
+            device: 'cpu' or 'cuda'
+            runtime: 'onnxruntime' or 'opencv' (cv2.dnn)
+        """
+        meta = {}
+        meta_path = onnx_metadata_path(model_path)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        super().__init__(input_size=tuple(meta.get('input_size', (224, 224))),
+                         mean=meta.get('mean', IMAGENET_MEAN),
+                         std=meta.get('std', IMAGENET_STD),
+                         classes=meta.get('classes', EMOTION_CLASSES),
+                         channels=meta.get('channels', 3))
+        self.device = device
+        self.runtime = runtime
+
+        if runtime == 'onnxruntime':
+            import onnxruntime as ort
+            providers = ['CPUExecutionProvider']
+            if device == 'cuda':
+                providers.insert(0, 'CUDAExecutionProvider')
+            self.session = ort.InferenceSession(model_path, providers=providers)
+            self.input_name = self.session.get_inputs()[0].name
+        elif runtime == 'opencv':
+            self.net = cv2.dnn.readNetFromONNX(model_path)
+            self.serialize_forward = True  # setInput/forward share the net's state
+            if device == 'cuda':
+                self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+                self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+        else:
+            raise ValueError(f"Unsupported ONNX runtime: {runtime}")
+        print(f"[INFO] Loaded ONNX model from {model_path} ({runtime})")
+
+    def _forward(self, batch):
+        if self.runtime == 'onnxruntime':
+            return self.session.run(None, {self.input_name: batch})[0]
+        self.net.setInput(batch)
+        return self.net.forward()
+
+
+def create_predictor(model_path, device='cpu', backend='torch', quantized=False):
+    """
+    Build an emotion predictor for the requested backend.
+
+    Args:
+        model_path: .pth checkpoint for 'torch', exported .onnx file otherwise
+        device: 'cpu' or 'cuda'
+        backend: one of PREDICTOR_BACKENDS
+        quantized: load an INT8 checkpoint from quantize.py (torch backend only)
+
+    Returns:
+        predictor exposing `predict`, `predict_batch` and `predict_frames`
+    """
+    if backend == 'torch':
+        return EmotionPredictor(model_path, device=device, quantized=quantized)
+    if quantized:
+        raise ValueError("--quantized is only supported by the torch backend")
+    if backend in ('onnxruntime', 'opencv'):
+        return OnnxEmotionPredictor(model_path, device=device, runtime=backend)
+    raise ValueError(f"Unsupported predictor backend: {backend}")
+
+
+def save_face_crop(output_dir, face_crop, source_name, idx, crop_writer=None):
     """
     Save a face crop to the output crops directory with a unique name.
 
@@ -94,15 +247,19 @@ def save_face_crop(output_dir, face_crop, source_name, idx):
         face_crop: image array (BGR)
         source_name: original source name (image file or video identifier)
         idx: face index to include in filename
+        crop_writer: optional AsyncCropWriter; the crop is queued instead of written here
 
     Returns:
         Path to the saved crop image.
     """
     crop_dir = os.path.join(output_dir, 'crops')
-    os.makedirs(crop_dir, exist_ok=True)
     base = os.path.splitext(os.path.basename(source_name))[0]
     fname = f"{base}_crop_{idx}.jpg"
     path = os.path.join(crop_dir, fname)
+    if crop_writer is not None:
+        crop_writer.submit(path, face_crop)
+        return path
+    os.makedirs(crop_dir, exist_ok=True)
     cv2.imwrite(path, face_crop)
     return path
 
@@ -131,14 +288,19 @@ def process_image(image_path, face_detector, emotion_predictor, output_dir, save
         'faces': []
     }
     
+    # Collect all valid crops first so they are classified in one batch
+    crops = []
     for idx, (x, y, w, h) in enumerate(faces):
         face_crop = frame[y:y+h, x:x+w]
         
         if face_crop.size == 0:
             continue
         
-        prediction = emotion_predictor.predict(face_crop)
-        
+        crops.append((idx, (x, y, w, h), face_crop))
+    
+    predictions = emotion_predictor.predict_batch([crop for _, _, crop in crops])
+    
+    for (idx, (x, y, w, h), face_crop), prediction in zip(crops, predictions):
         face_result = {
             'id': idx,
             'bbox': {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)},
@@ -160,16 +322,19 @@ def process_image(image_path, face_detector, emotion_predictor, output_dir, save
     return results
 
 
-def process_video(video_path, face_detector, emotion_predictor, output_dir, interval=10, save_crops=True):
+def process_video(video_path, face_detector, emotion_predictor, output_dir, interval=10, save_crops=True, tracker=None, writer=None):
     """
     Process video file, detect faces per frame, and predict emotions.
     
     Args:
         video_path: Path to video file
         face_detector: OpenCVFaceDetector instance
-        emotion_predictor: EmotionPredictor instance
+        emotion_predictor: EmotionPredictor (or other backend) instance
         output_dir: Directory to save outputs
         interval: Process every Nth frame
+        tracker: Optional tracker type ('iou', 'kcf', 'mosse'); face ids become stable track ids
+        writer: Optional JsonlResultWriter; frame records are appended to it instead of
+            being collected in results['frames']
         
     Returns:
         dict with video analysis results
@@ -200,60 +365,99 @@ def process_video(video_path, face_detector, emotion_predictor, output_dir, inte
         },
         'frames': []
     }
+    if writer is not None:
+        writer.header.update({k: v for k, v in results.items() if k != 'frames'})
     
     frame_idx = 0
     processed_frame_idx = 0
+    frames_with_faces = 0
+    emotion_counts = {emotion: 0 for emotion in EMOTION_CLASSES}
+    face_tracker = FaceTracker(tracker) if tracker else None
+    # Crops are written on background threads; 'block' keeps every crop of an offline run
+    crop_writer = AsyncCropWriter(policy='block') if save_crops else None
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
         
-        if frame_idx % interval != 0:
-            frame_idx += 1
-            continue
+            if frame_idx % interval != 0:
+                if face_tracker is not None:
+                    # Keep tracks following the faces so ids survive the next detection
+                    face_tracker.predict(frame)
+                frame_idx += 1
+                continue
         
-        faces = face_detector.detect_faces(frame)
+            faces = face_detector.detect_faces(frame)
+            tracks = face_tracker.update(frame, faces) if face_tracker is not None else None
         
-        if len(faces) > 0:
-            frame_result = {
-                'frame_index': frame_idx,
-                'timestamp_seconds': frame_idx / fps if fps > 0 else 0,
-                'faces': []
-            }
+            if len(faces) > 0:
+                frame_result = {
+                    'frame_index': frame_idx,
+                    'timestamp_seconds': frame_idx / fps if fps > 0 else 0,
+                    'faces': []
+                }
             
-            for idx, (x, y, w, h) in enumerate(faces):
-                face_crop = frame[y:y+h, x:x+w]
-                
-                if face_crop.size == 0:
-                    continue
+                crops = []
+                for idx, (x, y, w, h) in enumerate(faces):
+                    face_crop = frame[y:y+h, x:x+w]
                 
-                prediction = emotion_predictor.predict(face_crop)
+                    if face_crop.size == 0:
+                        continue
                 
-                face_result = {
-                    'id': idx,
-                    'bbox': {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)},
-                    'emotion': prediction['emotion'],
-                    'confidence': float(prediction['confidence']),
-                    'all_emotions': {k: float(v) for k, v in prediction['scores'].items()}
-                }
-                if save_crops:
-                    crop_name = f"{os.path.basename(video_path)}_frame{frame_idx}"
-                    crop_path = save_face_crop(output_dir, face_crop, crop_name, idx)
-                    face_result['crop_path'] = crop_path
+                    face_id = tracks[idx].track_id if tracks is not None else idx
+                    crops.append((face_id, (x, y, w, h), face_crop))
+            
+                predictions = emotion_predictor.predict_batch([crop for _, _, crop in crops])
+            
+                for (idx, (x, y, w, h), face_crop), prediction in zip(crops, predictions):
+                    face_result = {
+                        'id': idx,
+                        'bbox': {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)},
+                        'emotion': prediction['emotion'],
+                        'confidence': float(prediction['confidence']),
+                        'all_emotions': {k: float(v) for k, v in prediction['scores'].items()}
+                    }
+                    if save_crops:
+                        crop_name = f"{os.path.basename(video_path)}_frame{frame_idx}"
+                        crop_path = save_face_crop(output_dir, face_crop, crop_name, idx, crop_writer=crop_writer)
+                        face_result['crop_path'] = crop_path
 
-                frame_result['faces'].append(face_result)
+                    frame_result['faces'].append(face_result)
+                    emotion_counts[face_result['emotion']] = emotion_counts.get(face_result['emotion'], 0) + 1
             
-            results['frames'].append(frame_result)
+                if writer is not None:
+                    writer.write_frame(frame_result)
+                else:
+                    results['frames'].append(frame_result)
+                frames_with_faces += 1
         
-        processed_frame_idx += 1
-        if processed_frame_idx % 10 == 0:
-            print(f"[INFO] Processed {processed_frame_idx} frames...")
+            processed_frame_idx += 1
+            if processed_frame_idx % 10 == 0:
+                print(f"[INFO] Processed {processed_frame_idx} frames...")
         
-        frame_idx += 1
-    
-    cap.release()
-    print(f"[INFO] Processed {len(results['frames'])} frames with faces")
+            frame_idx += 1
+    except BaseException:
+        if writer is not None:
+            writer.close()  # keep the frame records written so far readable
+        raise
+    finally:
+        # Release the video and flush queued crops even when a frame fails
+        cap.release()
+        if crop_writer is not None:
+            crop_writer.close()
+
+    if crop_writer is not None:
+        results['crop_writer'] = crop_writer.stats()
+    print(f"[INFO] Processed {frames_with_faces} frames with faces")
+
+    results['emotion_counts'] = emotion_counts
+    results['most_frequent_emotion'] = max(emotion_counts, key=emotion_counts.get) if frames_with_faces else None
+    if writer is not None:
+        writer.write_summary({'emotion_counts': emotion_counts,
+                              'most_frequent_emotion': results['most_frequent_emotion']})
+        results['results_file'] = writer.path
     
     return results
 
@@ -275,8 +479,17 @@ def main():
     parser.add_argument('--device', type=str, default='cpu',
                        choices=['cpu', 'cuda'],
                        help='Device to use for inference')
+    parser.add_argument('--backend', type=str, default='torch',
+                       choices=PREDICTOR_BACKENDS,
+                       help='Inference backend (onnxruntime/opencv expect an exported .onnx model)')
+    parser.add_argument('--quantized', action='store_true',
+                       help='Load an INT8 checkpoint produced by quantize.py (CPU only)')
     parser.add_argument('--video-interval', type=int, default=10,
                        help='Process every Nth frame in video')
+    parser.add_argument('--tracker', type=str, default=None, choices=TRACKER_TYPES,
+                       help='Track faces between detections so face ids are stable across video frames')
+    parser.add_argument('--result-format', type=str, default='json', choices=RESULT_FORMATS,
+                       help='Video results as one JSON document, or JSONL written frame by frame')
     
     args = parser.parse_args()
     
@@ -285,7 +498,8 @@ def main():
     
     # Initialize detector and predictor
     face_detector = OpenCVFaceDetector()
-    emotion_predictor = EmotionPredictor(args.model, device=args.device)
+    emotion_predictor = create_predictor(args.model, device=args.device, backend=args.backend,
+                                         quantized=args.quantized)
     
     # Check if input is image or video
     _, ext = os.path.splitext(args.input)
@@ -295,18 +509,25 @@ def main():
     if ext.lower() in image_extensions:
         results = process_image(args.input, face_detector, emotion_predictor, args.output_dir)
     elif ext.lower() in video_extensions:
+        writer = None
+        if args.result_format == 'jsonl':
+            writer = JsonlResultWriter(os.path.join(args.output_dir, 'results.jsonl'))
         results = process_video(args.input, face_detector, emotion_predictor, args.output_dir, 
-                               interval=args.video_interval)
+                               interval=args.video_interval, tracker=args.tracker, writer=writer)
     else:
         raise ValueError(f"Unsupported file format: {ext}")
     
-    # Save JSON results
-    json_output = os.path.join(args.output_dir, 'results.json')
-    with open(json_output, 'w') as f:
-        json.dump(results, f, indent=2)
+    # Save JSON results (JSONL video results were written while processing)
+    if 'results_file' in results:
+        json_output = results['results_file']
+    else:
+        json_output = os.path.join(args.output_dir, 'results.json')
+        with open(json_output, 'w') as f:
+            json.dump(results, f, indent=2)
     
     print(f"\n[SUCCESS] Results saved to {json_output}")
-    print(json.dumps(results, indent=2))
+    # Per-frame records of a video can be long; print everything but them
+    print(json.dumps({k: v for k, v in results.items() if k != 'frames'}, indent=2))
 
 
 if __name__ == '__main__':
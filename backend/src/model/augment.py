@@ -0,0 +1,94 @@
+import math
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from model.model import IMAGENET_MEAN, IMAGENET_STD
+
+
+class BatchAugment(nn.Module):
+    """RandomResizedCrop + RandomHorizontalFlip + Normalize for a whole uint8 batch.
+
+    Replaces the per-sample PIL transforms of `get_dataloaders`: the loader only
+    collates small uint8 images, and every sample's crop box and flip are applied
+    together as one affine_grid/grid_sample call (on the training device if the
+    batch is moved there first).
+    """
+
+    def __init__(self, img_size, scale=(0.08, 1.0), ratio=(3 / 4, 4 / 3), flip_p=0.5,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        """
+        Args:
+            img_size: Output resolution
+            scale, ratio: Crop area fraction and aspect ratio ranges (as in RandomResizedCrop)
+            flip_p: Probability of a horizontal flip
+        """
+        super().__init__()
+        self.img_size = img_size
+        self.scale = scale
+        self.log_ratio = (math.log(ratio[0]), math.log(ratio[1]))
+        self.flip_p = flip_p
+        self.register_buffer('mean', torch.tensor(mean).view(1, -1, 1, 1))
+        self.register_buffer('std', torch.tensor(std).view(1, -1, 1, 1))
+
+    def forward(self, images):
+        """(N, C, H, W) uint8 -> (N, C, img_size, img_size) normalized float."""
+        n = images.size(0)
+        device = images.device
+        x = images.float().div_(255)
+
+        # Crop width/height as fractions of the source; clamped instead of
+        # RandomResizedCrop's rejection sampling
+        area = torch.empty(n, device=device).uniform_(*self.scale)
+        log_r = torch.empty(n, device=device).uniform_(*self.log_ratio)
+        aspect = torch.exp(log_r) * images.size(2) / images.size(3)
+        w = torch.sqrt(area * aspect).clamp_(max=1.0)
+        h = torch.sqrt(area / aspect).clamp_(max=1.0)
+        # Crop centers in normalized [-1, 1] coordinates, inside the image
+        cx = (torch.rand(n, device=device) * 2 - 1) * (1 - w)
+        cy = (torch.rand(n, device=device) * 2 - 1) * (1 - h)
+        flip = torch.where(torch.rand(n, device=device) < self.flip_p, -1.0, 1.0)
+
+        theta = torch.zeros(n, 2, 3, device=device)
+        theta[:, 0, 0] = w * flip
+        theta[:, 0, 2] = cx
+        theta[:, 1, 1] = h
+        theta[:, 1, 2] = cy
+        grid = F.affine_grid(theta, (n, x.size(1), self.img_size, self.img_size), align_corners=False)
+        x = F.grid_sample(x, grid, mode='bilinear', padding_mode='border', align_corners=False)
+        if x.size(1) == 1 and self.mean.size(1) == 3:
+            x = x.expand(-1, 3, -1, -1)
+        elif x.size(1) == 3 and self.mean.size(1) == 1:
+            # RGB source for a single-channel model (ITU-R 601 luma, as PIL's 'L')
+            weights = torch.tensor([0.299, 0.587, 0.114], device=device).view(1, 3, 1, 1)
+            x = (x * weights).sum(dim=1, keepdim=True)
+        return (x - self.mean) / self.std
+
+
+class BatchAugmentLoader:
+    """Iterate a DataLoader of uint8 batches and apply a BatchAugment to each."""
+
+    def __init__(self, loader, augment, device=None):
+        """
+        Args:
+            loader: DataLoader yielding (uint8 images, labels)
+            augment: BatchAugment
+            device: Move batches here before augmenting (e.g. 'cuda'); None = stay on CPU
+        """
+        self.loader = loader
+        self.dataset = loader.dataset
+        self.augment = augment.to(device) if device is not None else augment
+        self.device = device
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for images, labels in self.loader:
+            if self.device is not None:
+                images = images.to(self.device, non_blocking=True)
+                labels = labels.to(self.device, non_blocking=True)
+            # Not around the yield: grad mode would stay off in the training step
+            with torch.no_grad():
+                images = self.augment(images)
+            yield images, labels
@@ -1,40 +1,290 @@
 import os
+import json
+import numpy as np
+import torch
+from PIL import Image
 from torchvision import transforms, datasets
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Dataset
 
+from crop_archive import CropArchive, META_FILE
+from model.model import IMAGENET_MEAN, IMAGENET_STD, GRAY_MEAN, GRAY_STD
+from model.augment import BatchAugment, BatchAugmentLoader
 
-def get_dataloaders(data_dir, batch_size=64, img_size=224, num_workers=4):
+
+DATA_FORMATS = ('folder', 'memmap')
+AUGMENT_MODES = ('sample', 'batch')
+PACK_META_FILE = 'pack.json'
+
+
+def get_dataloaders(data_dir, batch_size=64, img_size=224, num_workers=4, data_format='folder', cache_dir=None,
+                    augment='sample', device=None, source_size=48, channels=3):
     """Create train and validation dataloaders using ImageFolder.
 
-    Expects `data_dir` to contain `train/` and `test/` subfolders.
+    Expects `data_dir` to contain `train/` and `test/` subfolders. A subfolder that
+    is a crop archive (has meta.json, see crop_archive.py) is read with CropArchiveDataset.
+
+    With data_format='memmap' both splits are packed once into uint8 arrays in
+    `cache_dir` (default: <data_dir>/memmap_cache, see `pack_dataset`) and read with
+    MemmapDataset; the resized and center-cropped validation images are cached there too.
+
+    With augment='batch' the training loader collates uint8 images of `source_size`
+    and BatchAugment (model/augment.py) crops, flips, resizes and normalizes each
+    batch in a few tensor ops, on `device` if given, instead of per-sample PIL transforms.
+
+    With channels=1 images stay single-channel grayscale (FER2013 is grayscale), for
+    models built with `get_model(in_channels=1)`.
     Returns: (train_loader, val_loader, class_names)
     """
+    if data_format not in DATA_FORMATS:
+        raise ValueError(f"Unknown data format: {data_format}")
+    if augment not in AUGMENT_MODES:
+        raise ValueError(f"Unknown augment mode: {augment}")
     train_dir = os.path.join(data_dir, 'train')
     val_dir = os.path.join(data_dir, 'test')
 
-    normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                     std=[0.229, 0.224, 0.225])
+    if channels not in (1, 3):
+        raise ValueError(f"Unsupported number of channels: {channels}")
+    mean, std = (GRAY_MEAN, GRAY_STD) if channels == 1 else (IMAGENET_MEAN, IMAGENET_STD)
+    normalize = transforms.Normalize(mean=mean, std=std)
+    # ImageFolder and the crop archive load RGB images
+    to_channels = [transforms.Grayscale(1)] if channels == 1 else []
 
-    train_transforms = transforms.Compose([
+    train_transforms = transforms.Compose(to_channels + [
         transforms.RandomResizedCrop(img_size),
         transforms.RandomHorizontalFlip(),
         transforms.ToTensor(),
         normalize,
     ])
 
-    val_transforms = transforms.Compose([
+    if augment == 'batch':
+        # Only decode and collate; the random transforms run per batch in BatchAugment
+        train_transforms = transforms.Compose(to_channels + [
+            transforms.Resize((source_size, source_size)),
+            transforms.PILToTensor(),
+        ])
+
+    val_resize = to_channels + [
         transforms.Resize(int(img_size * 1.15)),
         transforms.CenterCrop(img_size),
+    ]
+    val_transforms = transforms.Compose(val_resize + [
         transforms.ToTensor(),
         normalize,
     ])
 
-    train_ds = datasets.ImageFolder(train_dir, transform=train_transforms)
-    val_ds = datasets.ImageFolder(val_dir, transform=val_transforms)
+    if data_format == 'memmap':
+        cache_dir = cache_dir or os.path.join(data_dir, 'memmap_cache')
+        if not os.path.exists(os.path.join(cache_dir, PACK_META_FILE)):
+            pack_dataset(data_dir, cache_dir)
+        if augment == 'batch' and _load_pack_meta(cache_dir)['size'] == source_size:
+            train_ds = MemmapDataset(cache_dir, 'train', raw=True)
+        else:
+            train_ds = MemmapDataset(cache_dir, 'train', transform=train_transforms)
+        cache_val_split(cache_dir, 'test', img_size, transforms.Compose(val_resize), channels=channels)
+        val_ds = PreprocessedDataset(cache_dir, 'test', img_size, mean=mean, std=std, channels=channels)
+    else:
+        train_ds = _make_dataset(train_dir, train_transforms)
+        val_ds = _make_dataset(val_dir, val_transforms, classes=train_ds.classes)
 
     train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True,
                               num_workers=num_workers, pin_memory=True)
     val_loader = DataLoader(val_ds, batch_size=batch_size, shuffle=False,
                             num_workers=num_workers, pin_memory=True)
+    if augment == 'batch':
+        train_loader = BatchAugmentLoader(train_loader, BatchAugment(img_size, mean=mean, std=std), device=device)
 
     return train_loader, val_loader, train_ds.classes
+
+
+def _make_dataset(path, transform, classes=None):
+    if os.path.exists(os.path.join(path, META_FILE)):
+        return CropArchiveDataset(path, transform=transform, classes=classes)
+    return datasets.ImageFolder(path, transform=transform)
+
+
+class CropArchiveDataset(Dataset):
+    """Labelled crops of a crop archive (crop_archive.py), e.g. collected by run_stream.py.
+
+    Crops without an emotion label are skipped. Images are returned as RGB PIL
+    images, so the ImageFolder transforms of `get_dataloaders` apply unchanged.
+    """
+
+    def __init__(self, archive_dir, transform=None, classes=None, min_confidence=0.0):
+        """
+        Args:
+            archive_dir: Crop archive directory
+            transform: torchvision transform applied to each image
+            classes: Class names in label order (default: sorted emotions found in the archive,
+                which matches ImageFolder's ordering of FER2013)
+            min_confidence: Skip crops whose predicted emotion is less confident than this
+        """
+        self.archive = CropArchive(archive_dir)
+        self.transform = transform
+        self.indices = [i for i, r in enumerate(self.archive.records)
+                        if r.get('emotion') and (r.get('confidence') or 0.0) >= min_confidence]
+        self.classes = classes or sorted({self.archive.records[i]['emotion'] for i in self.indices})
+        class_to_idx = {name: i for i, name in enumerate(self.classes)}
+        self.indices = [i for i in self.indices if self.archive.records[i]['emotion'] in class_to_idx]
+        self.targets = [class_to_idx[self.archive.records[i]['emotion']] for i in self.indices]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        image = Image.fromarray(self.archive.image(self.indices[idx])[:, :, ::-1].copy())
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[idx]
+
+
+def _split_paths(cache_dir, split):
+    return os.path.join(cache_dir, f"{split}_images.npy"), os.path.join(cache_dir, f"{split}_labels.npy")
+
+
+def pack_dataset(data_dir, cache_dir, splits=('train', 'test'), size=48):
+    """Decode the ImageFolder splits of `data_dir` once into uint8 arrays.
+
+    Each split becomes `<split>_images.npy` (N, size, size) for grayscale datasets
+    such as FER2013, or (N, size, size, 3), plus `<split>_labels.npy`. The channel
+    count follows the first image. Returns the pack metadata.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta = {'size': size, 'splits': {}}
+    for split in splits:
+        folder = datasets.ImageFolder(os.path.join(data_dir, split))
+        if 'classes' in meta and folder.classes != meta['classes']:
+            raise RuntimeError(f"Class folders of {split} differ from {splits[0]}")
+        meta['classes'] = folder.classes
+        if 'channels' not in meta:
+            with Image.open(folder.samples[0][0]) as first:
+                meta['channels'] = 1 if first.mode in ('L', 'I;16', 'I') else 3
+        mode = 'L' if meta['channels'] == 1 else 'RGB'
+        shape = (len(folder.samples), size, size) + (() if meta['channels'] == 1 else (3,))
+
+        images_path, labels_path = _split_paths(cache_dir, split)
+        # Written through a memmap, so packing never holds the split in memory
+        images = np.lib.format.open_memmap(images_path + '.tmp', mode='w+', dtype=np.uint8, shape=shape)
+        labels = np.empty(len(folder.samples), dtype=np.int64)
+        for i, (path, label) in enumerate(folder.samples):
+            with Image.open(path) as img:
+                img = img.convert(mode)
+                if img.size != (size, size):
+                    img = img.resize((size, size), Image.BILINEAR)
+                images[i] = np.asarray(img)
+            labels[i] = label
+        images.flush()
+        del images
+        os.replace(images_path + '.tmp', images_path)
+        np.save(labels_path, labels)
+        meta['splits'][split] = len(labels)
+        print(f"[INFO] Packed {len(labels)} {split} images into {images_path}")
+
+    # Written last: its presence marks a complete cache
+    with open(os.path.join(cache_dir, PACK_META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _load_pack_meta(cache_dir):
+    with open(os.path.join(cache_dir, PACK_META_FILE), 'r') as f:
+        return json.load(f)
+
+
+class MemmapDataset(Dataset):
+    """A split packed by `pack_dataset`, read from the memory-mapped array without per-sample file I/O.
+
+    Images are returned as RGB PIL images (like ImageFolder's loader), so the usual
+    torchvision transforms apply. With raw=True they are returned as stored, as
+    (C, H, W) uint8 tensors, for batch-level augmentation.
+    """
+
+    def __init__(self, cache_dir, split, transform=None, raw=False):
+        meta = _load_pack_meta(cache_dir)
+        self.classes = meta['classes']
+        self.images_path, labels_path = _split_paths(cache_dir, split)
+        self.targets = np.load(labels_path)
+        self.transform = transform
+        self.raw = raw
+        self._images = None  # opened lazily, so DataLoader workers map the file themselves
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_images'] = None
+        return state
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode='r')
+        return self._images
+
+    def __getitem__(self, idx):
+        if self.raw:
+            image = torch.from_numpy(np.array(self.images[idx]))
+            image = image.unsqueeze(0) if image.ndim == 2 else image.permute(2, 0, 1)
+            return image, int(self.targets[idx])
+        image = Image.fromarray(np.asarray(self.images[idx])).convert('RGB')
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, int(self.targets[idx])
+
+
+def _val_cache_path(cache_dir, split, img_size, channels=3):
+    suffix = '_gray' if channels == 1 else ''
+    return os.path.join(cache_dir, f"{split}_val{img_size}{suffix}.npy")
+
+
+def cache_val_split(cache_dir, split, img_size, resize, channels=3):
+    """Apply the deterministic validation resize/crop to a packed split once.
+
+    The result is stored as `<split>_val<img_size>.npy` (`_gray` for channels=1),
+    an (N, img_size, img_size, channels) uint8 array next to the pack that is reused
+    by later epochs and runs.
+
+    Args:
+        resize: PIL transform (Resize + CenterCrop) producing img_size x img_size images
+    Returns:
+        Path of the cached array
+    """
+    path = _val_cache_path(cache_dir, split, img_size, channels)
+    if os.path.exists(path):
+        return path
+    source = MemmapDataset(cache_dir, split, transform=resize)
+    cached = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.uint8,
+                                       shape=(len(source), img_size, img_size, channels))
+    for i in range(len(source)):
+        cached[i] = np.asarray(source[i][0]).reshape(img_size, img_size, channels)
+    cached.flush()
+    del cached
+    os.replace(path + '.tmp', path)
+    print(f"[INFO] Cached preprocessed {split} split at {img_size}x{img_size}: {path}")
+    return path
+
+
+class PreprocessedDataset(Dataset):
+    """Already resized/cropped uint8 images (see `cache_val_split`); only scaling and normalization run per sample."""
+
+    def __init__(self, cache_dir, split, img_size, mean=IMAGENET_MEAN, std=IMAGENET_STD, channels=3):
+        self.classes = _load_pack_meta(cache_dir)['classes']
+        self.targets = np.load(_split_paths(cache_dir, split)[1])
+        self.images_path = _val_cache_path(cache_dir, split, img_size, channels)
+        self.mean = torch.tensor(mean).view(-1, 1, 1)
+        self.std = torch.tensor(std).view(-1, 1, 1)
+        self._images = None
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_images'] = None
+        return state
+
+    def __getitem__(self, idx):
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode='r')
+        image = torch.from_numpy(np.array(self._images[idx])).permute(2, 0, 1).float().div_(255)
+        return (image - self.mean) / self.std, int(self.targets[idx])
@@ -2,19 +2,162 @@ import torch
 import torch.nn as nn
 from torchvision import models
 
+from model.pruning import apply_pruned_channels
 
-def get_model(num_classes=7, pretrained=True):
-    """Return a ResNet18 model with the final layer adapted to num_classes."""
-    model = models.resnet18(pretrained=pretrained)
-    in_features = model.fc.in_features
-    model.fc = nn.Linear(in_features, num_classes)
+
+ARCHITECTURES = ('resnet18', 'mobilenet_v3_small', 'shufflenet_v2', 'fer_cnn')
+
+# Default square input resolution for each architecture
+DEFAULT_IMG_SIZE = {
+    'resnet18': 224,
+    'mobilenet_v3_small': 224,
+    'shufflenet_v2': 224,
+    'fer_cnn': 48,
+}
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+# Single-channel inputs: the ImageNet statistics averaged over RGB
+GRAY_MEAN = [0.449]
+GRAY_STD = [0.226]
+
+# 'imagenet': the torchvision stem (stride 2 conv + max pool, for 224x224);
+# 'small': stride 1 and no max pool, so 48x48 faces keep spatial resolution
+STEMS = ('imagenet', 'small')
+
+
+class FerCNN(nn.Module):
+    """Compact CNN for native 48x48 FER2013 faces (four conv blocks, ~1.2M parameters)."""
+
+    def __init__(self, num_classes=7, in_channels=3):
+        super().__init__()
+
+        def block(cin, cout):
+            return nn.Sequential(
+                nn.Conv2d(cin, cout, 3, padding=1, bias=False),
+                nn.BatchNorm2d(cout),
+                nn.ReLU(inplace=True),
+                nn.Conv2d(cout, cout, 3, padding=1, bias=False),
+                nn.BatchNorm2d(cout),
+                nn.ReLU(inplace=True),
+                nn.MaxPool2d(2),
+            )
+
+        self.features = nn.Sequential(
+            block(in_channels, 32),
+            block(32, 64),
+            block(64, 128),
+            block(128, 256),
+        )
+        self.pool = nn.AdaptiveAvgPool2d(1)
+        self.dropout = nn.Dropout(0.3)
+        self.fc = nn.Linear(256, num_classes)
+
+    def forward(self, x):
+        x = self.pool(self.features(x)).flatten(1)
+        return self.fc(self.dropout(x))
+
+
+def default_stem(img_size, channels=3):
+    """Stem used when none is given: 'small' for native-resolution grayscale input, else 'imagenet'."""
+    return 'small' if channels == 1 and img_size < 112 else 'imagenet'
+
+
+def _adapt_conv(conv, in_channels, stride=None):
+    """Copy of a stem conv with `in_channels` inputs (RGB filters summed for grayscale) and optional new stride."""
+    new = nn.Conv2d(in_channels, conv.out_channels, conv.kernel_size, stride=stride or conv.stride,
+                    padding=conv.padding, bias=conv.bias is not None)
+    with torch.no_grad():
+        weight = conv.weight
+        if in_channels != weight.size(1):
+            # Summing the pretrained RGB filters keeps the response to a gray image unchanged
+            weight = weight.sum(dim=1, keepdim=True).repeat(1, in_channels, 1, 1) / in_channels
+        new.weight.copy_(weight)
+        if conv.bias is not None:
+            new.bias.copy_(conv.bias)
+    return new
+
+
+def adapt_stem(model, arch, in_channels=3, stem='imagenet'):
+    """Change the input channels and/or the downsampling of the first layers of a torchvision backbone."""
+    if stem not in STEMS:
+        raise ValueError(f"Unknown stem: {stem} (choose from {', '.join(STEMS)})")
+    if in_channels == 3 and stem == 'imagenet':
+        return model
+    stride = 1 if stem == 'small' else None
+    if arch == 'resnet18':
+        model.conv1 = _adapt_conv(model.conv1, in_channels, stride)
+        if stem == 'small':
+            model.maxpool = nn.Identity()
+    elif arch == 'mobilenet_v3_small':
+        model.features[0][0] = _adapt_conv(model.features[0][0], in_channels, stride)
+    elif arch == 'shufflenet_v2':
+        model.conv1[0] = _adapt_conv(model.conv1[0], in_channels, stride)
+        if stem == 'small':
+            model.maxpool = nn.Identity()
+    return model
+
+
+def get_model(num_classes=7, pretrained=True, arch='resnet18', in_channels=3, stem='imagenet', pruned_channels=None):
+    """Return a backbone from ARCHITECTURES with the final layer adapted to num_classes.
+
+    `in_channels=1` takes grayscale input; `stem='small'` removes the stem downsampling
+    for native-resolution (e.g. 48x48) input. fer_cnn is already built for 48x48.
+    `pruned_channels` (from a pruned checkpoint, see model/pruning.py) narrows the
+    residual blocks to the saved widths.
+    """
+    if arch == 'resnet18':
+        model = models.resnet18(pretrained=pretrained)
+        in_features = model.fc.in_features
+        model.fc = nn.Linear(in_features, num_classes)
+    elif arch == 'mobilenet_v3_small':
+        model = models.mobilenet_v3_small(pretrained=pretrained)
+        in_features = model.classifier[-1].in_features
+        model.classifier[-1] = nn.Linear(in_features, num_classes)
+    elif arch == 'shufflenet_v2':
+        model = models.shufflenet_v2_x1_0(pretrained=pretrained)
+        in_features = model.fc.in_features
+        model.fc = nn.Linear(in_features, num_classes)
+    elif arch == 'fer_cnn':
+        # Trained from scratch, there are no pretrained weights
+        return FerCNN(num_classes=num_classes, in_channels=in_channels)
+    else:
+        raise ValueError(f"Unknown architecture: {arch} (choose from {', '.join(ARCHITECTURES)})")
+    model = adapt_stem(model, arch, in_channels, stem)
+    if pruned_channels:
+        apply_pruned_channels(model, pruned_channels)
     return model
 
 
+def make_input_spec(arch='resnet18', img_size=None, channels=3):
+    """Describe the preprocessing a model expects; stored in checkpoints as `input_spec`."""
+    return {
+        'size': img_size or DEFAULT_IMG_SIZE[arch],
+        'channels': channels,
+        'mean': list(GRAY_MEAN if channels == 1 else IMAGENET_MEAN),
+        'std': list(GRAY_STD if channels == 1 else IMAGENET_STD),
+    }
+
+
+def get_input_spec(checkpoint):
+    """Return the input spec of a checkpoint; older checkpoints were ResNet18 at 224x224."""
+    return checkpoint.get('input_spec') or make_input_spec(checkpoint.get('arch', 'resnet18'))
+
+
+def get_model_kwargs(checkpoint):
+    """`get_model` arguments that rebuild the network of a checkpoint (besides `pretrained`)."""
+    return {
+        'num_classes': checkpoint.get('num_classes', 7),
+        'arch': checkpoint.get('arch', 'resnet18'),
+        'in_channels': get_input_spec(checkpoint)['channels'],
+        'stem': checkpoint.get('stem', 'imagenet'),
+        'pruned_channels': checkpoint.get('pruned_channels'),
+    }
+
+
 def load_checkpoint(path, device='cpu'):
     """Load a checkpoint saved by `save_checkpoint` and return (model, checkpoint_dict)."""
     checkpoint = torch.load(path, map_location=device)
-    num_classes = checkpoint.get('num_classes', 7)
-    model = get_model(num_classes=num_classes, pretrained=False)
+    model = get_model(pretrained=False, **get_model_kwargs(checkpoint))
     model.load_state_dict(checkpoint['model_state_dict'])
     return model, checkpoint
@@ -0,0 +1,86 @@
+import torch
+import torch.nn as nn
+from torchvision.models.resnet import BasicBlock
+
+
+# Architectures whose residual blocks can be pruned (torchvision BasicBlock)
+PRUNABLE_ARCHITECTURES = ('resnet18',)
+
+
+def prunable_blocks(model):
+    """(name, block) of every residual block; quantizable torchvision blocks subclass BasicBlock."""
+    return [(name, module) for name, module in model.named_modules() if isinstance(module, BasicBlock)]
+
+
+def _conv_like(conv, in_channels, out_channels):
+    return nn.Conv2d(in_channels, out_channels, conv.kernel_size, stride=conv.stride, padding=conv.padding,
+                     dilation=conv.dilation, groups=conv.groups, bias=conv.bias is not None)
+
+
+def _shrink_block(block, keep):
+    """Keep the inner channels `keep` of a block: conv1 filters, bn1 and the matching conv2 inputs.
+
+    The block's input and output width is untouched, so residual connections and
+    downsample layers stay valid and the result is an ordinary dense network.
+    """
+    conv1 = _conv_like(block.conv1, block.conv1.in_channels, len(keep))
+    bn1 = nn.BatchNorm2d(len(keep), eps=block.bn1.eps, momentum=block.bn1.momentum)
+    conv2 = _conv_like(block.conv2, len(keep), block.conv2.out_channels)
+    with torch.no_grad():
+        conv1.weight.copy_(block.conv1.weight[keep])
+        if conv1.bias is not None:
+            conv1.bias.copy_(block.conv1.bias[keep])
+        for attr in ('weight', 'bias', 'running_mean', 'running_var'):
+            getattr(bn1, attr).copy_(getattr(block.bn1, attr)[keep])
+        conv2.weight.copy_(block.conv2.weight[:, keep])
+        if conv2.bias is not None:
+            conv2.bias.copy_(block.conv2.bias)
+    block.conv1, block.bn1, block.conv2 = conv1, bn1, conv2
+
+
+def filter_importance(block):
+    """L1 norm of each conv1 filter, scaled by the magnitude of its BatchNorm weight."""
+    l1 = block.conv1.weight.detach().abs().sum(dim=(1, 2, 3))
+    return l1 * block.bn1.weight.detach().abs()
+
+
+def prune_model(model, sparsity, round_to=8):
+    """Remove the least important inner channels of every residual block in place.
+
+    Args:
+        model: ResNet from `get_model` (fp32), possibly pruned before
+        sparsity: Fraction of each block's original inner channels to remove (0-1);
+            the original width is the block's output width, so levels can be applied
+            one after another
+        round_to: Keep a multiple of this many channels (SIMD-friendly widths)
+
+    Returns:
+        dict block name -> kept channels, stored in checkpoints as `pruned_channels`
+    """
+    if not 0 <= sparsity < 1:
+        raise ValueError(f"Sparsity must be in [0, 1), got {sparsity}")
+    blocks = prunable_blocks(model)
+    if not blocks:
+        raise ValueError(f"No prunable blocks, structured pruning supports {', '.join(PRUNABLE_ARCHITECTURES)}")
+    pruned_channels = {}
+    for name, block in blocks:
+        width = block.conv2.out_channels
+        keep_count = max(round_to, int(round(width * (1 - sparsity) / round_to)) * round_to)
+        keep_count = min(keep_count, block.conv1.out_channels)
+        if keep_count < block.conv1.out_channels:
+            keep = torch.argsort(filter_importance(block), descending=True)[:keep_count]
+            _shrink_block(block, torch.sort(keep).values)
+        pruned_channels[name] = block.conv1.out_channels
+    return pruned_channels
+
+
+def apply_pruned_channels(model, pruned_channels):
+    """Give a freshly built model the layer shapes of a pruned checkpoint (weights are loaded afterwards)."""
+    for name, block in prunable_blocks(model):
+        if name in pruned_channels:
+            _shrink_block(block, torch.arange(pruned_channels[name]))
+    return model
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
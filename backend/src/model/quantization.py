@@ -0,0 +1,90 @@
+import warnings
+
+import torch
+import torch.nn as nn
+from torchvision.models import quantization as quantized_models
+
+from model.model import get_model, get_model_kwargs, adapt_stem
+from model.pruning import apply_pruned_channels
+
+
+QUANTIZATION_MODES = ('dynamic', 'static')
+
+# Architectures with a quantization-ready torchvision twin (needed for static mode)
+STATIC_ARCHITECTURES = ('resnet18', 'shufflenet_v2')
+
+
+def get_quantizable_model(num_classes=7, arch='resnet18', in_channels=3, stem='imagenet', pruned_channels=None):
+    """Return torchvision's quantization-ready variant of `arch` (QuantStub/DeQuantStub, fusable blocks).
+
+    Its parameter names match `get_model`, so fp32 state dicts load directly.
+    """
+    if arch == 'resnet18':
+        model = quantized_models.resnet18(pretrained=False, quantize=False)
+    elif arch == 'shufflenet_v2':
+        model = quantized_models.shufflenet_v2_x1_0(pretrained=False, quantize=False)
+    else:
+        raise ValueError(f"Static quantization supports {', '.join(STATIC_ARCHITECTURES)}, not {arch}")
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    model = adapt_stem(model, arch, in_channels, stem)
+    if pruned_channels:
+        apply_pruned_channels(model, pruned_channels)
+    return model
+
+
+def quantize_dynamic(model):
+    """Dynamic INT8 quantization: weights of Linear layers are stored as int8."""
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def prepare_static(state_dict, num_classes=7, backend='fbgemm', arch='resnet18', in_channels=3, stem='imagenet',
+                   pruned_channels=None):
+    """Fuse conv/bn/relu and insert observers for post-training static quantization.
+
+    Run calibration batches through the returned model, then call `convert_static`.
+    """
+    torch.backends.quantized.engine = backend
+    model = get_quantizable_model(num_classes, arch, in_channels, stem, pruned_channels)
+    model.load_state_dict(state_dict)
+    model.eval()
+    model.fuse_model()
+    model.qconfig = torch.quantization.get_default_qconfig(backend)
+    torch.quantization.prepare(model, inplace=True)
+    return model
+
+
+def convert_static(model):
+    """Convert a calibrated model from `prepare_static` to INT8 kernels."""
+    return torch.quantization.convert(model.eval(), inplace=False)
+
+
+def build_quantized_model(mode, num_classes=7, backend='fbgemm', arch='resnet18', in_channels=3, stem='imagenet',
+                          pruned_channels=None):
+    """Return an uncalibrated INT8 model with the module structure of a saved quantized checkpoint."""
+    if mode == 'dynamic':
+        return quantize_dynamic(get_model(num_classes=num_classes, pretrained=False, arch=arch,
+                                          in_channels=in_channels, stem=stem,
+                                          pruned_channels=pruned_channels).eval())
+    if mode == 'static':
+        skeleton = get_quantizable_model(num_classes, arch, in_channels, stem, pruned_channels)
+        # Observers are empty here; scales and zero points come from the loaded state dict
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return convert_static(prepare_static(skeleton.state_dict(), num_classes, backend, arch, in_channels, stem,
+                                                 pruned_channels))
+    raise ValueError(f"Unsupported quantization mode: {mode}")
+
+
+def load_quantized_checkpoint(path):
+    """Load a checkpoint saved by quantize.py and return (model, checkpoint_dict). CPU only."""
+    # Quantized state dicts hold packed params, which the weights-only loader rejects
+    checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+    mode = checkpoint.get('quantization')
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"{path} is not a quantized checkpoint")
+    backend = checkpoint.get('quantization_backend', 'fbgemm')
+    torch.backends.quantized.engine = backend
+    model = build_quantized_model(mode, backend=backend, **get_model_kwargs(checkpoint))
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+    return model, checkpoint
@@ -0,0 +1,149 @@
+"""
+Process-wide cache of loaded emotion predictors and face detectors.
+
+Loading a checkpoint (`torch.load`) or parsing a cascade XML takes seconds, so
+long-running services share instances through `registry` instead of building
+them per request. Entries are keyed by their construction parameters, evicted
+least-recently-used once the estimated memory exceeds the cap, and reloaded when
+the underlying file's mtime changes.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from face_detection import OpenCVFaceDetector, DEFAULT_CASCADE_PATH
+from inference import create_predictor
+
+
+# Memory cap for cached models, overridable per process
+DEFAULT_MAX_MEMORY_MB = int(os.environ.get('EMOTION_MODEL_CACHE_MB', 1024))
+
+
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _estimate_bytes(value, path, max_batch_size=64):
+    """Rough resident size: serialized model size plus one thread's preprocessing buffers.
+
+    The buffers are sized from the predictor's preprocessing options instead of the
+    `preprocess` property, which would allocate them in the loading thread.
+    """
+    size = os.path.getsize(path) if path and os.path.exists(path) else 0
+    kwargs = getattr(value, '_preprocess_kwargs', None)
+    if kwargs is not None:
+        width, height = kwargs['size']
+        # uint8 resized crops plus the float32 NCHW batch
+        size += max_batch_size * width * height * kwargs['channels'] * (1 + 4)
+    return size
+
+
+class ModelRegistry:
+    """Thread-safe LRU cache of predictors and detectors with a memory cap."""
+
+    def __init__(self, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+        self.max_bytes = max_memory_mb * 2**20
+        self._entries = OrderedDict()  # key -> {'value', 'path', 'mtime', 'bytes'}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_predictor(self, model_path, device='cpu', backend='torch', quantized=False):
+        """Return a shared predictor (see `inference.create_predictor`)."""
+        model_path = os.path.abspath(model_path)
+        key = ('predictor', model_path, device, backend, bool(quantized))
+        return self._get(key, model_path,
+                         lambda: create_predictor(model_path, device=device, backend=backend, quantized=quantized))
+
+    def get_detector(self, cascade_path=None, scale_factor=1.1, min_neighbors=10, min_size=(300, 300),
+                     detect_min_size=None):
+        """Return a shared OpenCVFaceDetector for the given detection parameters."""
+        cascade_path = os.path.abspath(cascade_path or DEFAULT_CASCADE_PATH)
+        key = ('detector', cascade_path, scale_factor, min_neighbors, tuple(min_size), detect_min_size)
+        return self._get(key, cascade_path,
+                         lambda: OpenCVFaceDetector(cascade_path=cascade_path, scale_factor=scale_factor,
+                                                    min_neighbors=min_neighbors, min_size=tuple(min_size),
+                                                    detect_min_size=detect_min_size))
+
+    def _lookup(self, key, mtime):
+        """Return a valid cached value or None; drops entries whose file changed. Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['mtime'] != mtime:
+            self._remove(key)
+            self.invalidations += 1
+            print(f"[INFO] {entry['path']} changed on disk, reloading")
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry['value']
+
+    def _get(self, key, path, loader):
+        mtime = _file_mtime(path)
+        with self._lock:
+            value = self._lookup(key, mtime)
+            if value is not None:
+                return value
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so other keys stay available; the
+        # per-key lock makes concurrent requests for the same model wait for one load
+        with key_lock:
+            with self._lock:
+                value = self._lookup(key, mtime)
+                if value is not None:
+                    return value
+            value = loader()
+            size = _estimate_bytes(value, path)
+            with self._lock:
+                self._entries[key] = {'value': value, 'path': path, 'mtime': mtime, 'bytes': size}
+                self.total_bytes += size
+                self.misses += 1
+                self._evict(keep=key)
+            return value
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry['bytes']
+
+    def _evict(self, keep):
+        """Drop least-recently-used entries until under the cap (never `keep`). Caller holds the lock."""
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            print(f"[INFO] Evicting {key[0]} {self._entries[key]['path']} from model cache")
+            self._remove(key)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': [{'kind': key[0], 'path': entry['path'], 'mb': entry['bytes'] / 2**20}
+                            for key, entry in self._entries.items()],
+                'total_mb': self.total_bytes / 2**20,
+                'max_mb': self.max_bytes / 2**20,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+# Shared by run_stream_core and the FastAPI app
+registry = ModelRegistry()
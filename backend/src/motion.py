@@ -0,0 +1,81 @@
+"""
+Motion gate placed in front of face detection.
+
+Frames are compared at a small working resolution; when the scene has not
+changed since the last processed frame, detection and classification can be
+skipped and the previous results reused.
+"""
+
+import cv2
+import numpy as np
+
+
+MOTION_METHODS = ('diff', 'mog2')
+
+
+class MotionGate:
+    """Decide per frame whether anything moved, counting gated and processed frames."""
+
+    def __init__(self, method='diff', pixel_threshold=25, min_changed_ratio=0.01, work_width=160, max_gated=0):
+        """
+        Args:
+            method: 'diff' (difference to the last processed frame) or 'mog2' (background subtractor)
+            pixel_threshold: Gray-level change for a pixel to count as changed ('diff')
+            min_changed_ratio: Fraction of changed pixels that counts as motion (sensitivity)
+            work_width: Width frames are downscaled to before comparison
+            max_gated: Force processing after this many consecutive gated frames (0 = never)
+        """
+        if method not in MOTION_METHODS:
+            raise ValueError(f"Unknown motion gate method: {method}")
+        self.method = method
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_ratio = min_changed_ratio
+        self.work_width = work_width
+        self.max_gated = max_gated
+        self.reference = None
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False) if method == 'mog2' else None
+        self.consecutive_gated = 0
+        self.gated = 0
+        self.processed = 0
+
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.work_width / float(width)
+        small = cv2.resize(frame, (self.work_width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed_ratio(self, small):
+        """Fraction of pixels that differ from the reference / background model."""
+        if self.method == 'mog2':
+            mask = self.subtractor.apply(small)
+            return np.count_nonzero(mask) / mask.size
+        if self.reference is None:
+            return 1.0
+        diff = cv2.absdiff(small, self.reference)
+        return np.count_nonzero(diff > self.pixel_threshold) / diff.size
+
+    def has_motion(self, frame):
+        """Return True if frame should be processed, False if previous results can be reused."""
+        small = self._prepare(frame)
+        motion = bool(self.changed_ratio(small) >= self.min_changed_ratio)
+        if self.max_gated and self.consecutive_gated >= self.max_gated:
+            motion = True
+
+        if motion:
+            # Compare later frames with this one, so slow drift eventually triggers too
+            self.reference = small
+            self.consecutive_gated = 0
+            self.processed += 1
+        else:
+            self.consecutive_gated += 1
+            self.gated += 1
+        return motion
+
+    def stats(self):
+        total = self.gated + self.processed
+        return {
+            'gated': self.gated,
+            'processed': self.processed,
+            'gated_ratio': self.gated / total if total else 0.0,
+        }
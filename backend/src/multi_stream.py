@@ -0,0 +1,444 @@
+"""
+Long-running multi-camera emotion service.
+
+Every camera gets a capture thread and its own face detector, but all cameras
+share one emotion predictor: `BatchScheduler` collects the face crops submitted
+by the streams into common batches, taking requests round-robin across streams
+(so a busy camera cannot starve the others) and dispatching a batch once it is
+full or its oldest request has waited `max_latency_ms`. Adding a camera therefore
+costs decoding and detection only.
+
+    python ./backend/src/multi_stream.py --sources 0 rtsp://cam1/stream rtsp://cam2/stream
+    fastapi run ./backend/src/multi_stream.py
+"""
+
+import os
+import sys
+import time
+import argparse
+import json
+import asyncio
+import threading
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import cv2
+
+from inference import PREDICTOR_BACKENDS, EMOTION_CLASSES
+from face_detection import OpenCVFaceDetector
+from model_cache import registry
+from tracking import FaceTracker, TRACKER_TYPES
+from capture import FrameCapture
+from pipeline import extract_face_crops, make_face_entry
+
+
+current_path = os.path.abspath(__file__)
+current_dir = os.path.dirname(current_path)
+parent_dir = os.path.dirname(current_dir)
+
+DEFAULT_MODEL = os.path.join(parent_dir, 'checkpoints', 'best.pth')
+
+
+class _BatchRequest:
+    __slots__ = ('stream_id', 'crops', 'future', 'submitted_at')
+
+    def __init__(self, stream_id, crops):
+        self.stream_id = stream_id
+        self.crops = crops
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+
+
+class BatchScheduler:
+    """Batch face crops from many streams into shared `predict_batch` calls."""
+
+    def __init__(self, predictor, max_batch_size=32, max_latency_ms=50):
+        """
+        Args:
+            predictor: Emotion predictor shared by all streams
+            max_batch_size: Faces per batch (a single frame with more faces is sent alone)
+            max_latency_ms: Dispatch a partial batch once its oldest request waited this long
+        """
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self._queues = OrderedDict()  # stream_id -> deque of _BatchRequest, in round-robin order
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+        self.batches = 0
+        self.requests = 0
+        self.faces = 0
+        self.wait_total = 0.0
+        self.faces_per_stream = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, stream_id, crops):
+        """Queue the face crops of one frame. Returns a Future resolving to the predictions."""
+        request = _BatchRequest(stream_id, crops)
+        if not crops:
+            request.future.set_result([])
+            return request.future
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Batch scheduler is stopped")
+            self._queues.setdefault(stream_id, deque()).append(request)
+            self._cond.notify()
+        return request.future
+
+    def _oldest(self):
+        return min((q[0].submitted_at for q in self._queues.values() if q), default=None)
+
+    def _pending_faces(self):
+        return sum(len(r.crops) for q in self._queues.values() for r in q)
+
+    def _take_batch(self):
+        """Take requests round-robin over streams until the batch is full. Caller holds the lock."""
+        batch, size = [], 0
+        while size < self.max_batch_size:
+            progressed = False
+            for stream_id in list(self._queues):
+                queue = self._queues[stream_id]
+                if not queue:
+                    continue
+                if batch and size + len(queue[0].crops) > self.max_batch_size:
+                    continue
+                request = queue.popleft()
+                batch.append(request)
+                size += len(request.crops)
+                progressed = True
+                # Move the stream to the back so the next batch starts with another one
+                self._queues.move_to_end(stream_id)
+                if size >= self.max_batch_size:
+                    break
+            if not progressed:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Wait until a batch is full or the oldest request reaches its deadline
+                while not self._stopped:
+                    oldest = self._oldest()
+                    if oldest is None:
+                        self._cond.wait()
+                        continue
+                    remaining = oldest + self.max_latency - time.monotonic()
+                    if self._pending_faces() >= self.max_batch_size or remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                if self._stopped and self._oldest() is None:
+                    return
+                batch = self._take_batch()
+
+            crops = [crop for request in batch for crop in request.crops]
+            try:
+                preds = self.predictor.predict_batch(crops)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            now = time.monotonic()
+            offset = 0
+            for request in batch:
+                request.future.set_result(preds[offset:offset + len(request.crops)])
+                offset += len(request.crops)
+                self.wait_total += now - request.submitted_at
+                self.faces_per_stream[request.stream_id] = self.faces_per_stream.get(request.stream_id, 0) + len(request.crops)
+            self.batches += 1
+            self.requests += len(batch)
+            self.faces += len(crops)
+
+    def remove_stream(self, stream_id):
+        with self._cond:
+            self._queues.pop(stream_id, None)
+
+    def stop(self):
+        """Dispatch what is queued, then stop the scheduler thread."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'faces': self.faces,
+            'mean_batch_size': self.faces / self.batches if self.batches else 0.0,
+            'mean_wait_ms': 1000.0 * self.wait_total / self.requests if self.requests else 0.0,
+            'faces_per_stream': dict(self.faces_per_stream),
+        }
+
+
+class CameraStream:
+    """One source: capture thread, own detector and tracker, classification via the scheduler."""
+
+    def __init__(self, stream_id, source, scheduler, interval=1, detector_params=None, tracker=None,
+                 history=100):
+        """
+        Args:
+            stream_id: Name of the stream in status reports
+            source: Webcam id, video file or stream URL
+            scheduler: Shared BatchScheduler
+            interval: Detect every Nth captured frame
+            detector_params: OpenCVFaceDetector kwargs
+            tracker: Optional tracker type for stable face ids ('iou', 'kcf', 'mosse')
+            history: Number of recent frame results kept for status queries
+        """
+        self.stream_id = stream_id
+        self.source = source
+        self.scheduler = scheduler
+        self.interval = max(1, interval)
+        # A detector per stream: cascades are small, and this keeps streams from serializing on one lock
+        self.detector = OpenCVFaceDetector(**(detector_params or {}))
+        self.tracker = FaceTracker(tracker) if tracker else None
+        self.capture = FrameCapture(source)
+        self.recent = deque(maxlen=history)
+        self.emotion_counts = {emotion: 0 for emotion in EMOTION_CLASSES}
+        self.processed = 0
+        self.error = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self.started_at = datetime.now()
+
+    def start(self):
+        self.capture.start()
+        self._thread = threading.Thread(target=self._run, name=f"camera-{self.stream_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        frame_idx = 0
+        try:
+            while not self._stopped.is_set():
+                item = self.capture.read(timeout=1.0)
+                if item is None:
+                    if self.capture.finished:
+                        print(f"[INFO] Stream {self.stream_id} ended")
+                        break
+                    continue
+                if frame_idx % self.interval == 0:
+                    self._process(frame_idx, item)
+                    self.capture.record_result(item)
+                frame_idx += 1
+        except Exception as e:
+            self.error = str(e)
+            print(f"[ERROR] Stream {self.stream_id} failed: {e}")
+
+    def _process(self, frame_idx, item):
+        frame = item.frame
+        crops = extract_face_crops(frame, self.detector.detect_faces(frame))
+        if not crops:
+            return
+        preds = self.scheduler.submit(self.stream_id, [cv2.resize(crop, (48, 48)) for _, _, crop in crops]).result()
+        tracks = self.tracker.update(frame, [box for _, box, _ in crops]) if self.tracker is not None else None
+
+        faces = []
+        for i, ((idx, box, _), pred) in enumerate(zip(crops, preds)):
+            entry = make_face_entry(tracks[i].track_id if tracks is not None else idx, box, pred)
+            faces.append(entry)
+            if entry['emotion'] in self.emotion_counts:
+                self.emotion_counts[entry['emotion']] += 1
+        self.recent.append({
+            'frame_index': frame_idx,
+            'timestamp': datetime.now().isoformat(),
+            'faces': faces
+        })
+        self.processed += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.capture.stop()
+        if self._thread is not None:
+            self._thread.join()
+        self.scheduler.remove_stream(self.stream_id)
+
+    def status(self, include_frames=False):
+        counts = self.emotion_counts
+        status = {
+            'stream_id': self.stream_id,
+            'source': self.source,
+            'started': self.started_at.isoformat(),
+            'running': self._thread is not None and self._thread.is_alive(),
+            'error': self.error,
+            'processed_frames': self.processed,
+            'emotion_counts': dict(counts),
+            'most_frequent_emotion': max(counts, key=counts.get) if any(counts.values()) else None,
+            'capture': self.capture.stats(),
+            'latest': self.recent[-1] if self.recent else None,
+        }
+        if include_frames:
+            status['frames'] = list(self.recent)
+        return status
+
+
+class MultiCameraServer:
+    """Manage many CameraStreams sharing one predictor and one BatchScheduler."""
+
+    def __init__(self, model_path, device='cpu', backend='torch', quantized=False, max_batch_size=32,
+                 max_latency_ms=50):
+        predictor = registry.get_predictor(model_path, device=device, backend=backend, quantized=quantized)
+        self.scheduler = BatchScheduler(predictor, max_batch_size=max_batch_size,
+                                        max_latency_ms=max_latency_ms).start()
+        self.streams = {}
+        # Auto ids are never reused, so removing cam0 does not make the next add collide with cam1
+        self._next_id = itertools.count()
+        self._starting = set()  # ids reserved by add_stream calls still opening their source
+        self._lock = threading.Lock()
+
+    def add_stream(self, source, stream_id=None, **kwargs):
+        """Start a stream (kwargs: CameraStream options). Returns its id."""
+        with self._lock:
+            taken = self.streams.keys() | self._starting
+            if not stream_id:
+                stream_id = next(f"cam{i}" for i in self._next_id if f"cam{i}" not in taken)
+            if stream_id in taken:
+                raise ValueError(f"Stream {stream_id} already exists")
+            self._starting.add(stream_id)
+        # Opening the source (possibly RTSP) and loading the cascade can be slow; don't hold the lock
+        try:
+            stream = CameraStream(stream_id, source, self.scheduler, **kwargs).start()
+        except BaseException:
+            with self._lock:
+                self._starting.discard(stream_id)
+            raise
+        with self._lock:
+            self._starting.discard(stream_id)
+            self.streams[stream_id] = stream
+        print(f"[INFO] Added stream {stream_id}: {source}")
+        return stream_id
+
+    def remove_stream(self, stream_id):
+        with self._lock:
+            stream = self.streams.pop(stream_id, None)
+        if stream is None:
+            raise KeyError(stream_id)
+        stream.stop()
+        print(f"[INFO] Removed stream {stream_id}")
+
+    def status(self):
+        with self._lock:
+            streams = list(self.streams.values())
+        return {
+            'streams': [stream.status() for stream in streams],
+            'scheduler': self.scheduler.stats(),
+        }
+
+    def stop(self):
+        for stream_id in list(self.streams):
+            self.remove_stream(stream_id)
+        self.scheduler.stop()
+
+
+app = FastAPI()
+server: Optional[MultiCameraServer] = None
+
+
+@app.on_event("startup")
+async def start_server():
+    global server
+    server = await asyncio.to_thread(MultiCameraServer, os.environ.get('EMOTION_MODEL', DEFAULT_MODEL),
+                                     backend=os.environ.get('EMOTION_BACKEND', 'torch'))
+
+
+@app.on_event("shutdown")
+async def stop_server():
+    if server is not None:
+        server.stop()
+
+
+@app.post("/streams")
+async def add_stream(source: str,
+                     stream_id: Optional[str] = None,
+                     interval: int = 5,
+                     detect_min_size: Optional[int] = None,
+                     tracker: Optional[str] = None):
+    try:
+        # Opening the source and loading the cascade block, keep them off the event loop
+        stream_id = await asyncio.to_thread(server.add_stream, source, stream_id=stream_id, interval=interval,
+                                            tracker=tracker, detector_params={'detect_min_size': detect_min_size})
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {'stream_id': stream_id}
+
+
+@app.get("/streams")
+async def list_streams():
+    return await asyncio.to_thread(server.status)
+
+
+@app.get("/streams/{stream_id}")
+async def get_stream(stream_id: str, frames: bool = False):
+    stream = server.streams.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail=f"Unknown stream {stream_id}")
+    return stream.status(include_frames=frames)
+
+
+@app.delete("/streams/{stream_id}")
+async def delete_stream(stream_id: str):
+    try:
+        await asyncio.to_thread(server.remove_stream, stream_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown stream {stream_id}")
+    return {'stream_id': stream_id, 'removed': True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve emotion inference for several cameras with one model')
+    parser.add_argument('--sources', nargs='+', required=True, help='Webcam ids, video files or RTSP URLs')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL, help='Path to model checkpoint')
+    parser.add_argument('--device', type=str, default='cpu', choices=['cpu', 'cuda'], help='Device for inference')
+    parser.add_argument('--backend', type=str, default='torch', choices=PREDICTOR_BACKENDS, help='Inference backend')
+    parser.add_argument('--quantized', action='store_true', help='Load an INT8 checkpoint written by quantize.py')
+    parser.add_argument('--interval', type=int, default=5, help='Detect every Nth frame of each stream')
+    parser.add_argument('--detect-min-size', type=int, default=None, help='Downscaled detection (see run_stream.py)')
+    parser.add_argument('--tracker', type=str, default=None, choices=TRACKER_TYPES, help='Track faces between detections')
+    parser.add_argument('--max-batch-size', type=int, default=32, help='Faces per shared inference batch')
+    parser.add_argument('--max-latency-ms', type=float, default=50, help='Longest a face waits for its batch to fill')
+    parser.add_argument('--duration', type=int, default=30, help='Run duration in seconds')
+    parser.add_argument('--report-every', type=int, default=5, help='Print status every N seconds')
+    parser.add_argument('--output', type=str, default=None, help='Save the final status as JSON')
+    args = parser.parse_args()
+
+    multi = MultiCameraServer(args.model, device=args.device, backend=args.backend, quantized=args.quantized,
+                              max_batch_size=args.max_batch_size, max_latency_ms=args.max_latency_ms)
+    for source in args.sources:
+        multi.add_stream(source, interval=args.interval, tracker=args.tracker,
+                         detector_params={'detect_min_size': args.detect_min_size})
+
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < args.duration:
+            time.sleep(args.report_every)
+            status = multi.status()
+            summary = ', '.join(f"{s['stream_id']}: {s['processed_frames']} frames" for s in status['streams'])
+            print(f"[INFO] {summary} | mean batch {status['scheduler']['mean_batch_size']:.1f} faces")
+    except KeyboardInterrupt:
+        pass
+
+    status = multi.status()
+    multi.stop()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(status, f, indent=2)
+        print(f"[INFO] Saved status to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
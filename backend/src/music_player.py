@@ -3,6 +3,8 @@ import os
 import json
 from typing import List
 
+from result_writer import read_summary
+
 class MusicPlayer:
     def __init__(self):
         # 初始化pygame的音频模块
@@ -43,23 +45,19 @@ class MusicPlayer:
         并根据该情绪加载对应的音乐播放列表
         
         Args:
-            results_json_path: stream_results.json文件的路径
+            results_json_path: stream_results.json或stream_results.jsonl文件的路径
             music_base_path: 音乐文件夹的基础路径
         """
         try:
-            with open(results_json_path, 'r', encoding='utf-8') as f:
-                results = json.load(f)
+            # .json 与 .jsonl（逐帧写入的结果文件）均可读取
+            results = read_summary(results_json_path)
             
             emotion = results.get('most_frequent_emotion')
             if not emotion:
                 print("[ERROR] Can't found most_frequent_emotion!")
                 return
             
-            # 构建音乐文件夹路径
-            emotion_music_path = os.path.join(music_base_path, emotion)
-            
-            # 加载该情绪对应的播放列表
-            self.load_playlist(emotion_music_path)
+            self.load_playlist_for_emotion(emotion, music_base_path)
             
         except FileNotFoundError:
             print(f"[ERROR] Can't Found {results_json_path}！")
@@ -68,6 +66,18 @@ class MusicPlayer:
         except Exception as e:
             print(f"[ERROR] {e}")
 
+    def load_playlist_for_emotion(self, emotion: str, music_base_path: str = "./resources/music") -> None:
+        """
+        加载指定情绪对应的播放列表（music_base_path/<emotion>）
+        可在运行中配合 aggregation.RollingEmotionWindow.dominant() 使用，
+        根据最近一段时间的主要情绪实时切换
+        """
+        # 构建音乐文件夹路径
+        emotion_music_path = os.path.join(music_base_path, emotion)
+        
+        # 加载该情绪对应的播放列表
+        self.load_playlist(emotion_music_path)
+
     def play_song(self, index: int = None) -> None:
         """
         播放指定索引的曲目，若无索引则播放当前/第一首
@@ -153,6 +163,9 @@ if __name__ == "__main__":
     player = MusicPlayer()
     
     results_json_path = os.path.join(parent_dir, "results", "emotion", "stream_results.json")
+    if not os.path.exists(results_json_path):
+        # run_stream.py --result-format jsonl
+        results_json_path = os.path.join(parent_dir, "results", "emotion", "stream_results.jsonl")
     music_base_path = os.path.join(parent_dir, "resources", "music")
     player.load_playlist_by_emotion(results_json_path, music_base_path)
     
@@ -0,0 +1,316 @@
+"""
+Staged stream pipeline: capture -> detect -> classify -> output.
+
+Each stage runs on its own thread(s) and hands frames to the next through a
+bounded queue, so decoding, Haar detection and classification of consecutive
+frames overlap instead of adding up. OpenCV and torch release the GIL in their
+heavy calls, which lets the detection workers use several cores. The output
+stage restores capture order before tracking and drawing, so results are
+identical to the serial loop in `run_stream_core`.
+
+The frame-level helpers (`extract_face_crops`, `make_face_entry`, `draw_face`)
+are shared with the serial loop.
+"""
+
+import time
+import heapq
+import queue
+import threading
+
+import cv2
+
+
+_END = object()  # end-of-stream marker passed between stages
+
+
+def draw_face(frame, box, label):
+    """Draw a face box and its emotion label on frame (in place)."""
+    x, y, w, h = box
+    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+    cv2.putText(frame, label, (x, max(y-8, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+
+def extract_face_crops(frame, faces):
+    """Return [(index, box, crop)] for the non-empty face crops of a frame."""
+    crops = []
+    for idx, (x, y, w, h) in enumerate(faces):
+        face_crop = frame[y:y+h, x:x+w]
+        if face_crop.size == 0:
+            continue
+        crops.append((idx, (x, y, w, h), face_crop))
+    return crops
+
+
+def make_face_entry(face_id, box, pred):
+    """Build a result-schema face record from a box and a predictor output."""
+    x, y, w, h = box
+    return {
+        'id': face_id,
+        'bbox': {'x': int(x), 'y': int(y), 'width': int(w), 'height': int(h)},
+        'emotion': pred.get('emotion', 'unknown'),
+        'confidence': float(pred.get('confidence', 0.0)),
+        'scores': {k: float(v) for k, v in pred.get('scores', {}).items()}
+    }
+
+
+def face_label(entry):
+    return f"{entry['emotion']} {entry['confidence']:.2f}"
+
+
+class FramePacket:
+    """A frame travelling through the pipeline together with its partial results."""
+
+    def __init__(self, seq, frame, captured_at, detect):
+        self.seq = seq
+        self.frame = frame
+        self.captured_at = captured_at
+        self.detect = detect  # False for frames between detection intervals or gated by motion
+        self.gated = False
+        self.crops = None  # [(index, box, crop)] after detection
+        self.preds = None
+        self.entries = None  # face records, set by the output stage on detection and gated frames
+
+
+class StreamPipeline:
+    """Run detection and classification on a frame source with overlapping stages."""
+
+    def __init__(self, read_frame, detector_factory, predictor, interval=1, detect_workers=2,
+                 classify_workers=1, queue_size=8, max_batch_frames=4, tracker=None, motion_gate=None):
+        """
+        Args:
+            read_frame: Callable returning the next `capture.CapturedFrame`, or None when the source ended
+            detector_factory: Callable creating a detector; each detection worker gets its own
+            predictor: Emotion predictor (`predict_batch`), shared by the classification workers;
+                each worker thread preprocesses into its own buffer and the forward passes overlap
+            interval: Detect every Nth frame
+            detect_workers: Detection threads
+            classify_workers: Classification threads
+            queue_size: Capacity of each inter-stage queue (backpressure on capture)
+            max_batch_frames: Frames whose faces a classification worker batches together
+            tracker: Optional FaceTracker, updated in frame order by the output stage
+            motion_gate: Optional MotionGate, applied in frame order by the capture stage
+        """
+        self.read_frame = read_frame
+        self.detector_factory = detector_factory
+        self.predictor = predictor
+        self.interval = interval
+        self.detect_workers = detect_workers
+        self.classify_workers = classify_workers
+        self.max_batch_frames = max_batch_frames
+        self.tracker = tracker
+        self.motion_gate = motion_gate
+
+        self._detect_q = queue.Queue(queue_size)
+        self._classify_q = queue.Queue(queue_size)
+        self._order_q = queue.Queue(queue_size)
+        self._out_q = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+        self._alive = {}
+        self._alive_lock = threading.Lock()
+        self._last_entries = []
+        self._ended = False
+        self.detectors = []  # one per detection worker, e.g. for IncrementalFaceDetector stats
+        self._error = None  # first exception of the detect/classify/output stages, re-raised to the consumer
+
+        self.busy = {'capture': 0.0, 'detect': 0.0, 'classify': 0.0, 'output': 0.0}
+        self.frames = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _spawn(self, name, target, count=1):
+        self._alive[name] = count
+        for i in range(count):
+            thread = threading.Thread(target=target, name=f"pipeline-{name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def start(self):
+        self._spawn('capture', self._capture_loop)
+        self._spawn('detect', self._detect_loop, self.detect_workers)
+        self._spawn('classify', self._classify_loop, self.classify_workers)
+        self._spawn('output', self._output_loop)
+        return self
+
+    def _add_busy(self, stage, started):
+        with self._alive_lock:
+            self.busy[stage] += time.perf_counter() - started
+
+    def _finish_worker(self, stage, in_q, out_q):
+        """Let sibling workers see the end marker; the last worker of a stage forwards it."""
+        with self._alive_lock:
+            self._alive[stage] -= 1
+            last = self._alive[stage] == 0
+        if last:
+            out_q.put(_END)
+        else:
+            in_q.put(_END)
+
+    def _capture_loop(self):
+        seq = 0
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            item = self.read_frame()
+            if item is None:
+                break
+            packet = FramePacket(seq, item.frame, item.captured_at, detect=seq % self.interval == 0)
+            if packet.detect and self.motion_gate is not None and not self.motion_gate.has_motion(item.frame):
+                packet.detect = False
+                packet.gated = True
+            self._add_busy('capture', started)
+            self._detect_q.put(packet)
+            seq += 1
+        self._detect_q.put(_END)
+
+    def _fail(self, stage, error):
+        """Record a stage error and stop capturing; the frames in flight still drain."""
+        print(f"[ERROR] Pipeline {stage} stage failed: {error}")
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _detect_loop(self):
+        try:
+            detector = self.detector_factory()
+        except Exception as e:
+            # Keep consuming until the end marker so capture is never blocked on a full queue
+            self._fail('detect', e)
+            detector = None
+        else:
+            with self._alive_lock:
+                self.detectors.append(detector)
+        while True:
+            packet = self._detect_q.get()
+            if packet is _END:
+                self._finish_worker('detect', self._detect_q, self._classify_q)
+                return
+            if packet.detect and detector is not None:
+                started = time.perf_counter()
+                try:
+                    faces = detector.detect_faces(packet.frame)
+                except Exception as e:
+                    print(f"[WARN] Detection failed on frame {packet.seq}: {e}")
+                    faces = []
+                packet.crops = extract_face_crops(packet.frame, faces)
+                self._add_busy('detect', started)
+            self._classify_q.put(packet)
+
+    def _classify_loop(self):
+        while True:
+            # Batch the faces of all frames that are already waiting
+            packets = [self._classify_q.get()]
+            while packets[-1] is not _END and len(packets) < self.max_batch_frames:
+                try:
+                    packets.append(self._classify_q.get_nowait())
+                except queue.Empty:
+                    break
+            ended = packets[-1] is _END
+            if ended:
+                packets.pop()
+
+            started = time.perf_counter()
+            # Same 48x48 input as the serial loop in run_stream_core
+            crops = [cv2.resize(crop, (48, 48)) for p in packets if p.crops for _, _, crop in p.crops]
+            try:
+                preds = self.predictor.predict_batch(crops) if crops else []
+            except Exception as e:
+                self._fail('classify', e)
+                for packet in packets:
+                    packet.crops = [] if packet.crops is not None else None
+                preds = []
+            offset = 0
+            for packet in packets:
+                if packet.crops is not None:
+                    packet.preds = preds[offset:offset + len(packet.crops)]
+                    offset += len(packet.crops)
+            self._add_busy('classify', started)
+
+            for packet in packets:
+                self._order_q.put(packet)
+            if ended:
+                self._finish_worker('classify', self._classify_q, self._order_q)
+                return
+
+    def _output_loop(self):
+        pending = []
+        next_seq = 0
+        while True:
+            packet = self._order_q.get()
+            if packet is _END:
+                break
+            heapq.heappush(pending, (packet.seq, packet))
+            while pending and pending[0][0] == next_seq:
+                _, ready = heapq.heappop(pending)
+                started = time.perf_counter()
+                try:
+                    self._annotate(ready)
+                except Exception as e:
+                    self._fail('output', e)
+                self._add_busy('output', started)
+                self._out_q.put(ready)
+                next_seq += 1
+        self._out_q.put(_END)
+
+    def _annotate(self, packet):
+        """Assign face ids (tracker), build face records and draw them, in frame order."""
+        frame = packet.frame
+        if packet.crops is None:
+            if packet.gated:
+                # Nothing moved: reuse the last results so counts and windows still see the faces
+                packet.entries = [dict(entry, gated=True) for entry in self._last_entries]
+                for entry in packet.entries:
+                    draw_face(frame, tuple(entry['bbox'].values()), face_label(entry))
+            elif self.tracker is not None:
+                for track in self.tracker.predict(frame):
+                    draw_face(frame, track.box, track.data.get('label', ''))
+            return
+
+        tracks = self.tracker.update(frame, [box for _, box, _ in packet.crops]) if self.tracker is not None else None
+        packet.entries = []
+        for i, ((idx, box, _), pred) in enumerate(zip(packet.crops, packet.preds)):
+            face_id = tracks[i].track_id if tracks is not None else idx
+            entry = make_face_entry(face_id, box, pred)
+            packet.entries.append(entry)
+            draw_face(frame, box, face_label(entry))
+            if tracks is not None:
+                tracks[i].data['label'] = face_label(entry)
+        self._last_entries = packet.entries
+
+        latency = time.monotonic() - packet.captured_at
+        self._latency_total += latency
+        self._latency_max = max(self._latency_max, latency)
+        self.frames += 1
+
+    def __iter__(self):
+        """Yield processed FramePackets in capture order until the source ends.
+
+        Raises the error of a failed stage; call `stop` afterwards to drain and join.
+        """
+        while True:
+            packet = self._out_q.get()
+            if packet is _END:
+                self._ended = True
+            if self._error is not None:
+                raise self._error
+            if self._ended:
+                return
+            yield packet
+
+    def stop(self):
+        """Stop capturing, drain the stages and join all threads."""
+        self._stop.set()
+        while not self._ended:
+            if self._out_q.get() is _END:
+                self._ended = True
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        return {
+            'detect_workers': self.detect_workers,
+            'classify_workers': self.classify_workers,
+            'detected_frames': self.frames,
+            'latency_ms_mean': 1000.0 * self._latency_total / self.frames if self.frames else 0.0,
+            'latency_ms_max': 1000.0 * self._latency_max,
+            'busy_seconds': dict(self.busy),
+        }
@@ -0,0 +1,86 @@
+"""
+NumPy/OpenCV preprocessing for face crops fed to the emotion classifier.
+Replaces the per-crop ToPILImage -> Resize -> ToTensor -> Normalize chain with a
+resize straight into a reused float32 NCHW buffer.
+"""
+
+import cv2
+import numpy as np
+
+
+# ImageNet statistics used by the training transforms in model/data.py
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+# Statistics of single-channel models (GRAY_MEAN/GRAY_STD in model/model.py)
+GRAY_MEAN = (0.449,)
+GRAY_STD = (0.226,)
+
+
+class CropPreprocessor:
+    """Resize and normalize BGR face crops into a preallocated NCHW batch."""
+
+    def __init__(self, size=(224, 224), mean=IMAGENET_MEAN, std=IMAGENET_STD, max_batch_size=64, channels=3):
+        """
+        Args:
+            size: Network input size (width, height)
+            mean: Per-channel mean in RGB order (0-1 range)
+            std: Per-channel std in RGB order (0-1 range)
+            max_batch_size: Initial buffer capacity, grown on demand
+            channels: 3 for RGB input, 1 for grayscale (single-channel models)
+        """
+        self.size = tuple(size)
+        self.channels = channels
+        mean = np.asarray(mean, dtype=np.float32)
+        std = np.asarray(std, dtype=np.float32)
+
+        # out = pixel * scale - shift folds ToTensor's /255 and Normalize into one
+        # multiply-subtract over the whole batch
+        self._scale = (1.0 / (255.0 * std)).reshape(1, -1, 1, 1)
+        self._shift = (mean / std).reshape(1, -1, 1, 1)
+        self._allocate(max_batch_size)
+
+    def _allocate(self, capacity):
+        width, height = self.size
+        self.capacity = capacity
+        self._resized = np.empty((capacity, height, width, self.channels), dtype=np.uint8)
+        self._buffer = np.empty((capacity, self.channels, height, width), dtype=np.float32)
+        if self.channels == 1:
+            # Crops are resized in color first, so only the small image is converted to gray
+            self._color = np.empty((height, width, 3), dtype=np.uint8)
+
+    def __call__(self, face_crops):
+        """
+        Preprocess a list of BGR crops.
+
+        Args:
+            face_crops: list of HxWx3 uint8 BGR arrays (frame slices are fine)
+
+        Returns:
+            float32 array of shape (N, channels, height, width) in RGB order. The array
+            is a view of an internal buffer that is overwritten by the next call.
+        """
+        n = len(face_crops)
+        if n > self.capacity:
+            self._allocate(n)
+
+        width, height = self.size
+        for i, crop in enumerate(face_crops):
+            h, w = crop.shape[:2]
+            # INTER_AREA when shrinking approximates PIL's antialiased resize
+            interpolation = cv2.INTER_AREA if w > width or h > height else cv2.INTER_LINEAR
+            if self.channels == 1:
+                if crop.ndim == 2:
+                    cv2.resize(crop, (width, height), dst=self._resized[i, :, :, 0], interpolation=interpolation)
+                    continue
+                cv2.resize(crop, (width, height), dst=self._color, interpolation=interpolation)
+                cv2.cvtColor(self._color, cv2.COLOR_BGR2GRAY, dst=self._resized[i, :, :, 0])
+            else:
+                cv2.resize(crop, (width, height), dst=self._resized[i], interpolation=interpolation)
+
+        # NHWC(BGR) -> NCHW(RGB) is a strided view; the multiply writes it out
+        # contiguously into the float buffer, then the shift is applied in place
+        rgb = self._resized[:n].transpose(0, 3, 1, 2)[:, ::-1]
+        out = self._buffer[:n]
+        np.multiply(rgb, self._scale, out=out)
+        out -= self._shift
+        return out
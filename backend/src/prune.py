@@ -0,0 +1,165 @@
+"""
+Structured (filter) pruning of a trained ResNet18 emotion checkpoint.
+
+For each sparsity level, the least important inner channels of every residual
+block (L1 norm of the conv1 filters times |BN weight|) are removed and the conv/bn
+layers are rebuilt with fewer channels, so the pruned model is a smaller dense
+network that runs faster on CPU. Levels are applied in increasing order to the
+previously pruned and fine-tuned model, and each level is fine-tuned for a few
+epochs with the train.py loop. Every level is saved in the train.py checkpoint
+format plus `pruned_channels`, so `EmotionPredictor`, ONNX export and quantization
+load it unchanged. A sparsity vs. accuracy vs. latency report is printed and saved.
+"""
+
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from model.model import load_checkpoint, get_input_spec
+from model.data import get_dataloaders, DATA_FORMATS, AUGMENT_MODES
+from model.pruning import prune_model, count_parameters
+from train import train_epoch, validate, save_checkpoint
+from inference import EmotionPredictor
+from benchmark import DEFAULT_DATA_DIR, list_image_folder, evaluate_predictor, measure_latency, make_synthetic_crops
+
+
+def build_report(model_path, pruned_paths, data_dir, limit_per_class=None, num_latency_crops=200):
+    """Evaluate the unpruned model and each pruned checkpoint on the test split."""
+    samples, _ = list_image_folder(os.path.join(data_dir, 'test'), limit_per_class=limit_per_class)
+    crops = make_synthetic_crops(data_dir, num_latency_crops)
+
+    entries = [(0.0, model_path)] + list(pruned_paths)
+    rows = []
+    for sparsity, path in entries:
+        predictor = EmotionPredictor(path, device='cpu')
+        acc, _ = evaluate_predictor(predictor, samples)
+        rows.append({
+            'sparsity': sparsity,
+            'path': os.path.abspath(path),
+            'params_m': count_parameters(predictor.model) / 1e6,
+            'size_mb': os.path.getsize(path) / 2**20,
+            'top1': acc,
+            'ms_per_face': measure_latency(predictor, crops, batch_size=1),
+        })
+
+    print(f"[INFO] FER2013 test split: {len(samples)} images, CPU threads: {torch.get_num_threads()}")
+    print(f"{'sparsity':<10}{'params M':>10}{'size MB':>10}{'top-1':>8}{'ms/face':>10}")
+    for row in rows:
+        print(f"{row['sparsity']:<10.2f}{row['params_m']:>10.2f}{row['size_mb']:>10.1f}"
+              f"{row['top1']:>8.4f}{row['ms_per_face']:>10.3f}")
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'test_images': len(samples),
+        'threads': torch.get_num_threads(),
+        'models': rows,
+    }
+
+
+def main():
+    current_path = os.path.abspath(__file__)
+    current_dir = os.path.dirname(current_path)
+    parent_dir = os.path.dirname(current_dir)
+
+    parser = argparse.ArgumentParser(description='Structured pruning and fine-tuning of an emotion checkpoint')
+    parser.add_argument('--model', type=str, default=os.path.join(parent_dir, 'checkpoints', 'best.pth'),
+                        help='Path to fp32 best.pth checkpoint (resnet18)')
+    parser.add_argument('--sparsity', type=float, nargs='+', default=[0.25, 0.5, 0.75],
+                        help='Fractions of residual block channels to remove, one checkpoint per level')
+    parser.add_argument('--round-to', type=int, default=8, help='Keep a multiple of this many channels per block')
+    parser.add_argument('--finetune-epochs', type=int, default=3, help='Fine-tuning epochs after each level')
+    parser.add_argument('--lr', type=float, default=1e-4)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--output-dir', type=str, default=None,
+                        help='Directory for pruned checkpoints and report (default: next to --model)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='FER2013 archive directory (with train/ and test/)')
+    parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--data-format', default='folder', choices=DATA_FORMATS)
+    parser.add_argument('--cache-dir', default=None, help='Directory of the memmap cache (default: <data-dir>/memmap_cache)')
+    parser.add_argument('--augment', default='sample', choices=AUGMENT_MODES)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--no-report', action='store_true', help='Skip the sparsity/accuracy/latency report')
+    parser.add_argument('--limit-per-class', type=int, default=None,
+                        help='Only evaluate the first N test images of each class')
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    output_dir = args.output_dir or os.path.dirname(os.path.abspath(args.model))
+    base = os.path.splitext(os.path.basename(args.model))[0]
+
+    model, checkpoint = load_checkpoint(args.model, device=device)
+    model = model.to(device)
+    input_spec = get_input_spec(checkpoint)
+    train_loader, val_loader, classes = get_dataloaders(args.data_dir, batch_size=args.batch_size,
+                                                       img_size=input_spec['size'], num_workers=args.num_workers,
+                                                       data_format=args.data_format, cache_dir=args.cache_dir,
+                                                       augment=args.augment, device=device,
+                                                       channels=input_spec['channels'])
+    if len(classes) != checkpoint.get('num_classes', 7):
+        raise ValueError(f"Checkpoint has {checkpoint.get('num_classes', 7)} classes, dataset has {len(classes)}")
+
+    criterion = nn.CrossEntropyLoss()
+    _, base_acc = validate(model, val_loader, criterion, device)
+    base_params = count_parameters(model)
+    print(f"Unpruned: {base_params / 1e6:.2f}M params, val acc {base_acc:.4f}")
+
+    pruned_paths = []
+    for sparsity in sorted(args.sparsity):
+        pruned_channels = prune_model(model, sparsity, round_to=args.round_to)
+        model = model.to(device)
+        params = count_parameters(model)
+        _, pruned_acc = validate(model, val_loader, criterion, device)
+        print(f"Sparsity {sparsity:.2f}: {params / 1e6:.2f}M params ({params / base_params:.0%}), "
+              f"val acc {pruned_acc:.4f} before fine-tuning")
+
+        optimizer = optim.Adam(model.parameters(), lr=args.lr)
+        val_acc = pruned_acc
+        epoch_time = 0.0
+        for epoch in range(args.finetune_epochs):
+            start = time.perf_counter()
+            train_loss, train_acc = train_epoch(model, train_loader, criterion, optimizer, device)
+            epoch_time = time.perf_counter() - start
+            val_loss, val_acc = validate(model, val_loader, criterion, device)
+            print(f'  Fine-tune {epoch+1}/{args.finetune_epochs}: Train loss {train_loss:.4f} acc {train_acc:.4f} | '
+                  f'Val loss {val_loss:.4f} acc {val_acc:.4f} | epoch time {epoch_time:.1f}s')
+
+        filename = f"{base}_pruned{int(round(sparsity * 100))}.pth"
+        save_checkpoint({
+            'epoch': args.finetune_epochs,
+            'model_state_dict': model.state_dict(),
+            'optimizer_state_dict': optimizer.state_dict(),
+            'best_acc': val_acc,
+            'num_classes': checkpoint.get('num_classes', 7),
+            'arch': checkpoint.get('arch', 'resnet18'),
+            'stem': checkpoint.get('stem', 'imagenet'),
+            'input_spec': input_spec,
+            'epoch_time': epoch_time,
+            'pruned_channels': pruned_channels,
+            'pruning': {
+                'source_checkpoint': os.path.abspath(args.model),
+                'sparsity': sparsity,
+                'params': params,
+                'source_params': base_params,
+                'acc_before_finetune': pruned_acc,
+                'finetune_epochs': args.finetune_epochs,
+            },
+        }, False, output_dir, filename=filename)
+        pruned_paths.append((sparsity, os.path.join(output_dir, filename)))
+        print(f"[INFO] Saved {filename} (val acc {val_acc:.4f}, unpruned {base_acc:.4f})")
+
+    if not args.no_report:
+        report = build_report(args.model, pruned_paths, args.data_dir, limit_per_class=args.limit_per_class)
+        report_path = os.path.join(output_dir, f"{base}_pruning_report.json")
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Saved report to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
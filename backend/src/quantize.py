@@ -0,0 +1,149 @@
+"""
+Post-training INT8 quantization of a trained emotion checkpoint (CPU inference).
+
+- dynamic: int8 weights for Linear layers, activations quantized on the fly
+- static: fused conv/bn/relu with int8 weights and activations, calibrated on a
+  sample of the FER2013 train split
+
+Writes a quantized checkpoint loadable with `EmotionPredictor(..., quantized=True)`
+(`--quantized` in inference.py / run_stream.py) and a report comparing top-1
+accuracy and per-face latency against the fp32 model.
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime
+
+import cv2
+import torch
+
+from model.model import load_checkpoint, get_input_spec, get_model_kwargs
+from model.quantization import QUANTIZATION_MODES, quantize_dynamic, prepare_static, convert_static
+from inference import EmotionPredictor
+from preprocess import CropPreprocessor
+from benchmark import DEFAULT_DATA_DIR, list_image_folder, evaluate_predictor, measure_latency, make_synthetic_crops
+
+
+def calibrate(model, input_spec, data_dir, samples_per_class=32, batch_size=32):
+    """Feed a per-class sample of the train split through an observed model."""
+    samples, _ = list_image_folder(os.path.join(data_dir, 'train'), limit_per_class=samples_per_class)
+    size = input_spec['size']
+    preprocess = CropPreprocessor(size=(size, size), mean=input_spec['mean'], std=input_spec['std'],
+                                  max_batch_size=batch_size, channels=input_spec['channels'])
+    print(f"[INFO] Calibrating on {len(samples)} train images")
+    with torch.no_grad():
+        for start in range(0, len(samples), batch_size):
+            crops = [cv2.imread(path) for path, _ in samples[start:start + batch_size]]
+            model(torch.from_numpy(preprocess(crops)))
+
+
+def quantize_checkpoint(model_path, output_path, mode='static', data_dir=DEFAULT_DATA_DIR,
+                        calib_per_class=32, backend='fbgemm'):
+    """Quantize a fp32 checkpoint and save it. Returns the output path."""
+    model, checkpoint = load_checkpoint(model_path, device='cpu')
+    model.eval()
+    model_kwargs = get_model_kwargs(checkpoint)
+    num_classes, arch = model_kwargs['num_classes'], model_kwargs['arch']
+    input_spec = get_input_spec(checkpoint)
+
+    if mode == 'dynamic':
+        torch.backends.quantized.engine = backend
+        qmodel = quantize_dynamic(model)
+    elif mode == 'static':
+        prepared = prepare_static(model.state_dict(), backend=backend, **model_kwargs)
+        calibrate(prepared, input_spec, data_dir, samples_per_class=calib_per_class)
+        qmodel = convert_static(prepared)
+    else:
+        raise ValueError(f"Unsupported quantization mode: {mode}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    torch.save({
+        'model_state_dict': qmodel.state_dict(),
+        'num_classes': num_classes,
+        'arch': arch,
+        'stem': model_kwargs['stem'],
+        'pruned_channels': model_kwargs['pruned_channels'],
+        'input_spec': input_spec,
+        'quantization': mode,
+        'quantization_backend': backend,
+        'source_checkpoint': os.path.abspath(model_path),
+    }, output_path)
+    print(f"[INFO] Saved {mode} INT8 checkpoint to {output_path}")
+    return output_path
+
+
+def build_report(model_path, quantized_paths, data_dir, limit_per_class=None, num_latency_crops=200):
+    """Evaluate the fp32 model and each quantized checkpoint on the test split."""
+    samples, _ = list_image_folder(os.path.join(data_dir, 'test'), limit_per_class=limit_per_class)
+    crops = make_synthetic_crops(data_dir, num_latency_crops)
+
+    entries = [('fp32', model_path, False)] + [(mode, path, True) for mode, path in quantized_paths]
+    rows = []
+    for name, path, quantized in entries:
+        predictor = EmotionPredictor(path, device='cpu', quantized=quantized)
+        acc, _ = evaluate_predictor(predictor, samples)
+        rows.append({
+            'model': name,
+            'path': os.path.abspath(path),
+            'size_mb': os.path.getsize(path) / 2**20,
+            'top1': acc,
+            'ms_per_face': measure_latency(predictor, crops, batch_size=1),
+        })
+
+    print(f"[INFO] FER2013 test split: {len(samples)} images")
+    print(f"{'model':<10}{'size MB':>10}{'top-1':>8}{'ms/face':>10}")
+    for row in rows:
+        print(f"{row['model']:<10}{row['size_mb']:>10.1f}{row['top1']:>8.4f}{row['ms_per_face']:>10.3f}")
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'test_images': len(samples),
+        'threads': torch.get_num_threads(),
+        'models': rows,
+    }
+
+
+def main():
+    current_path = os.path.abspath(__file__)
+    current_dir = os.path.dirname(current_path)
+    parent_dir = os.path.dirname(current_dir)
+
+    parser = argparse.ArgumentParser(description='Post-training INT8 quantization of an emotion checkpoint')
+    parser.add_argument('--model', type=str, default=os.path.join(parent_dir, 'checkpoints', 'best.pth'),
+                        help='Path to fp32 best.pth checkpoint')
+    parser.add_argument('--mode', type=str, default='static', choices=QUANTIZATION_MODES + ('both',),
+                        help='Quantization mode')
+    parser.add_argument('--output-dir', type=str, default=None,
+                        help='Directory for quantized checkpoints and report (default: next to --model)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='FER2013 archive directory (with train/ and test/)')
+    parser.add_argument('--calib-per-class', type=int, default=32,
+                        help='Train images per class used for static calibration')
+    parser.add_argument('--qbackend', type=str, default='fbgemm', choices=['fbgemm', 'qnnpack'],
+                        help='Quantized kernel backend (fbgemm for x86, qnnpack for ARM)')
+    parser.add_argument('--no-report', action='store_true', help='Skip the accuracy/latency report')
+    parser.add_argument('--limit-per-class', type=int, default=None,
+                        help='Only evaluate the first N test images of each class')
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.dirname(os.path.abspath(args.model))
+    base = os.path.splitext(os.path.basename(args.model))[0]
+    modes = QUANTIZATION_MODES if args.mode == 'both' else (args.mode,)
+
+    quantized_paths = []
+    for mode in modes:
+        output = os.path.join(output_dir, f"{base}_int8_{mode}.pth")
+        quantize_checkpoint(args.model, output, mode=mode, data_dir=args.data_dir,
+                            calib_per_class=args.calib_per_class, backend=args.qbackend)
+        quantized_paths.append((mode, output))
+
+    if not args.no_report:
+        report = build_report(args.model, quantized_paths, args.data_dir, limit_per_class=args.limit_per_class)
+        report_path = os.path.join(output_dir, f"{base}_quantization_report.json")
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Saved report to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
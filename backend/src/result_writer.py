@@ -0,0 +1,191 @@
+"""
+Incremental JSONL result files.
+
+Instead of keeping every frame in `results['frames']` and dumping one big JSON
+document at the end, `JsonlResultWriter` appends one compact JSON line per
+processed frame:
+
+    {"type": "header", "source": ..., "timestamp": ..., "part": 0}
+    {"type": "frame", "frame_index": 0, "timestamp": ..., "faces": [...]}
+    ...
+    {"type": "summary", "emotion_counts": {...}, "most_frequent_emotion": ...}
+
+Lines are flushed in batches and files are rotated by size (`results.jsonl`,
+`results.1.jsonl`, ...; every part starts with the header). `read_results`
+rebuilds the format of docs/protocol/emotion_result_schema.md from the parts,
+and also accepts the old `.json` files.
+"""
+
+import os
+import json
+import time
+
+
+RESULT_FORMATS = ('json', 'jsonl')
+
+
+def part_path(path, part):
+    """Path of rotation part `part` (0 = `path` itself)."""
+    if part == 0:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.{part}{ext}"
+
+
+def part_paths(path):
+    """Existing rotation parts of a JSONL result file, in write order."""
+    paths = []
+    while os.path.exists(part_path(path, len(paths))):
+        paths.append(part_path(path, len(paths)))
+    return paths
+
+
+class JsonlResultWriter:
+    """Append header, frame and summary records to rotating JSONL files."""
+
+    def __init__(self, path, header=None, flush_every=20, flush_interval=2.0, max_bytes=64 * 2**20):
+        """
+        Args:
+            path: Output file (`.jsonl`); rotated parts get `.1`, `.2`, ... before the extension
+            header: Run metadata (source, timestamp, ...) written at the top of every part;
+                `self.header` can still be updated until the first record is written
+            flush_every: Frames buffered before they are written
+            flush_interval: Seconds after which buffered frames are written regardless
+            max_bytes: Start a new part once the current one exceeds this size (None = never)
+        """
+        self.path = path
+        self.header = dict(header or {})
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.part = 0
+        self.frames = 0
+        self.paths = []
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._closed = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Remove parts of a previous run so readers do not pick up stale rotations
+        for stale in part_paths(path):
+            os.remove(stale)
+
+    @staticmethod
+    def _dumps(record):
+        return json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+    def _open_part(self):
+        path = part_path(self.path, self.part)
+        self._file = open(path, 'w', encoding='utf-8')
+        self.paths.append(path)
+        self._file.write(self._dumps({'type': 'header', **self.header, 'part': self.part}))
+
+    def write_frame(self, frame_result):
+        self._pending.append(self._dumps({'type': 'frame', **frame_result}))
+        self.frames += 1
+        if len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._closed:
+            return
+        if self._file is None:
+            # Part 0 is opened lazily so header updates made after construction are kept
+            self._open_part()
+        if self._pending:
+            self._file.write(''.join(self._pending))
+            self._pending = []
+        self._file.flush()
+        self._last_flush = time.monotonic()
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._file.close()
+            self.part += 1
+            self._open_part()
+
+    def write_summary(self, summary):
+        """Write the final record and close the file."""
+        self.flush()
+        self._file.write(self._dumps({'type': 'summary', **summary}))
+        self.close()
+
+    def close(self):
+        if not self._closed:
+            self.flush()
+            self._file.close()
+            self._file = None
+            self._closed = True
+
+
+def iter_records(path):
+    """Yield the records of all rotation parts; a truncated last line (crash) is skipped."""
+    for p in part_paths(path):
+        with open(p, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[WARN] Skipping incomplete record in {p}")
+
+
+def _add_counts(counts, frame_result):
+    for face in frame_result.get('faces', []):
+        counts[face['emotion']] = counts.get(face['emotion'], 0) + 1
+
+
+def _summary_from_counts(counts):
+    return {
+        'emotion_counts': counts,
+        'most_frequent_emotion': max(counts, key=counts.get) if counts else None,
+    }
+
+
+def read_results(path):
+    """
+    Load a result file into the emotion_result_schema.md format.
+
+    `.json` files are loaded as-is. For `.jsonl` files the header, frame and
+    summary records are merged; if the run ended without a summary, it is
+    recomputed from the frames.
+    """
+    if not path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    results, frames, summary = {}, [], None
+    counts = {}
+    for record in iter_records(path):
+        kind = record.pop('type', None)
+        if kind == 'header':
+            record.pop('part', None)
+            results.update(record)
+        elif kind == 'frame':
+            frames.append(record)
+            _add_counts(counts, record)
+        elif kind == 'summary':
+            summary = record
+    results['frames'] = frames
+    results.update(summary if summary is not None else _summary_from_counts(counts))
+    return results
+
+
+def read_summary(path):
+    """Header and summary of a result file, without keeping the frames in memory."""
+    if not path.endswith('.jsonl'):
+        results = read_results(path)
+        results.pop('frames', None)
+        return results
+
+    results, summary = {}, None
+    counts = {}
+    for record in iter_records(path):
+        kind = record.pop('type', None)
+        if kind == 'header':
+            record.pop('part', None)
+            results.update(record)
+        elif kind == 'frame':
+            _add_counts(counts, record)
+        elif kind == 'summary':
+            summary = record
+    results.update(summary if summary is not None else _summary_from_counts(counts))
+    return results
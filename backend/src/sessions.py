@@ -0,0 +1,250 @@
+"""
+Background stream sessions for the FastAPI app in run_stream.py.
+
+A session runs `run_stream_core` on its own thread and publishes every frame
+record to subscribers (Server-Sent Events / WebSocket handlers) as it is
+produced, so clients no longer wait for the whole `duration`. Subscribers get
+an asyncio queue fed thread-safely from the session thread; a subscriber that
+falls behind loses frames instead of slowing the stream down.
+"""
+
+import os
+import uuid
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+
+
+SESSION_STATES = ('running', 'stopping', 'finished', 'failed')
+
+
+class StreamSession:
+    """One background `run_stream_core` run with live result fan-out."""
+
+    def __init__(self, run_fn, params, history=50, subscriber_queue_size=100):
+        """
+        Args:
+            run_fn: `run_stream_core`
+            params: Keyword arguments for run_fn (on_frame/stop_event are set by the session,
+                output_dir gets a per-session subdirectory)
+            history: Recent frame records kept for status queries
+            subscriber_queue_size: Events buffered per subscriber before frames are dropped
+        """
+        self.session_id = uuid.uuid4().hex[:12]
+        if 'output_dir' in params:
+            params = dict(params, output_dir=os.path.join(params['output_dir'], self.session_id))
+        self.params = params
+        self.state = 'running'
+        self.error = None
+        self.result = None
+        self.created = datetime.now()
+        self.recent = deque(maxlen=history)
+        self.frames = 0
+        self.emotion_counts = {}
+        self._stats_fn = None  # set by run_fn through stats_hook once the run is set up
+        self._ready = threading.Event()  # models loaded and source opened, or the run ended
+        self.key = None  # coalescing key of shared sessions (see SessionManager.acquire)
+        self.refcount = 0
+        self.subscriber_queue_size = subscriber_queue_size
+        self._subscribers = []  # (loop, asyncio.Queue)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(run_fn,), name=f"session-{self.session_id}",
+                                        daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self, run_fn):
+        try:
+            result = run_fn(**self.params, on_frame=self._on_frame, stop_event=self._stop_event,
+                            stats_hook=self._set_stats_fn)
+            # Frame records were already streamed; keep only the summary
+            self.result = {k: v for k, v in result.items() if k != 'frames'}
+            self.state = 'finished'
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            print(f"[ERROR] Session {self.session_id} failed: {e}")
+        self._ready.set()
+        self._publish({'type': 'end', 'data': self.status()})
+
+    def _set_stats_fn(self, stats_fn):
+        self._stats_fn = stats_fn
+        self._ready.set()
+
+    def wait_ready(self, timeout=None):
+        """Block until the run is set up (models loaded, source open) or has ended."""
+        return self._ready.wait(timeout)
+
+    def stats(self):
+        """Run stats (capture, pipeline, motion_gate, ...): final ones once finished, else the current ones."""
+        if self.result is not None:
+            return {k: v for k, v in self.result.items()
+                    if k not in ('source', 'timestamp', 'emotion_counts', 'most_frequent_emotion', 'results_file')}
+        return self._stats_fn() if self._stats_fn is not None else {}
+
+    def _on_frame(self, frame_result):
+        with self._lock:
+            self.frames += 1
+            self.recent.append(frame_result)
+            for face in frame_result['faces']:
+                self.emotion_counts[face['emotion']] = self.emotion_counts.get(face['emotion'], 0) + 1
+        self._publish({'type': 'frame', 'data': frame_result})
+
+    def _publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, q in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, q, event)
+            except RuntimeError:
+                self.unsubscribe(q)  # event loop of the subscriber is closed
+
+    def subscribe(self, queue_size=None):
+        """Register the calling event loop; returns an asyncio.Queue of events (queue_size 0 = unbounded)."""
+        q = asyncio.Queue(self.subscriber_queue_size if queue_size is None else queue_size)
+        with self._lock:
+            self._subscribers.append((asyncio.get_running_loop(), q))
+            if self.state in ('finished', 'failed'):
+                q.put_nowait({'type': 'end', 'data': self.status(locked=True)})
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers = [(loop, sub) for loop, sub in self._subscribers if sub is not q]
+
+    async def events(self):
+        """Async iterator over session events until the session ends."""
+        q = self.subscribe()
+        try:
+            while True:
+                event = await q.get()
+                yield event
+                if event['type'] == 'end':
+                    return
+        finally:
+            self.unsubscribe(q)
+
+    def stop(self, wait=True):
+        if self.state == 'running':
+            self.state = 'stopping'
+        self._stop_event.set()
+        if wait:
+            self._thread.join()
+
+    def status(self, locked=False):
+        if not locked:
+            with self._lock:
+                return self.status(locked=True)
+        counts = self.emotion_counts
+        return {
+            'session_id': self.session_id,
+            'state': self.state,
+            'error': self.error,
+            'source': self.params.get('source'),
+            'created': self.created.isoformat(),
+            'frames': self.frames,
+            'subscribers': len(self._subscribers),
+            'clients': self.refcount,
+            'emotion_counts': dict(counts),
+            'most_frequent_emotion': max(counts, key=counts.get) if counts else None,
+            'latest': self.recent[-1] if self.recent else None,
+            'window': self.params['window'].snapshot() if self.params.get('window') is not None else None,
+            'result': self.result,
+        }
+
+
+def _offer(q, event):
+    """Put without blocking the event loop; a full queue means the subscriber is too slow."""
+    if event['type'] == 'end':
+        while q.full():
+            q.get_nowait()
+    try:
+        q.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+class SessionManager:
+    """Registry of stream sessions; finished sessions are kept for `keep_finished` entries."""
+
+    def __init__(self, run_fn, keep_finished=20):
+        self.run_fn = run_fn
+        self.keep_finished = keep_finished
+        self.sessions = {}
+        self._shared = {}  # coalescing key -> running shared session
+        self._lock = threading.Lock()
+
+    def create(self, **params):
+        session = StreamSession(self.run_fn, params)
+        with self._lock:
+            self._prune()
+            self.sessions[session.session_id] = session
+        session.start()
+        print(f"[INFO] Started session {session.session_id} for {params.get('source')}")
+        return session
+
+    def acquire(self, key, **params):
+        """
+        Attach to the running shared session for `key`, or start one.
+
+        Concurrent clients asking for the same processing (source, model, detection
+        settings) share one capture and inference loop. The session runs until the
+        last client calls `release`.
+        """
+        with self._lock:
+            session = self._shared.get(key)
+            if session is not None and session.state == 'running':
+                session.refcount += 1
+                return session
+            self._prune()
+            session = StreamSession(self.run_fn, dict(params, duration=None))
+            session.key = key
+            session.refcount = 1
+            self._shared[key] = session
+            self.sessions[session.session_id] = session
+        session.start()
+        print(f"[INFO] Started shared session {session.session_id} for {params.get('source')}")
+        return session
+
+    def release(self, session):
+        """Detach a client from a shared session; the last one stops it (without waiting)."""
+        with self._lock:
+            session.refcount -= 1
+            if session.refcount > 0:
+                return
+            if self._shared.get(session.key) is session:
+                del self._shared[session.key]
+        print(f"[INFO] Last client left shared session {session.session_id}, stopping")
+        session.stop(wait=False)
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def remove(self, session_id):
+        """Stop a session (waiting for its summary) and forget it."""
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.stop()
+        return session
+
+    def _prune(self):
+        """Drop the oldest finished sessions beyond `keep_finished`. Caller holds the lock."""
+        done = [s for s in self.sessions.values() if s.state in ('finished', 'failed')]
+        for session in sorted(done, key=lambda s: s.created)[:max(0, len(done) - self.keep_finished)]:
+            del self.sessions[session.session_id]
+
+    def list(self):
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return [s.status() for s in sessions]
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.stop()
@@ -0,0 +1,434 @@
+"""
+Shard stream sources across worker processes.
+
+Threads in `run_stream_core` share one GIL, so Python-side work (capture loops,
+tracking, bookkeeping) caps one process at a few streams. Here every worker
+process owns a subset of the sources and does capture and face detection; the
+face crops (48x48 BGR, the classifier input of `run_stream_core`) are written
+into a `multiprocessing.shared_memory` ring owned by the worker, and only slot
+indices and boxes travel through a queue. The parent process classifies crops
+from all workers in shared batches with one predictor. Optionally each
+processed frame is published through a second ring for display.
+
+A supervisor thread restarts workers that die, or whose live sources (webcam,
+RTSP) stopped after the capture gave up reconnecting, and keeps per-worker load
+stats. Streams that ended are flagged in `status()`.
+
+    python ./backend/src/sharding.py --sources 0 rtsp://cam1/stream rtsp://cam2/stream --workers 2
+"""
+
+import os
+import sys
+import time
+import queue
+import argparse
+import json
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import cv2
+import numpy as np
+
+from inference import PREDICTOR_BACKENDS
+from face_detection import OpenCVFaceDetector
+from model_cache import registry
+from capture import FrameCapture, is_live_source
+from pipeline import extract_face_crops, make_face_entry
+
+
+current_path = os.path.abspath(__file__)
+current_dir = os.path.dirname(current_path)
+parent_dir = os.path.dirname(current_dir)
+
+DEFAULT_MODEL = os.path.join(parent_dir, 'checkpoints', 'best.pth')
+CROP_SHAPE = (48, 48, 3)
+FRAME_SLOTS = 4  # published frames in flight per worker
+
+
+class SharedRing:
+    """Fixed-size uint8 slots in one shared memory block."""
+
+    def __init__(self, slots, slot_shape, name=None):
+        """
+        Args:
+            slots: Number of slots
+            slot_shape: Shape of one slot, e.g. (48, 48, 3)
+            name: Attach to an existing block created by another process (None = create)
+        """
+        self.slots = slots
+        self.slot_shape = tuple(slot_shape)
+        size = slots * int(np.prod(self.slot_shape))
+        # Only the creating (parent) process unlinks; spawned workers share its resource tracker
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray((slots,) + self.slot_shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, slot, image):
+        self.array[slot] = image
+
+    def read(self, slot):
+        """Copy a slot out, so it can be released right away."""
+        return self.array[slot].copy()
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(worker_id, generation, sources, crop_ring_name, crop_slots, frame_ring_name, frame_slots, frame_shape,
+                 crop_free, frame_free, ready, stop_event, interval, detector_params):
+    """Worker process: capture and detect on its sources, hand crops to the parent."""
+    crop_ring = SharedRing(crop_slots, CROP_SHAPE, name=crop_ring_name)
+    frame_ring = SharedRing(frame_slots, frame_shape, name=frame_ring_name) if frame_ring_name else None
+    detector = OpenCVFaceDetector(**(detector_params or {}))
+    captures = {stream_id: FrameCapture(source).start() for stream_id, source in sources}
+    frame_counts = {stream_id: 0 for stream_id in captures}
+    dropped = 0
+
+    while captures and not stop_event.is_set():
+        for stream_id in list(captures):
+            item = captures[stream_id].read(timeout=0.01)
+            if item is None:
+                if captures[stream_id].finished:
+                    print(f"[INFO] Worker {worker_id}: stream {stream_id} ended")
+                    del captures[stream_id]
+                    ready.put({'worker_id': worker_id, 'generation': generation, 'stream_id': stream_id,
+                               'ended': True, 'slots': []})
+                continue
+            frame_idx = frame_counts[stream_id]
+            frame_counts[stream_id] += 1
+            if frame_idx % interval != 0:
+                continue
+
+            started = time.perf_counter()
+            crops = extract_face_crops(item.frame, detector.detect_faces(item.frame))
+            slots, boxes = [], []
+            for _, box, crop in crops:
+                try:
+                    slot = crop_free.get_nowait()
+                except queue.Empty:
+                    dropped += 1  # parent is behind, drop the face instead of blocking capture
+                    continue
+                crop_ring.write(slot, cv2.resize(crop, CROP_SHAPE[1::-1]))
+                slots.append(slot)
+                boxes.append(tuple(int(v) for v in box))
+
+            frame_slot = None
+            if frame_ring is not None:
+                try:
+                    frame_slot = frame_free.get_nowait()
+                    frame_ring.write(frame_slot, cv2.resize(item.frame, frame_shape[1::-1]))
+                except queue.Empty:
+                    pass
+
+            ready.put({
+                'worker_id': worker_id,
+                'generation': generation,
+                'stream_id': stream_id,
+                'frame_index': frame_idx,
+                'captured_at': time.time() - (time.monotonic() - item.captured_at),
+                'boxes': boxes,
+                'slots': slots,
+                'frame_slot': frame_slot,
+                'detect_ms': 1000.0 * (time.perf_counter() - started),
+                'dropped': dropped,
+            })
+
+    for capture in captures.values():
+        capture.stop()
+    crop_ring.close()
+    if frame_ring is not None:
+        frame_ring.close()
+
+
+class WorkerHandle:
+    """A worker process with its shared rings and free-slot queues; recreated on restart."""
+
+    def __init__(self, ctx, worker_id, sources, ready, stop_event, crop_slots, frame_shape, interval,
+                 detector_params):
+        self.ctx = ctx
+        self.worker_id = worker_id
+        self.sources = sources
+        self.ready = ready
+        self.stop_event = stop_event
+        self.crop_slots = crop_slots
+        self.frame_shape = frame_shape
+        self.interval = interval
+        self.detector_params = detector_params
+        self.generation = -1
+        self.restarts = 0
+        self.process = None
+        self.crop_ring = self.frame_ring = None
+        self.stats = {}
+
+    def start(self):
+        """(Re)create the rings and spawn the process under a new generation number."""
+        self.close_rings()
+        self.generation += 1
+        self.crop_ring = SharedRing(self.crop_slots, CROP_SHAPE)
+        self.crop_free = self.ctx.Queue(self.crop_slots)
+        for slot in range(self.crop_slots):
+            self.crop_free.put(slot)
+        self.frame_free = self.ctx.Queue(FRAME_SLOTS)
+        if self.frame_shape is not None:
+            self.frame_ring = SharedRing(FRAME_SLOTS, self.frame_shape)
+            for slot in range(FRAME_SLOTS):
+                self.frame_free.put(slot)
+
+        self.stats = {'frames': 0, 'faces': 0, 'detect_ms_total': 0.0, 'dropped_faces': 0, 'started': time.time()}
+        self.process = self.ctx.Process(
+            target=_worker_main, name=f"shard-worker-{self.worker_id}", daemon=True,
+            args=(self.worker_id, self.generation, self.sources, self.crop_ring.name, self.crop_slots,
+                  self.frame_ring.name if self.frame_ring is not None else None, FRAME_SLOTS, self.frame_shape,
+                  self.crop_free, self.frame_free, self.ready, self.stop_event, self.interval,
+                  self.detector_params))
+        self.process.start()
+
+    def close_rings(self):
+        for ring in (self.crop_ring, self.frame_ring):
+            if ring is not None:
+                ring.close()
+        self.crop_ring = self.frame_ring = None
+
+    def load(self):
+        elapsed = max(time.time() - self.stats.get('started', time.time()), 1e-6)
+        frames = self.stats.get('frames', 0)
+        return {
+            'worker_id': self.worker_id,
+            'pid': self.process.pid if self.process is not None else None,
+            'alive': self.process is not None and self.process.is_alive(),
+            'streams': [stream_id for stream_id, _ in self.sources],
+            'restarts': self.restarts,
+            'frames': frames,
+            'faces': self.stats.get('faces', 0),
+            'dropped_faces': self.stats.get('dropped_faces', 0),
+            'fps': frames / elapsed,
+            'detect_ms_mean': self.stats['detect_ms_total'] / frames if frames else 0.0,
+            # Fraction of wall time spent detecting: ~1.0 means the worker is saturated
+            'busy': self.stats.get('detect_ms_total', 0.0) / 1000.0 / elapsed,
+        }
+
+
+class ShardedStreamServer:
+    """Distribute sources over worker processes and classify their crops with one predictor."""
+
+    def __init__(self, sources, model_path, num_workers=2, device='cpu', backend='torch', quantized=False,
+                 interval=5, detector_params=None, max_batch_size=32, crop_slots=256, frame_size=None,
+                 restart_delay=1.0):
+        """
+        Args:
+            sources: Webcam ids, video files or stream URLs
+            model_path: Emotion model used by the parent process
+            num_workers: Worker processes; sources are assigned round-robin
+            interval: Detect every Nth frame of each stream
+            detector_params: OpenCVFaceDetector kwargs for the workers
+            max_batch_size: Faces per classification batch
+            crop_slots: Crop ring slots per worker (faces in flight)
+            frame_size: (width, height) to publish processed frames through a frame ring, or None
+            restart_delay: Seconds between supervisor checks
+        """
+        self.predictor = registry.get_predictor(model_path, device=device, backend=backend, quantized=quantized)
+        self.max_batch_size = max_batch_size
+        self.restart_delay = restart_delay
+        self.ctx = mp.get_context('spawn')
+        self.ready = self.ctx.Queue()
+        self.stop_event = self.ctx.Event()
+        self._stopping = False
+        self._lock = threading.Lock()
+
+        streams = [(f"cam{i}", source) for i, source in enumerate(sources)]
+        num_workers = max(1, min(num_workers, len(streams)))
+        frame_shape = (frame_size[1], frame_size[0], 3) if frame_size else None
+        self.workers = [
+            WorkerHandle(self.ctx, w, streams[w::num_workers], self.ready, self.stop_event, crop_slots,
+                         frame_shape, interval, detector_params)
+            for w in range(num_workers)
+        ]
+        self.streams = {stream_id: {'source': source, 'processed_frames': 0, 'latest': None,
+                                    'emotion_counts': {}, 'latency_ms_total': 0.0, 'ended': False}
+                        for stream_id, source in streams}
+        self.latest_frames = {}
+        self._threads = []
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        for target, name in ((self._collect_loop, 'shard-collector'), (self._supervise_loop, 'shard-supervisor')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[INFO] Started {len(self.workers)} worker processes for {len(self.streams)} streams")
+        return self
+
+    def _supervise_loop(self):
+        while not self._stopping:
+            time.sleep(self.restart_delay)
+            for worker in self.workers:
+                if self._stopping or worker.process.is_alive():
+                    continue
+                live = [(stream_id, source) for stream_id, source in worker.sources if is_live_source(source)]
+                if worker.process.exitcode == 0:
+                    if not live:
+                        continue  # all (file) sources of the worker ended
+                    # Live sources only end when the capture gave up reconnecting; retry them
+                    print(f"[WARN] Live sources of worker {worker.worker_id} stopped, restarting")
+                else:
+                    print(f"[WARN] Worker {worker.worker_id} exited with code {worker.process.exitcode}, restarting")
+                with self._lock:
+                    if worker.process.exitcode == 0:
+                        worker.sources = live  # finished files are not replayed
+                    for stream_id, _ in worker.sources:
+                        self.streams[stream_id]['ended'] = False
+                    worker.restarts += 1
+                    worker.start()
+
+    def _collect_loop(self):
+        while not self._stopping:
+            try:
+                messages = [self.ready.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            faces = len(messages[0]['slots'])
+            while faces < self.max_batch_size:
+                try:
+                    messages.append(self.ready.get_nowait())
+                except queue.Empty:
+                    break
+                faces += len(messages[-1]['slots'])
+            self._classify(messages)
+
+    def _classify(self, messages):
+        crops, valid = [], []
+        with self._lock:
+            for msg in messages:
+                worker = self.workers[msg['worker_id']]
+                if msg['generation'] != worker.generation:
+                    continue  # sent by a worker that has since been restarted
+                if msg.get('ended'):
+                    self.streams[msg['stream_id']]['ended'] = True
+                    continue
+                for slot in msg['slots']:
+                    crops.append(worker.crop_ring.read(slot))
+                    worker.crop_free.put(slot)
+                if msg['frame_slot'] is not None:
+                    self.latest_frames[msg['stream_id']] = worker.frame_ring.read(msg['frame_slot'])
+                    worker.frame_free.put(msg['frame_slot'])
+                worker.stats['frames'] += 1
+                worker.stats['faces'] += len(msg['slots'])
+                worker.stats['detect_ms_total'] += msg['detect_ms']
+                worker.stats['dropped_faces'] = msg['dropped']
+                valid.append(msg)
+
+        preds = self.predictor.predict_batch(crops) if crops else []
+
+        offset = 0
+        now = time.time()
+        # Under the lock: status() copies these dicts from the API thread
+        with self._lock:
+            for msg in valid:
+                stream = self.streams[msg['stream_id']]
+                faces = []
+                for i, box in enumerate(msg['boxes']):
+                    entry = make_face_entry(i, box, preds[offset + i])
+                    faces.append(entry)
+                    stream['emotion_counts'][entry['emotion']] = stream['emotion_counts'].get(entry['emotion'], 0) + 1
+                offset += len(msg['boxes'])
+                stream['processed_frames'] += 1
+                stream['latency_ms_total'] += 1000.0 * (now - msg['captured_at'])
+                stream['latest'] = {'frame_index': msg['frame_index'], 'faces': faces}
+
+    def status(self):
+        with self._lock:
+            streams = []
+            for stream_id, stream in self.streams.items():
+                counts = stream['emotion_counts']
+                processed = stream['processed_frames']
+                streams.append({
+                    'stream_id': stream_id,
+                    'source': stream['source'],
+                    'ended': stream['ended'],
+                    'processed_frames': processed,
+                    'latency_ms_mean': stream['latency_ms_total'] / processed if processed else 0.0,
+                    'emotion_counts': dict(counts),
+                    'most_frequent_emotion': max(counts, key=counts.get) if counts else None,
+                    'latest': stream['latest'],
+                })
+            return {'streams': streams, 'workers': [worker.load() for worker in self.workers]}
+
+    def stop(self):
+        self._stopping = True
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        for thread in self._threads:
+            thread.join()
+        for worker in self.workers:
+            worker.close_rings()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shard emotion streams across worker processes')
+    parser.add_argument('--sources', nargs='+', required=True, help='Webcam ids, video files or RTSP URLs')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL, help='Path to model checkpoint')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--device', type=str, default='cpu', choices=['cpu', 'cuda'], help='Device for inference')
+    parser.add_argument('--backend', type=str, default='torch', choices=PREDICTOR_BACKENDS, help='Inference backend')
+    parser.add_argument('--quantized', action='store_true', help='Load an INT8 checkpoint written by quantize.py')
+    parser.add_argument('--interval', type=int, default=5, help='Detect every Nth frame of each stream')
+    parser.add_argument('--min-size', type=int, nargs=2, default=[300, 300], help='Minimum face size (width height)')
+    parser.add_argument('--detect-min-size', type=int, default=None, help='Downscaled detection (see run_stream.py)')
+    parser.add_argument('--max-batch-size', type=int, default=32, help='Faces per classification batch')
+    parser.add_argument('--display', action='store_true', help='Show the latest processed frame of each stream')
+    parser.add_argument('--duration', type=int, default=30, help='Run duration in seconds')
+    parser.add_argument('--report-every', type=int, default=5, help='Print worker load every N seconds')
+    parser.add_argument('--output', type=str, default=None, help='Save the final status as JSON')
+    args = parser.parse_args()
+
+    server = ShardedStreamServer(
+        args.sources, args.model, num_workers=args.workers, device=args.device, backend=args.backend,
+        quantized=args.quantized, interval=args.interval, max_batch_size=args.max_batch_size,
+        detector_params={'min_size': tuple(args.min_size), 'detect_min_size': args.detect_min_size},
+        frame_size=(640, 360) if args.display else None
+    ).start()
+
+    start = last_report = time.monotonic()
+    try:
+        while time.monotonic() - start < args.duration:
+            if args.display:
+                for stream_id, frame in list(server.latest_frames.items()):
+                    cv2.imshow(stream_id, frame)
+                if cv2.waitKey(30) & 0xFF == ord('q'):
+                    break
+            else:
+                time.sleep(0.1)
+            if time.monotonic() - last_report >= args.report_every:
+                last_report = time.monotonic()
+                for load in server.status()['workers']:
+                    print(f"[INFO] Worker {load['worker_id']} (pid {load['pid']}): {load['fps']:.1f} fps, "
+                          f"busy {load['busy']:.0%}, restarts {load['restarts']}, streams {load['streams']}")
+    except KeyboardInterrupt:
+        pass
+
+    status = server.status()
+    server.stop()
+    if args.display:
+        cv2.destroyAllWindows()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(status, f, indent=2)
+        print(f"[INFO] Saved status to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
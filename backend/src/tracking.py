@@ -0,0 +1,162 @@
+"""
+Lightweight multi-face tracker used between detection intervals.
+
+Detections are associated to existing tracks by IoU (falling back to centroid
+distance), giving each face a stable track id. On frames where the detector is
+skipped, tracks are carried forward either unchanged ('iou') or by an OpenCV
+single-object tracker per face ('kcf', 'mosse').
+"""
+
+import cv2
+
+
+TRACKER_TYPES = ('iou', 'kcf', 'mosse')
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def _create_cv_tracker(tracker_type):
+    """Create an OpenCV single-object tracker (requires opencv-contrib-python)."""
+    if tracker_type == 'kcf':
+        factory = getattr(cv2, 'TrackerKCF_create', None) or getattr(getattr(cv2, 'legacy', None), 'TrackerKCF_create', None)
+    elif tracker_type == 'mosse':
+        factory = getattr(getattr(cv2, 'legacy', None), 'TrackerMOSSE_create', None)
+    else:
+        raise ValueError(f"Unknown tracker type: {tracker_type}")
+    if factory is None:
+        raise RuntimeError(f"OpenCV tracker '{tracker_type}' is not available, install opencv-contrib-python")
+    return factory()
+
+
+class Track:
+    """A tracked face: stable id, latest box and caller data (e.g. the last emotion)."""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.misses = 0  # consecutive detection rounds without a matching face
+        self.visible = True  # False once the OpenCV tracker loses the face
+        self.cv_tracker = None
+        self.data = {}
+
+
+class FaceTracker:
+    """Assign stable ids to detected faces and carry their boxes across skipped frames."""
+
+    def __init__(self, tracker_type='iou', iou_threshold=0.3, max_misses=2):
+        """
+        Args:
+            tracker_type: 'iou' (boxes held between detections), 'kcf' or 'mosse'
+            iou_threshold: Minimum IoU to associate a detection with a track
+            max_misses: Detection rounds a track may go unmatched before it is dropped
+        """
+        if tracker_type not in TRACKER_TYPES:
+            raise ValueError(f"Unknown tracker type: {tracker_type}")
+        self.tracker_type = tracker_type
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self._next_id = 0
+
+    @staticmethod
+    def _centroid_close(a, b):
+        """True if the centers of two boxes are within half a face width of each other."""
+        ax, ay = a[0] + a[2] / 2, a[1] + a[3] / 2
+        bx, by = b[0] + b[2] / 2, b[1] + b[3] / 2
+        limit = 0.5 * max(a[2], a[3], b[2], b[3])
+        return (ax - bx) ** 2 + (ay - by) ** 2 <= limit ** 2
+
+    def _associate(self, detections):
+        """Greedy matching by IoU, then by centroid distance. Returns {det_index: track}."""
+        candidates = []
+        for di, det in enumerate(detections):
+            for track in self.tracks:
+                iou = box_iou(track.box, det)
+                if iou >= self.iou_threshold:
+                    candidates.append((1.0 + iou, di, track))
+                elif self._centroid_close(track.box, det):
+                    candidates.append((iou, di, track))
+        candidates.sort(key=lambda c: c[0], reverse=True)
+
+        matches = {}
+        used = set()
+        for _, di, track in candidates:
+            if di in matches or track.track_id in used:
+                continue
+            matches[di] = track
+            used.add(track.track_id)
+        return matches
+
+    def _start_cv_tracker(self, track, frame):
+        if self.tracker_type == 'iou':
+            return
+        track.cv_tracker = _create_cv_tracker(self.tracker_type)
+        track.cv_tracker.init(frame, tuple(int(v) for v in track.box))
+
+    def update(self, frame, detections):
+        """
+        Associate the faces detected on `frame` with tracks.
+
+        Args:
+            frame: BGR frame the detections come from
+            detections: iterable of (x, y, w, h) boxes
+
+        Returns:
+            list of Track, one per detection and in the same order
+        """
+        detections = [tuple(int(v) for v in box) for box in detections]
+        matches = self._associate(detections)
+
+        result = []
+        for di, box in enumerate(detections):
+            track = matches.get(di)
+            if track is None:
+                track = Track(self._next_id, box)
+                self._next_id += 1
+                self.tracks.append(track)
+            track.box = box
+            track.misses = 0
+            track.visible = True
+            self._start_cv_tracker(track, frame)
+            result.append(track)
+
+        matched_ids = {t.track_id for t in result}
+        for track in self.tracks:
+            if track.track_id not in matched_ids:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        return result
+
+    def get(self, track_id):
+        """Return the live track with this id, or None."""
+        for track in self.tracks:
+            if track.track_id == track_id:
+                return track
+        return None
+
+    def predict(self, frame):
+        """
+        Carry tracks forward on a frame where detection was skipped.
+
+        Returns:
+            list of visible Track objects with their boxes updated for `frame`
+        """
+        for track in self.tracks:
+            if track.cv_tracker is None or not track.visible:
+                continue
+            ok, box = track.cv_tracker.update(frame)
+            if ok:
+                track.box = tuple(int(v) for v in box)
+            else:
+                track.visible = False
+        return [t for t in self.tracks if t.visible and t.misses == 0]
@@ -1,4 +1,5 @@
 import os
+import time
 import argparse
 from tqdm import tqdm
 import torch
@@ -6,8 +7,8 @@ import torch.nn as nn
 import torch.optim as optim
 from torch.optim import lr_scheduler
 
-from model.model import get_model
-from model.data import get_dataloaders
+from model.model import get_model, make_input_spec, default_stem, ARCHITECTURES, DEFAULT_IMG_SIZE, STEMS
+from model.data import get_dataloaders, DATA_FORMATS, AUGMENT_MODES
 
 
 def save_checkpoint(state, is_best, output_dir, filename='checkpoint.pth'):
@@ -72,21 +73,32 @@ def main():
     parser.add_argument('--epochs', type=int, default=20)
     parser.add_argument('--batch-size', type=int, default=64)
     parser.add_argument('--lr', type=float, default=1e-4)
-    parser.add_argument('--img-size', type=int, default=224)
+    parser.add_argument('--arch', default='resnet18', choices=ARCHITECTURES, help='Model architecture')
+    parser.add_argument('--img-size', type=int, default=None, help='Input resolution (default: per architecture, 224 or 48 for fer_cnn)')
+    parser.add_argument('--channels', type=int, default=3, choices=(1, 3), help='1: train on grayscale input (use with a small --img-size, e.g. 48)')
+    parser.add_argument('--stem', default=None, choices=STEMS, help="First-layer downsampling (default: 'small' for --channels 1 below 112 px, else 'imagenet')")
     parser.add_argument('--output', default=os.path.join(parent_dir, 'checkpoints'), help='Directory to save checkpoints')
     parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--data-format', default='folder', choices=DATA_FORMATS, help='folder: decode image files every epoch; memmap: pack the splits once into uint8 arrays and read from those')
+    parser.add_argument('--augment', default='sample', choices=AUGMENT_MODES, help='sample: per-image PIL transforms in the workers; batch: random crop/flip/resize per batch on --device')
+    parser.add_argument('--cache-dir', default=None, help='Directory of the memmap cache (default: <data-dir>/memmap_cache)')
     parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
     parser.add_argument('--resume', default=None, help='Path to checkpoint to resume training')
     parser.add_argument('--pretrained-weights', default=None, help='Path to weights for fine-tuning (loads weights but not optimizer)')
     args = parser.parse_args()
 
     device = torch.device(args.device)
+    img_size = args.img_size or DEFAULT_IMG_SIZE[args.arch]
+    stem = args.stem or default_stem(img_size, args.channels)
 
     train_loader, val_loader, classes = get_dataloaders(args.data_dir, batch_size=args.batch_size,
-                                                       img_size=args.img_size, num_workers=args.num_workers)
+                                                       img_size=img_size, num_workers=args.num_workers,
+                                                       data_format=args.data_format, cache_dir=args.cache_dir,
+                                                       augment=args.augment, device=device, channels=args.channels)
     num_classes = len(classes)
 
-    model = get_model(num_classes=num_classes, pretrained=True)
+    model = get_model(num_classes=num_classes, pretrained=True, arch=args.arch, in_channels=args.channels, stem=stem)
+    print(f'{args.arch}: {img_size}x{img_size}x{args.channels} input, {stem} stem')
     model = model.to(device)
 
     criterion = nn.CrossEntropyLoss()
@@ -114,7 +126,9 @@ def main():
 
     for epoch in range(start_epoch, args.epochs):
         print(f'Epoch {epoch+1}/{args.epochs}')
+        start = time.perf_counter()
         train_loss, train_acc = train_epoch(model, train_loader, criterion, optimizer, device)
+        epoch_time = time.perf_counter() - start
         val_loss, val_acc = validate(model, val_loader, criterion, device)
         scheduler.step()
 
@@ -122,7 +136,8 @@ def main():
         if is_best:
             best_acc = val_acc
 
-        print(f'Train loss {train_loss:.4f} acc {train_acc:.4f} | Val loss {val_loss:.4f} acc {val_acc:.4f}')
+        print(f'Train loss {train_loss:.4f} acc {train_acc:.4f} | Val loss {val_loss:.4f} acc {val_acc:.4f} | '
+              f'epoch time {epoch_time:.1f}s')
 
         save_checkpoint({
             'epoch': epoch,
@@ -131,6 +146,10 @@ def main():
             'scheduler_state_dict': scheduler.state_dict(),
             'best_acc': best_acc,
             'num_classes': num_classes,
+            'arch': args.arch,
+            'stem': stem,
+            'input_spec': make_input_spec(args.arch, img_size, channels=args.channels),
+            'epoch_time': epoch_time,
         }, is_best, args.output, filename=f'checkpoint_epoch{epoch+1}.pth')
 
     print('Training finished. Best val acc: {:.4f}'.format(best_acc))